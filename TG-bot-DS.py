@@ -1,17 +1,25 @@
 import os
+import asyncio
 import logging
 import threading
-from flask import Flask, request, jsonify
-from telegram import Bot, Update
-from telegram.ext import Application, CommandHandler
-from telegram.constants import ParseMode
+from datetime import datetime
+from flask import Blueprint, Flask, request, jsonify
 from dotenv import load_dotenv  # Добавлено
+import metrics
+import services
+import tracing
+from logging_setup import setup_logging
+from sheets_writer import writer_from_env
 
 # Загрузка переменных окружения из .env
 load_dotenv()
 
-# Настройка приложения Flask
-app = Flask(__name__)
+# python-telegram-bot импортируется лениво: Bot создаётся в services при первой отправке
+bp = Blueprint('notifications', __name__)
+tracer = tracing.configure_tracer('tg-bot')
+
+# Значение telegram.constants.ParseMode.MARKDOWN
+PARSE_MODE_MARKDOWN = 'Markdown'
 
 # Конфигурация
 try:
@@ -26,33 +34,52 @@ except KeyError:
     ADMIN_CHAT_ID = "ВАШ_РЕАЛЬНЫЙ_CHAT_ID"  # ЗАМЕНИТЕ НА РЕАЛЬНЫЙ CHAT ID!
     SECRET_TOKEN = "test-secret-token"
 
-# Инициализация бота
-bot = Bot(token=TELEGRAM_TOKEN)
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org/bot')
+SERVICE_ACCOUNT_FILE = os.getenv('SERVICE_ACCOUNT_JSON')
+
+# Журнал заказов в Google Sheets, создаётся в create_app() при заданном ORDERS_SPREADSHEET_ID
+orders_sheet = None
 
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
 
+def send_admin_message(text):
+    # send_message - корутина, а HTTP-пул бота должен жить в одном цикле событий,
+    # поэтому отправка идёт через общий фоновый цикл из services
+    bot = services.telegram_bot(TELEGRAM_TOKEN, TELEGRAM_API_URL)
+    # Bot API не принимает произвольные заголовки, контекст трассы остаётся на стороне сервиса
+    with tracer.span('telegram.send_message', kind='CLIENT'), \
+            metrics.track_dependency('telegram', 'send_message'):
+        future = asyncio.run_coroutine_threadsafe(
+            bot.send_message(
+                chat_id=ADMIN_CHAT_ID,
+                text=text,
+                parse_mode=PARSE_MODE_MARKDOWN
+            ),
+            services.event_loop()
+        )
+        return future.result(timeout=30)
+
+
 # Обработчики Telegram
-async def handle_order(update: Update, context):
+async def handle_order(update, context):
     await update.message.reply_text(
         "ℹ️ Этот бот только для уведомлений. Заказы оформляются через ApteDoc AI Assistant",
-        parse_mode=ParseMode.MARKDOWN
+        parse_mode=PARSE_MODE_MARKDOWN
     )
 
 
 # Вебхук для уведомлений
-@app.route('/order_webhook', methods=['POST'])
+@bp.route('/order_webhook', methods=['POST'])
 def order_webhook():
     try:
         if request.headers.get('X-Telegram-Secret') != SECRET_TOKEN:
             return jsonify({"status": "error", "message": "Unauthorized"}), 401
 
         order_data = request.json['order']
+        span = tracing.current_span()
+        if span is not None:
+            span.set_attribute('order.number', str(order_data.get('order_number')))
         message = (
             f"🚨 *Новый заказ* #{order_data['order_number']}\n"
             f"📦 **Препарат**: {order_data['medicine']}\n"
@@ -62,11 +89,14 @@ def order_webhook():
             f"💳 **Оплата**: {order_data.get('payment_method', 'Онлайн')}"
         )
 
-        bot.send_message(
-            chat_id=ADMIN_CHAT_ID,
-            text=message,
-            parse_mode=ParseMode.MARKDOWN
-        )
+        send_admin_message(message)
+
+        if orders_sheet is not None:
+            orders_sheet.append([
+                datetime.now().isoformat(timespec='seconds'), order_data['order_number'],
+                order_data['medicine'], order_data['quantity'], order_data['delivery_address'],
+                order_data.get('pharmacy', 'Аптека.ру'), order_data.get('payment_method', 'Онлайн')
+            ])
 
         return jsonify({"status": "success"})
 
@@ -76,12 +106,12 @@ def order_webhook():
 
 
 # Эндпоинты для проверки
-@app.route('/status', methods=['GET'])
+@bp.route('/status', methods=['GET'])
 def status_endpoint():
     return "✅ Сервер работает! Используйте /send_test_notification для проверки уведомлений"
 
 
-@app.route('/send_test_notification', methods=['GET'])
+@bp.route('/send_test_notification', methods=['GET'])
 def send_test_notification():
     try:
         test_data = {
@@ -104,11 +134,7 @@ def send_test_notification():
             f"💳 **Оплата**: {test_data['order'].get('payment_method', 'Онлайн')}"
         )
 
-        bot.send_message(
-            chat_id=ADMIN_CHAT_ID,
-            text=message,
-            parse_mode=ParseMode.MARKDOWN
-        )
+        send_admin_message(message)
 
         return jsonify({
             "status": "success",
@@ -119,7 +145,22 @@ def send_test_notification():
 
 
 # Запуск и конфигурация
+def create_app():
+    """Фабрика Flask-приложения: gunicorn 'TG-bot-DS:create_app()'"""
+    global orders_sheet
+    setup_logging(log_file=None)
+    orders_sheet = writer_from_env('orders', SERVICE_ACCOUNT_FILE, 'Orders!A1')
+
+    app = Flask(__name__)
+    metrics.init_app(app)
+    tracing.init_app(app, tracer)
+    app.register_blueprint(bp)
+    return app
+
+
 def setup_telegram():
+    from telegram.ext import Application, CommandHandler
+
     application = Application.builder().token(TELEGRAM_TOKEN).build()
     application.add_handler(CommandHandler("start", handle_order))
     application.add_handler(CommandHandler("order", handle_order))
@@ -136,7 +177,7 @@ def run_server():
     print("  http://localhost:5000/send_test_notification")
 
     flask_thread = threading.Thread(
-        target=app.run,
+        target=create_app().run,
         kwargs={'host': '0.0.0.0', 'port': 5000, 'debug': True, 'use_reloader': False},
         daemon=True
     )
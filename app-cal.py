@@ -1,100 +1,156 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Blueprint, Flask, request, jsonify
 from flask_cors import CORS
-import requests
+import importlib
 import uuid
 import os
 import logging
-import json
 import re
+import threading
 from datetime import datetime, timedelta
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
 from dotenv import load_dotenv
-
-# Инициализация приложения
-app = Flask(__name__)
-CORS(app, supports_credentials=True)
+from prompt_registry import PromptRegistry
+from booking_queue import BookingQueue, PermanentError, DONE, FAILED
+from booking_pipeline import normalize_text
+from sheets_writer import writer_from_env
+from warmup import warmer_from_env
+import assets
+import booking_pipeline
+import idempotency
+import metrics
+import rate_limit
+import services
+import tracing
+from logging_setup import sensitive_values, setup_logging
+
+# Клиенты Google и HTTP создаются лениво в services при первом обращении
 load_dotenv()
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('app.log'),
-        logging.StreamHandler()
-    ]
-)
-
-# Загрузка промптов
-try:
-    with open('prompts.json', 'r', encoding='utf-8') as f:
-        prompts = json.load(f)
-except Exception as e:
-    logging.critical(f"Ошибка загрузки промптов: {str(e)}")
-    raise
+bp = Blueprint('booking', __name__)
+tracer = tracing.configure_tracer('app-cal')
+
+# Создаются в create_app()
+prompt_registry = None
+booking_queue = None
+symptom_classifier = None
+booking_sheet = None
+warmer = None
 
 # Конфигурация API
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
-DEEPSEEK_API_URL = 'https://api.deepseek.com/v1/chat/completions'
+DEEPSEEK_API_URL = os.getenv('DEEPSEEK_API_URL', 'https://api.deepseek.com/v1/chat/completions')
+# Список моделей: бесплатный запрос для прогрева соединения
+DEEPSEEK_MODELS_URL = os.getenv('DEEPSEEK_MODELS_URL', DEEPSEEK_API_URL.replace('/chat/completions', '/models'))
 CALENDAR_ID = os.getenv("CALENDAR_ID")
+# Переопределение адреса Calendar API (локальные заглушки в bench/)
+CALENDAR_API_ENDPOINT = os.getenv('CALENDAR_API_ENDPOINT')
 SERVICE_ACCOUNT_FILE = 'service-account.json'
 SCOPES = ['https://www.googleapis.com/auth/calendar']
-
-# Валидация настроек
-if not DEEPSEEK_API_KEY:
-    logging.critical("DEEPSEEK_API_KEY не найден в .env")
-    raise ValueError("API ключ DeepSeek отсутствует")
-
-if not os.path.exists(SERVICE_ACCOUNT_FILE):
-    logging.critical("Файл сервисного аккаунта не найден")
-    raise FileNotFoundError("service-account.json отсутствует")
+# Таблица специалистов для локального подбора без DeepSeek, пустое значение - отключить
+SYMPTOM_CLASSIFIER_FILE = os.getenv('SYMPTOM_CLASSIFIER', 'specialists.json')
 
 # Глобальные переменные
 user_sessions = {}
 MAX_SESSIONS = 100
 
+# Фактический расход токенов по шагам (из поля usage ответа API)
+token_usage = {}
+token_usage_lock = threading.Lock()
+
+
+def get_generation_profile(step, prompts=None):
+    """Параметры генерации для шага: default + переопределения шага"""
+    return booking_pipeline.generation_profile(prompts or prompt_registry.get(), step)
 
-def init_conversation():
-    return prompts['medical_assistant']['system'].copy()
 
+def record_token_usage(step, response_json, profile, version):
+    usage = response_json.get('usage') or {}
+    if not usage:
+        return
 
-def query_deepseek(messages):
+    metrics.LLM_TOKENS.inc(usage.get('prompt_tokens', 0), step=step, kind='prompt', prompt_version=version)
+    metrics.LLM_TOKENS.inc(usage.get('completion_tokens', 0), step=step, kind='completion', prompt_version=version)
+    rate_limit.charge_tokens(usage.get('total_tokens', 0))
+
+    with token_usage_lock:
+        stats = token_usage.setdefault(step, {
+            'calls': 0,
+            'prompt_tokens': 0,
+            'completion_tokens': 0,
+            'max_completion_tokens': 0,
+            'truncated': 0
+        })
+        completion_tokens = usage.get('completion_tokens', 0)
+        stats['calls'] += 1
+        stats['prompt_tokens'] += usage.get('prompt_tokens', 0)
+        stats['completion_tokens'] += completion_tokens
+        stats['max_completion_tokens'] = max(stats['max_completion_tokens'], completion_tokens)
+
+        finish_reason = response_json.get('choices', [{}])[0].get('finish_reason')
+        if finish_reason == 'length':
+            stats['truncated'] += 1
+            logging.warning(
+                f"Ответ обрезан по max_tokens={profile.get('max_tokens')} на шаге {step}"
+            )
+
+    logging.info(
+        f"Токены [{step}]: prompt={usage.get('prompt_tokens', 0)}, "
+        f"completion={completion_tokens}, max_tokens={profile.get('max_tokens')}, "
+        f"prompts={version}"
+    )
+
+
+def query_deepseek(messages, step='default', prompts=None):
+    """prompts - снимок, из которого собран messages: профиль и версия берутся из него же"""
+    if prompts is None:
+        prompts = prompt_registry.get()
     try:
         headers = {
             'Authorization': f'Bearer {DEEPSEEK_API_KEY}',
             'Content-Type': 'application/json'
         }
 
-        payload = {
-            'model': 'deepseek-chat',
-            'messages': messages,
-            'temperature': 0.3,
-            'max_tokens': 500
-        }
-
-        response = requests.post(
-            DEEPSEEK_API_URL,
-            headers=headers,
-            json=payload,
-            timeout=30
-        )
-        response.raise_for_status()
-        return response.json()
+        profile = get_generation_profile(step, prompts)
+        payload = booking_pipeline.completion_payload(messages, profile)
+
+        with tracer.span('deepseek.chat.completions', kind='CLIENT', attributes={
+            'llm.step': step,
+            'llm.prompt_version': prompts.version,
+            'llm.model': payload['model'],
+            'llm.max_tokens': profile.get('max_tokens', 0)
+        }) as span:
+            with metrics.track_dependency('deepseek', 'total'):
+                response = services.http_session().post(
+                    DEEPSEEK_API_URL,
+                    headers=tracing.inject(headers),
+                    json=payload,
+                    timeout=30
+                )
+            # elapsed у requests - время до получения заголовков ответа
+            metrics.observe_dependency('deepseek', 'ttfb', response.elapsed.total_seconds())
+            if warmer is not None:
+                warmer.touch('deepseek')
+            span.set_attribute('http.status_code', response.status_code)
+            response.raise_for_status()
+            response_json = response.json()
+            usage = response_json.get('usage') or {}
+            span.set_attribute('llm.usage.prompt_tokens', usage.get('prompt_tokens', 0))
+            span.set_attribute('llm.usage.completion_tokens', usage.get('completion_tokens', 0))
+
+        record_token_usage(step, response_json, profile, prompts.version)
+        return response_json
 
     except Exception as e:
         logging.error(f"Ошибка DeepSeek API: {str(e)}")
         return {'error': prompts['errors']['api_error']}
 
 
-def create_calendar_event(appointment_details):
+def create_calendar_event(appointment_details, idempotency_key=None):
+    """Повторный вызов с тем же ключом не создаёт второе событие; без ключа id события случайный"""
+    if idempotency_key is None:
+        idempotency_key = idempotency.new_event_id()
     try:
-        creds = service_account.Credentials.from_service_account_file(
-            SERVICE_ACCOUNT_FILE,
-            scopes=SCOPES
-        )
-
-        service = build('calendar', 'v3', credentials=creds)
+        with metrics.track_dependency('calendar', 'build'):
+            service = services.calendar_service(SERVICE_ACCOUNT_FILE, SCOPES, CALENDAR_API_ENDPOINT)
 
         start_time = datetime.strptime(
             f"{appointment_details['date']} {appointment_details['time']}",
@@ -115,58 +171,119 @@ def create_calendar_event(appointment_details):
             },
         }
 
-        created_event = service.events().insert(
-            calendarId=CALENDAR_ID,
-            body=event
-        ).execute()
+        with tracer.span('calendar.events.insert', kind='CLIENT', attributes={
+            'calendar.doctor': appointment_details['doctor']
+        }):
+            created_event = idempotency.insert_event(
+                service, CALENDAR_ID, event, idempotency_key, headers=tracing.inject()
+            )
+        if warmer is not None:
+            warmer.touch('calendar')
 
         return {'status': 'success', 'event_id': created_event['id']}
 
     except Exception as e:
         logging.error(f"Ошибка Google Calendar: {str(e)}")
-        return {'status': 'error', 'message': str(e)}
-
+        return {'status': 'error', 'message': str(e), 'retryable': idempotency.is_transient_error(e)}
+
+
+def warm_deepseek():
+    """Соединение с DeepSeek в пуле http_session к моменту ввода симптомов, без расхода токенов"""
+    services.http_session().get(
+        DEEPSEEK_MODELS_URL, headers={'Authorization': f'Bearer {DEEPSEEK_API_KEY}'}, timeout=10
+    )
+
+
+def warm_calendar():
+    """Импорт клиента Google API и токен сервисного аккаунта до первой записи в календарь"""
+    from google.auth.transport.requests import Request
+
+    # Модуль только загружается: первая запись не платит за его импорт
+    importlib.import_module('googleapiclient.discovery')
+    credentials = services.service_account_credentials(SERVICE_ACCOUNT_FILE, SCOPES)
+    if not credentials.valid:
+        credentials.refresh(Request(services.http_session()))
+
+
+def run_booking_job(job):
+    """Задача фоновой очереди: вставка события. Сетевые ошибки и 5xx повторяются с задержкой,
+    неверная дата от LLM или 4xx от Google - сразу failed
+    """
+    info = job['patient_info']
+    with tracer.span('booking.calendar_job', parent=tracing.extract(job)), \
+            sensitive_values(info['name'], *info['symptoms']):
+        result = create_calendar_event(info, job.get('idempotency_key'))
+    if result['status'] != 'success':
+        raise (RuntimeError if result['retryable'] else PermanentError)(result['message'])
+
+    if booking_sheet is not None:
+        booking_sheet.append([
+            datetime.now().isoformat(timespec='seconds'), job.get('idempotency_key'),
+            info['name'], info['doctor'], info['date'], info['time'],
+            ', '.join(info['symptoms']), result['event_id']
+        ])
+    return result
+
+
+def local_proposal(prompts, patient_info):
+    """Предложение записи без LLM, если классификатор уверен в специалисте"""
+    if symptom_classifier is None:
+        return None
+    with tracer.span('booking.classify_symptoms') as span:
+        proposal = booking_pipeline.local_proposal(
+            symptom_classifier, prompts, patient_info['name'], patient_info['symptoms']
+        )
+        span.set_attribute('classifier.matched', proposal is not None)
+    if proposal is None:
+        return None
 
-def normalize_text(text):
-    replacements = {
-        'нз': 'низ', 'врaч': 'врач', 'чеез': 'через',
-        'завтрак': 'завтра', 'симпотомы': 'симптомы'
-    }
-    for wrong, correct in replacements.items():
-        text = text.replace(wrong, correct)
-    return text.lower()
+    text, doctor, confidence = proposal
+    logging.info(f"Специалист подобран локально: {doctor} ({confidence:.2f})")
+    return text
 
 
 def extract_appointment_details(response):
-    try:
-        normalized = normalize_text(response)
+    with tracer.span('booking.extract_details'):
+        return booking_pipeline.extract_appointment_details(response)
 
-        patterns = {
-            'doctor': r'к\s+([а-яё\s]+?)\s+на',
-            'date': r'(\d{1,2}\.\d{1,2}\.\d{4})',
-            'time': r'в\s+(\d{1,2}-\d{2})'
-        }
 
-        details = {}
-        for key, pattern in patterns.items():
-            match = re.search(pattern, normalized)
-            if not match:
-                raise ValueError(f"Не найден {key}")
-            details[key] = match.group(1).strip()
+@bp.route('/')
+def index():
+    return assets.page('index.html')
 
-        return details
-    except Exception as e:
-        logging.error(f"Ошибка извлечения: {str(e)}")
-        return None
 
+@bp.route('/usage')
+def usage():
+    with token_usage_lock:
+        return jsonify({'prompt_version': prompt_registry.version, 'steps': token_usage})
 
-@app.route('/')
-def index():
-    return render_template('index.html')
 
+@bp.route('/booking/<booking_id>')
+def booking_status(booking_id):
+    prompts = prompt_registry.get()
+    job = booking_queue.get(booking_id)
+    if job is None:
+        return jsonify({'error': prompts['errors']['booking_not_found']}), 404
 
-@app.route('/chat', methods=['POST'])
+    body = {'booking_id': job['id'], 'status': job['status'], 'attempts': job['attempts']}
+    if job['status'] == DONE:
+        body['event_id'] = job['result']['event_id']
+        body['reply'] = prompts['medical_assistant']['confirmation']
+        # Запись оформлена - сессия пациента больше не нужна
+        session_id = request.cookies.get('session_id')
+        if session_id and user_sessions.get(session_id, {}).get('booking_id') == booking_id:
+            with metrics.track_dependency('session_store', 'delete'):
+                user_sessions.pop(session_id, None)
+    elif job['status'] == FAILED:
+        body['reply'] = prompts['errors']['calendar_error']
+    else:
+        body['reply'] = prompts['medical_assistant']['booking_pending']
+    return jsonify(body)
+
+
+@bp.route('/chat', methods=['POST'])
 def chat():
+    prompts = prompt_registry.get()
     try:
         if not request.is_json:
             return jsonify({'error': prompts['errors']['invalid_format']}), 400
@@ -180,14 +297,17 @@ def chat():
             return jsonify({'error': prompts['errors']['long_message']}), 400
 
         if len(user_sessions) > MAX_SESSIONS:
-            user_sessions.clear()
+            with metrics.track_dependency('session_store', 'clear'):
+                user_sessions.clear()
             logging.warning("Очистка сессий")
 
         session_id = request.cookies.get('session_id')
-        if not session_id or session_id not in user_sessions:
+        with metrics.track_dependency('session_store', 'get'):
+            session_data = user_sessions.get(session_id) if session_id else None
+        if session_data is None:
             session_id = str(uuid.uuid4())
-            user_sessions[session_id] = {
-                'history': init_conversation(),
+            session_data = {
+                'history': [],
                 'step': 'get_name',
                 'patient_info': {
                     'name': None,
@@ -197,97 +317,138 @@ def chat():
                     'time': None
                 }
             }
+            with metrics.track_dependency('session_store', 'set'):
+                user_sessions[session_id] = session_data
+            # Пока пациент вводит имя и симптомы, соединения с DeepSeek и Google прогреваются в фоне
+            if warmer is not None:
+                warmer.trigger()
+
+        current_step = session_data['step']
+        patient_info = session_data['patient_info']
+        # Время шага пишется и при раннем выходе (ошибка DeepSeek, неверное имя);
+        # имя и симптомы пациента не попадают в лог ни в каком виде
+        with metrics.STEP_DURATION.time(step=current_step), \
+                sensitive_values(user_message, patient_info['name'], *patient_info['symptoms']), \
+                tracer.span(f'booking.{current_step}', attributes={
+                    'session.id': session_id,
+                    'booking.step': current_step
+                }) as step_span:
+            if session_data['step'] == 'get_name':
+                if len(user_message.split()) < 2:
+                    return jsonify({'reply': prompts['medical_assistant']['name_validation'], 'step': 'get_name'})
+
+                session_data['patient_info']['name'] = user_message
+                session_data['step'] = 'get_symptoms'
+                reply = prompts['medical_assistant']['ask_symptoms']
+
+            elif session_data['step'] == 'get_symptoms':
+                session_data['patient_info']['symptoms'].append(user_message)
+
+                # Очевидные случаи решаются локально, остальные уходят в DeepSeek
+                assistant_response = local_proposal(prompts, session_data['patient_info'])
+                if assistant_response is not None:
+                    metrics.SYMPTOM_TRIAGE.inc(source='local')
+                else:
+                    metrics.SYMPTOM_TRIAGE.inc(source='llm')
+                    prompt = prompts.build_prompt(session_data['history'], 'diagnosis_guide')
+
+                    api_response = query_deepseek(prompt, 'get_symptoms', prompts)
+                    if 'error' in api_response:
+                        return jsonify(api_response), 500
+
+                    assistant_response = booking_pipeline.reply_text(api_response)
+
+                if booking_pipeline.is_proposal(assistant_response):
+                    details = extract_appointment_details(assistant_response)
+                    if details:
+                        session_data['patient_info'].update(details)
+                        session_data['step'] = 'confirm_appointment'
+                    else:
+                        assistant_response = prompts['errors']['parse_error']
+                else:
+                    session_data['step'] = 'clarify_symptoms'
 
-        session_data = user_sessions[session_id]
-
-        if session_data['step'] == 'get_name':
-            if len(user_message.split()) < 2:
-                return jsonify({'reply': prompts['medical_assistant']['name_validation'], 'step': 'get_name'})
+                session_data['history'].append({'role': 'assistant', 'content': assistant_response})
+                reply = assistant_response
 
-            session_data['patient_info']['name'] = user_message
-            session_data['step'] = 'get_symptoms'
-            reply = prompts['medical_assistant']['ask_symptoms']
+            elif session_data['step'] == 'clarify_symptoms':
+                session_data['patient_info']['symptoms'].append(user_message)
+                prompt = prompts.build_prompt(session_data['history'], 'clarification_guide')
 
-        elif session_data['step'] == 'get_symptoms':
-            session_data['patient_info']['symptoms'].append(user_message)
-            prompt = [
-                *session_data['history'],
-                {"role": "system", "content": prompts['medical_assistant']['diagnosis_guide']}
-            ]
+                api_response = query_deepseek(prompt, 'clarify_symptoms', prompts)
+                if 'error' in api_response:
+                    return jsonify(api_response), 500
 
-            api_response = query_deepseek(prompt)
-            if 'error' in api_response:
-                return jsonify(api_response), 500
+                assistant_response = booking_pipeline.reply_text(api_response)
 
-            assistant_response = api_response.get('choices', [{}])[0].get('message', {}).get('content', '')
+                if booking_pipeline.is_proposal(assistant_response):
+                    details = extract_appointment_details(assistant_response)
+                    if details:
+                        session_data['patient_info'].update(details)
+                        session_data['step'] = 'confirm_appointment'
+                else:
+                    session_data['step'] = 'clarify_symptoms'
+
+                session_data['history'].append({'role': 'assistant', 'content': assistant_response})
+                reply = assistant_response
+
+            elif session_data['step'] == 'confirm_appointment':
+                if 'да' in user_message.lower():
+                    # Повторное "да" или ретрай клиента дают тот же ключ, заявка и событие не дублируются.
+                    # Ключ из сессии: одинаковые слоты разных пациентов не склеиваются
+                    key = idempotency.header_key(request) or idempotency.make_key(
+                        session_id, patient_info['doctor'], patient_info['date'], patient_info['time']
+                    )
+                    # Запись в календарь идёт в фоне, статус - GET /booking/<booking_id>
+                    session_data['booking_id'] = booking_queue.submit({
+                        'patient_info': patient_info,
+                        'idempotency_key': key,
+                        **tracing.inject()
+                    }, booking_id=key)
+                    # Сессия остаётся до подтверждения записи: при ошибке пациент может повторить
+                    session_data['step'] = 'booking_submitted'
+                    reply = prompts['medical_assistant']['booking_pending']
+                else:
+                    session_data['step'] = 'reschedule'
+                    reply = prompts['medical_assistant']['reschedule']
 
-            if 'предлагаем' in assistant_response.lower():
-                details = extract_appointment_details(assistant_response)
-                if details:
-                    session_data['patient_info'].update(details)
+            elif session_data['step'] == 'booking_submitted':
+                job = booking_queue.get(session_data['booking_id'])
+                if job is not None and job['status'] == FAILED:
+                    # Как до фоновой очереди: ошибка записи, "да" - повтор, иначе - другое время
                     session_data['step'] = 'confirm_appointment'
+                    reply = prompts['errors']['calendar_error']
+                elif job is None or job['status'] == DONE:
+                    reply = prompts['medical_assistant']['confirmation'] if job else \
+                        prompts['errors']['booking_not_found']
+                    with metrics.track_dependency('session_store', 'delete'):
+                        user_sessions.pop(session_id, None)
                 else:
-                    assistant_response = prompts['errors']['parse_error']
-            else:
-                session_data['step'] = 'clarify_symptoms'
-
-            session_data['history'].append({'role': 'assistant', 'content': assistant_response})
-            reply = assistant_response
-
-        elif session_data['step'] == 'clarify_symptoms':
-            session_data['patient_info']['symptoms'].append(user_message)
-            prompt = [
-                *session_data['history'],
-                {"role": "system", "content": prompts['medical_assistant']['clarification_guide']}
-            ]
-
-            api_response = query_deepseek(prompt)
-            if 'error' in api_response:
-                return jsonify(api_response), 500
-
-            assistant_response = api_response.get('choices', [{}])[0].get('message', {}).get('content', '')
-
-            if 'предлагаем' in assistant_response.lower():
-                details = extract_appointment_details(assistant_response)
-                if details:
-                    session_data['patient_info'].update(details)
-                    session_data['step'] = 'confirm_appointment'
-            else:
-                session_data['step'] = 'clarify_symptoms'
-
-            session_data['history'].append({'role': 'assistant', 'content': assistant_response})
-            reply = assistant_response
-
-        elif session_data['step'] == 'confirm_appointment':
-            if 'да' in user_message.lower():
-                calendar_response = create_calendar_event(session_data['patient_info'])
-                if calendar_response['status'] == 'success':
-                    reply = prompts['medical_assistant']['confirmation']
-                    del user_sessions[session_id]
+                    reply = prompts['medical_assistant']['booking_pending']
+
+            elif session_data['step'] == 'reschedule':
+                if re.match(r'\d{2}\.\d{2}\.\d{4}\s+\d{2}-\d{2}', user_message):
+                    try:
+                        date, time = user_message.split()
+                        session_data['patient_info']['date'] = date
+                        session_data['patient_info']['time'] = time
+                        reply = f"{prompts['medical_assistant']['reschedule_confirm']} {date} {time}"
+                        session_data['step'] = 'confirm_appointment'
+                    except:
+                        reply = prompts['errors']['invalid_time_format']
                 else:
-                    reply = prompts['errors']['calendar_error']
-            else:
-                session_data['step'] = 'reschedule'
-                reply = prompts['medical_assistant']['reschedule']
-
-        elif session_data['step'] == 'reschedule':
-            if re.match(r'\d{2}\.\d{2}\.\d{4}\s+\d{2}-\d{2}', user_message):
-                try:
-                    date, time = user_message.split()
-                    session_data['patient_info']['date'] = date
-                    session_data['patient_info']['time'] = time
-                    reply = f"{prompts['medical_assistant']['reschedule_confirm']} {date} {time}"
-                    session_data['step'] = 'confirm_appointment'
-                except:
                     reply = prompts['errors']['invalid_time_format']
-            else:
-                reply = prompts['errors']['invalid_time_format']
 
-        response = jsonify({
+            step_span.set_attribute('booking.next_step', session_data['step'])
+
+        body = {
             'reply': reply,
             'step': session_data['step'],
             'patient_name': session_data['patient_info']['name']
-        })
+        }
+        if session_data.get('booking_id'):
+            body['booking_id'] = session_data['booking_id']
+        response = jsonify(body)
 
         if not request.cookies.get('session_id'):
             response.set_cookie('session_id', session_id, max_age=300)
@@ -299,8 +460,65 @@ def chat():
         return jsonify({'error': prompts['errors']['server_error']}), 500
 
 
+def create_app():
+    """Фабрика приложения: gunicorn 'app-cal:create_app()' или python app-cal.py"""
+    global prompt_registry, booking_queue, symptom_classifier, booking_sheet, warmer
+
+    # Настройка логирования: запись в файл и консоль вынесена из обработчиков запросов
+    setup_logging('app.log')
+
+    # Валидация настроек
+    if not DEEPSEEK_API_KEY:
+        logging.critical("DEEPSEEK_API_KEY не найден в .env")
+        raise ValueError("API ключ DeepSeek отсутствует")
+
+    if not os.path.exists(SERVICE_ACCOUNT_FILE):
+        logging.critical("Файл сервисного аккаунта не найден")
+        raise FileNotFoundError("service-account.json отсутствует")
+
+    # Загрузка промптов
+    try:
+        prompt_registry = PromptRegistry('prompts.json')
+    except Exception as e:
+        logging.critical(f"Ошибка загрузки промптов: {str(e)}")
+        raise
+
+    if SYMPTOM_CLASSIFIER_FILE and os.path.exists(SYMPTOM_CLASSIFIER_FILE):
+        # NumPy импортируется только здесь: импорт модуля приложения остаётся лёгким
+        from symptom_classifier import SymptomClassifier
+
+        symptom_classifier = SymptomClassifier.from_file(SYMPTOM_CLASSIFIER_FILE, normalizer=normalize_text)
+    elif SYMPTOM_CLASSIFIER_FILE:
+        logging.warning(f"{SYMPTOM_CLASSIFIER_FILE} не найден, подбор специалиста только через DeepSeek")
+
+    # Журнал записей в Google Sheets, если задан BOOKINGS_SPREADSHEET_ID
+    booking_sheet = writer_from_env('bookings', SERVICE_ACCOUNT_FILE, 'Bookings!A1')
+
+    warmer = warmer_from_env({'deepseek': warm_deepseek, 'calendar': warm_calendar})
+
+    # Один воркер: сессии диалога есть только в памяти процесса
+    services.process_local_state('сессии диалога user_sessions')
+    if not os.getenv('BOOKING_DB'):
+        services.process_local_state('заявки на запись (задайте BOOKING_DB)')
+    booking_queue = BookingQueue(
+        run_booking_job,
+        workers=int(os.getenv('BOOKING_WORKERS', 2)),
+        max_attempts=int(os.getenv('BOOKING_MAX_ATTEMPTS', 5)),
+        db_path=os.getenv('BOOKING_DB')
+    )
+
+    app = Flask(__name__)
+    CORS(app, supports_credentials=True)
+    metrics.init_app(app)
+    tracing.init_app(app, tracer)
+    app.register_blueprint(bp)
+    assets.init_app(app, pages=('index.html',))
+    rate_limit.init_app(app, rate_limit.limiter_from_env(), endpoints=('booking.chat',))
+    return app
+
+
 if __name__ == '__main__':
-    app.run(
+    create_app().run(
         host='127.0.0.1',
         port=5000,
         debug=os.getenv('FLASK_DEBUG', 'false').lower() == 'true'
@@ -1,42 +1,40 @@
 import os
+import time
 from datetime import datetime, timezone, timedelta
 
-from flask import Flask, render_template, request, jsonify
+from flask import Blueprint, Flask, request, jsonify
 from dotenv import load_dotenv
 
-# Импорт для работы с DeepSeek API (обёртка в виде OpenAI)
-from openai import OpenAI
+import assets
+import idempotency
+import metrics
+import rate_limit
 
-# Импорты для Google Calendar API
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
+# Клиенты DeepSeek (обёртка OpenAI) и Google Calendar создаются лениво
+import services
 
 # Загрузка переменных окружения
 load_dotenv()
 
-app = Flask(__name__)
+bp = Blueprint('chat', __name__)
 
-# Настройка клиента для работы с DeepSeek API
+# Настройки DeepSeek API
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
-client = OpenAI(api_key=DEEPSEEK_API_KEY, base_url="https://api.deepseek.com")
+DEEPSEEK_BASE_URL = "https://api.deepseek.com"
 
 # Глобальная история сообщений для диалога (для демонстрации; для продакшена стоит привязать к сессии пользователя)
 messages = [{"role": "system", "content": "You are a helpful assistant."}]
 
-def create_calendar_event(summary, start_datetime, end_datetime):
+def create_calendar_event(summary, start_datetime, end_datetime, idempotency_key=None, deterministic=True):
     """
     Создает событие в Google Календаре по заданным параметрам.
+    Повторный вызов с тем же ключом не создаёт дубликат; без ключа id события случайный.
     """
     try:
         sa_path = os.getenv('SERVICE_ACCOUNT_JSON')
         calendar_id = os.getenv('CALENDAR_ID')
 
-        credentials = service_account.Credentials.from_service_account_file(
-            sa_path,
-            scopes=['https://www.googleapis.com/auth/calendar']
-        )
-
-        service = build('calendar', 'v3', credentials=credentials)
+        service = services.calendar_service(sa_path, ['https://www.googleapis.com/auth/calendar'])
 
         event = {
             'summary': summary,
@@ -44,10 +42,8 @@ def create_calendar_event(summary, start_datetime, end_datetime):
             'end': {'dateTime': end_datetime.isoformat(), 'timeZone': 'UTC'},
         }
 
-        service.events().insert(
-            calendarId=calendar_id,
-            body=event
-        ).execute()
+        key = idempotency_key or idempotency.new_event_id()
+        idempotency.insert_event(service, calendar_id, event, key, deterministic=deterministic)
 
         print("✅ Событие успешно создано!")
         return True
@@ -56,15 +52,15 @@ def create_calendar_event(summary, start_datetime, end_datetime):
         print(f"❌ Ошибка: {str(e)}")
         return False
 
-@app.route('/')
+@bp.route('/')
 def index():
     """
     Главная страница, которая рендерит веб-интерфейс для чата.
     В шаблоне (templates/index.html) можно разместить форму для отправки сообщений.
     """
-    return render_template('index.html')
+    return assets.page('index.html')
 
-@app.route('/chat', methods=['POST'])
+@bp.route('/chat', methods=['POST'])
 def chat():
     """
     Эндпоинт для общения с DeepSeek Chat API.
@@ -77,23 +73,34 @@ def chat():
 
     messages.append({"role": "user", "content": user_input})
     try:
+        client = services.openai_client(DEEPSEEK_API_KEY, DEEPSEEK_BASE_URL)
+        llm_start = time.perf_counter()
         stream = client.chat.completions.create(
             model="deepseek-chat",
             messages=messages,
-            stream=True
+            stream=True,
+            stream_options={'include_usage': True}
         )
         full_response = []
         # Проходим по потоковым чанкам и собираем ответ
         for chunk in stream:
+            if chunk.usage:
+                rate_limit.charge_tokens(chunk.usage.total_tokens)
+            # Чанк с usage приходит последним и может быть без choices
+            if not chunk.choices:
+                continue
+            if not full_response:
+                metrics.observe_dependency('deepseek', 'ttfb', time.perf_counter() - llm_start)
             content = chunk.choices[0].delta.content or ""
             full_response.append(content)
+        metrics.observe_dependency('deepseek', 'total', time.perf_counter() - llm_start)
         assistant_response = "".join(full_response)
         messages.append({"role": "assistant", "content": assistant_response})
         return jsonify({"response": assistant_response})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/create_event', methods=['POST'])
+@bp.route('/create_event', methods=['POST'])
 def create_event():
     """
     Эндпоинт для создания события в Google Календаре.
@@ -116,10 +123,20 @@ def create_event():
     except Exception as e:
         return jsonify({"error": "Неверный формат даты. Используйте ISO-формат."}), 400
 
-    if create_calendar_event(summary, start_dt, end_dt):
+    key, deterministic = idempotency.request_key(request, summary, start_dt.isoformat(), end_dt.isoformat())
+    if create_calendar_event(summary, start_dt, end_dt, key, deterministic):
         return jsonify({"message": "Событие успешно создано!"})
     else:
         return jsonify({"error": "Ошибка при создании события."}), 500
 
+def create_app():
+    app = Flask(__name__)
+    metrics.init_app(app)
+    app.register_blueprint(bp)
+    assets.init_app(app, pages=('index.html',))
+    rate_limit.init_app(app, rate_limit.limiter_from_env())
+    return app
+
+
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    create_app().run(debug=True)
\ No newline at end of file
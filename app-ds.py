@@ -1,31 +1,36 @@
-from flask import Flask, render_template, request, jsonify, Response
-from openai import OpenAI
+from flask import Blueprint, Flask, request, jsonify, Response, stream_with_context
 import os
 from dotenv import load_dotenv
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
 from datetime import datetime, timezone, timedelta
 import json
+import time
+import assets
+import idempotency
+import metrics
+import rate_limit
+import services
 
 load_dotenv()
 
-app = Flask(__name__)
+bp = Blueprint('chat', __name__)
 
-# DeepSeek API клиент
+# DeepSeek API клиент (OpenAI SDK создаётся при первом запросе)
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
-client = OpenAI(api_key=DEEPSEEK_API_KEY, base_url="https://api.deepseek.com")
+DEEPSEEK_BASE_URL = os.getenv('DEEPSEEK_BASE_URL', "https://api.deepseek.com")
 
 # Google Calendar API настройки
 SERVICE_ACCOUNT_FILE = os.getenv('SERVICE_ACCOUNT_JSON')
 CALENDAR_ID = os.getenv('CALENDAR_ID')
+CALENDAR_API_ENDPOINT = os.getenv('CALENDAR_API_ENDPOINT')
+SCOPES = ['https://www.googleapis.com/auth/calendar']
 
 
-@app.route('/')
+@bp.route('/')
 def home():
-    return render_template('index.html')
+    return assets.page('index.html')
 
 
-@app.route('/chat', methods=['POST'])
+@bp.route('/chat', methods=['POST'])
 def chat():
     data = request.get_json()
     user_message = data['message']
@@ -33,34 +38,42 @@ def chat():
 
     messages.append({"role": "user", "content": user_message})
 
+    client = services.openai_client(DEEPSEEK_API_KEY, DEEPSEEK_BASE_URL)
+    llm_start = time.perf_counter()
     stream = client.chat.completions.create(
         model="deepseek-chat",
         messages=messages,
-        stream=True
+        stream=True,
+        stream_options={'include_usage': True}
     )
 
     def generate():
         full_response = []
         for chunk in stream:
+            if chunk.usage:
+                rate_limit.charge_tokens(chunk.usage.total_tokens)
+            # Чанк с usage приходит последним и может быть без choices
+            if not chunk.choices:
+                continue
+            if not full_response:
+                metrics.observe_dependency('deepseek', 'ttfb', time.perf_counter() - llm_start)
             content = chunk.choices[0].delta.content or ""
             full_response.append(content)
             yield f"data: {json.dumps({'content': content})}\n\n"
+        metrics.observe_dependency('deepseek', 'total', time.perf_counter() - llm_start)
 
         messages.append({"role": "assistant", "content": "".join(full_response)})
         yield f"data: {json.dumps({'done': True, 'messages': messages})}\n\n"
 
-    return Response(generate(), mimetype='text/event-stream')
+    # Контекст запроса нужен генератору для списания токенов клиента
+    return Response(stream_with_context(generate()), mimetype='text/event-stream')
 
 
-@app.route('/create_event', methods=['POST'])
+@bp.route('/create_event', methods=['POST'])
 def create_event():
     data = request.get_json()
     try:
-        credentials = service_account.Credentials.from_service_account_file(
-            SERVICE_ACCOUNT_FILE,
-            scopes=['https://www.googleapis.com/auth/calendar']
-        )
-        service = build('calendar', 'v3', credentials=credentials)
+        service = services.calendar_service(SERVICE_ACCOUNT_FILE, SCOPES, CALENDAR_API_ENDPOINT)
 
         event = {
             'summary': data['summary'],
@@ -74,10 +87,11 @@ def create_event():
             },
         }
 
-        service.events().insert(
-            calendarId=CALENDAR_ID,
-            body=event
-        ).execute()
+        # Повтор запроса (двойной клик, ретрай после таймаута) не создаёт дубликат
+        key, deterministic = idempotency.request_key(
+            request, data['summary'], data['start_datetime'], data['end_datetime']
+        )
+        idempotency.insert_event(service, CALENDAR_ID, event, key, deterministic=deterministic)
 
         return jsonify({'status': 'success', 'message': 'Событие создано!'})
 
@@ -85,5 +99,14 @@ def create_event():
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 
+def create_app():
+    app = Flask(__name__)
+    metrics.init_app(app)
+    app.register_blueprint(bp)
+    assets.init_app(app, pages=('index.html',))
+    rate_limit.init_app(app, rate_limit.limiter_from_env())
+    return app
+
+
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    create_app().run(debug=True)
\ No newline at end of file
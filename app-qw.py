@@ -1,18 +1,21 @@
-from flask import Flask, render_template, request, jsonify
-from openai import OpenAI
+from flask import Blueprint, Flask, request, jsonify
 import os
 from dotenv import load_dotenv
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
 from datetime import datetime, timezone, timedelta
+import time
+import assets
+import idempotency
+import metrics
+import rate_limit
+import services
 
 load_dotenv()
 
-app = Flask(__name__)
+bp = Blueprint('chat', __name__)
 
-# Инициализация DeepSeek
+# Настройки DeepSeek (клиент создаётся при первом запросе)
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
-client = OpenAI(api_key=DEEPSEEK_API_KEY, base_url="https://api.deepseek.com")
+DEEPSEEK_BASE_URL = "https://api.deepseek.com"
 messages = [{"role": "system", "content": "You are a helpful assistant."}]
 
 # Инициализация Google Calendar
@@ -20,12 +23,12 @@ SERVICE_ACCOUNT_JSON = os.getenv('SERVICE_ACCOUNT_JSON')
 CALENDAR_ID = os.getenv('CALENDAR_ID')
 
 
-@app.route('/')
+@bp.route('/')
 def core():
-    return render_template('core.html')
+    return assets.page('core.html')
 
 
-@app.route('/chat', methods=['POST'])
+@bp.route('/chat', methods=['POST'])
 def chat():
     user_input = request.json.get('message')
 
@@ -34,16 +37,27 @@ def chat():
 
     try:
         # Получаем ответ от DeepSeek
+        client = services.openai_client(DEEPSEEK_API_KEY, DEEPSEEK_BASE_URL)
+        llm_start = time.perf_counter()
         stream = client.chat.completions.create(
             model="deepseek-chat",
             messages=messages,
-            stream=True
+            stream=True,
+            stream_options={'include_usage': True}
         )
 
         full_response = []
         for chunk in stream:
+            if chunk.usage:
+                rate_limit.charge_tokens(chunk.usage.total_tokens)
+            # Чанк с usage приходит последним и может быть без choices
+            if not chunk.choices:
+                continue
+            if not full_response:
+                metrics.observe_dependency('deepseek', 'ttfb', time.perf_counter() - llm_start)
             content = chunk.choices[0].delta.content or ""
             full_response.append(content)
+        metrics.observe_dependency('deepseek', 'total', time.perf_counter() - llm_start)
 
         assistant_response = "".join(full_response)
         messages.append({"role": "assistant", "content": assistant_response})
@@ -54,7 +68,7 @@ def chat():
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/create_event', methods=['POST'])
+@bp.route('/create_event', methods=['POST'])
 def create_event():
     data = request.json
     summary = data.get('summary')
@@ -67,12 +81,7 @@ def create_event():
         end = datetime.fromisoformat(end_str).replace(tzinfo=timezone.utc)
 
         # Создаем событие
-        credentials = service_account.Credentials.from_service_account_file(
-            SERVICE_ACCOUNT_JSON,
-            scopes=['https://www.googleapis.com/auth/calendar']
-        )
-
-        service = build('calendar', 'v3', credentials=credentials)
+        service = services.calendar_service(SERVICE_ACCOUNT_JSON, ['https://www.googleapis.com/auth/calendar'])
 
         event = {
             'summary': summary,
@@ -80,12 +89,22 @@ def create_event():
             'end': {'dateTime': end.isoformat(), 'timeZone': 'UTC'},
         }
 
-        service.events().insert(calendarId=CALENDAR_ID, body=event).execute()
+        key, deterministic = idempotency.request_key(request, summary, start.isoformat(), end.isoformat())
+        idempotency.insert_event(service, CALENDAR_ID, event, key, deterministic=deterministic)
         return jsonify({"success": True})
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+def create_app():
+    app = Flask(__name__)
+    metrics.init_app(app)
+    app.register_blueprint(bp)
+    assets.init_app(app, pages=('core.html',))
+    rate_limit.init_app(app, rate_limit.limiter_from_env())
+    return app
+
+
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    create_app().run(debug=True)
\ No newline at end of file
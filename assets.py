@@ -0,0 +1,162 @@
+"""Отдача страницы чата и статики: предрендер, адреса с хешем, сжатие.
+
+init_app() при старте рендерит шаблоны без динамики в готовые ответы,
+считает хеш содержимого файлов static/ и заранее сжимает их gzip и brotli
+(если установлен пакет Brotli). url_for('static', ...) выдаёт адрес с хешем
+(style.3f2a9c1e07.css) - такой ответ браузер кэширует навсегда (immutable),
+по прежнему адресу файл отдаётся с ETag и проверкой 304. JSON-ответы больше
+порога сжимаются на лету по Accept-Encoding.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+
+from flask import Response, abort, current_app, render_template, request
+
+import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+JSON_MIN_SIZE = int(os.getenv('JSON_COMPRESS_MIN_SIZE', 1024))
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+# В порядке предпочтения
+ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+COMPRESSIBLE = ('text/', 'application/json', 'application/javascript', 'image/svg+xml', 'image/vnd.microsoft.icon')
+
+ASSET_RESPONSES = metrics.REGISTRY.counter(
+    'asset_responses_total', 'Ответы страниц, статики и JSON по кодированию', ('kind', 'result')
+)
+
+
+def compress(data, encoding, best=False):
+    """best - максимальное сжатие для подготовки при старте, иначе быстрое для ответов на лету"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if best else 5)
+    return gzip.compress(data, compresslevel=9 if best else 6, mtime=0)
+
+
+def negotiate(available):
+    """Лучшее из available кодирование, которое принимает клиент, иначе identity"""
+    accept = request.accept_encodings
+    for encoding in ENCODINGS:
+        if encoding in available and accept[encoding] > 0:
+            return encoding
+    return 'identity'
+
+
+class Asset:
+    """Готовый ответ: тело, его сжатые варианты и хеш содержимого для ETag"""
+
+    def __init__(self, body, mimetype, min_size=256):
+        self.mimetype = mimetype
+        self.digest = hashlib.sha256(body).hexdigest()
+        self.variants = {'identity': body}
+        if len(body) >= min_size and mimetype.startswith(COMPRESSIBLE):
+            for encoding in ENCODINGS:
+                data = compress(body, encoding, best=True)
+                if len(data) < len(body):
+                    self.variants[encoding] = data
+
+    def response(self, kind, cache_control):
+        encoding = negotiate(self.variants)
+        response = Response(self.variants[encoding], mimetype=self.mimetype)
+        response.headers['Cache-Control'] = cache_control
+        if len(self.variants) > 1:
+            response.vary.add('Accept-Encoding')
+        if encoding != 'identity':
+            response.content_encoding = encoding
+        # У каждого варианта свой ETag: сжатое и несжатое тело различаются
+        response.set_etag(f'{self.digest[:16]}-{encoding}')
+        response.make_conditional(request)
+        ASSET_RESPONSES.inc(kind=kind, result='not_modified' if response.status_code == 304 else encoding)
+        return response
+
+
+class AssetStore:
+    """Файлы static/ по обычному имени и по имени с хешем, предрендеренные страницы"""
+
+    def __init__(self, static_folder):
+        self.files = {}
+        self.manifest = {}
+        self.pages = {}
+        if static_folder and os.path.isdir(static_folder):
+            self._load_static(static_folder)
+
+    def _load_static(self, static_folder):
+        for root, _, names in os.walk(static_folder):
+            for name in names:
+                path = os.path.join(root, name)
+                filename = os.path.relpath(path, static_folder).replace(os.sep, '/')
+                with open(path, 'rb') as f:
+                    asset = Asset(f.read(), mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+
+                base, ext = os.path.splitext(filename)
+                fingerprinted = f'{base}.{asset.digest[:10]}{ext}'
+                self.manifest[filename] = fingerprinted
+                self.files[filename] = (asset, REVALIDATE)
+                self.files[fingerprinted] = (asset, IMMUTABLE)
+
+    def render_page(self, app, name):
+        with app.test_request_context('/'):
+            html = render_template(name)
+        return Asset(html.encode('utf-8'), 'text/html')
+
+
+def page(name):
+    """Ответ для index(): предрендеренный шаблон, в режиме отладки - свежий рендер"""
+    store = current_app.extensions['assets']
+    if current_app.debug or name not in store.pages:
+        return render_template(name)
+    return store.pages[name].response('page', REVALIDATE)
+
+
+def init_app(app, pages=(), json_min_size=JSON_MIN_SIZE):
+    """Подключает статику с хешами, предрендер pages и сжатие JSON к Flask приложению"""
+    store = AssetStore(app.static_folder)
+    app.extensions['assets'] = store
+    send_static = app.view_functions.get('static')
+
+    @app.url_defaults
+    def _fingerprint(endpoint, values):
+        if endpoint == 'static' and not app.debug and 'filename' in values:
+            values['filename'] = store.manifest.get(values['filename'], values['filename'])
+
+    def static(filename):
+        # В режиме отладки файлы читаются с диска, чтобы правки были видны сразу
+        if app.debug and send_static:
+            return send_static(filename=filename)
+        entry = store.files.get(filename)
+        if entry is None:
+            abort(404)
+        asset, cache_control = entry
+        return asset.response('static', cache_control)
+
+    if send_static:
+        app.view_functions['static'] = static
+
+    for name in pages:
+        store.pages[name] = store.render_page(app, name)
+
+    @app.after_request
+    def _compress_json(response):
+        if (response.mimetype != 'application/json' or response.is_streamed or response.direct_passthrough
+                or 'Content-Encoding' in response.headers):
+            return response
+        body = response.get_data()
+        if len(body) < json_min_size:
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = negotiate(ENCODINGS)
+        if encoding != 'identity':
+            response.set_data(compress(body, encoding))
+            response.content_encoding = encoding
+        ASSET_RESPONSES.inc(kind='json', result=encoding)
+        return response
+
+    return app
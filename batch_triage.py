@@ -0,0 +1,298 @@
+"""Пакетная обработка анкет пациентов: CSV/JSONL -> JSONL.
+
+Каждая анкета проходит те же шаги, что и диалог в app-cal.py: локальный
+подбор специалиста, при неуверенности - DeepSeek, затем разбор предложения
+о записи. Файл результатов пишется построчно и служит чекпоинтом: после
+падения повторный запуск пропускает уже обработанные анкеты.
+
+    python batch_triage.py intake.csv results.jsonl --workers 8 --rate 5
+
+Во входном файле нужны поля name и symptoms, необязательное id (иначе номер строки).
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from dotenv import load_dotenv
+
+import booking_pipeline
+import services
+from logging_setup import setup_logging
+from prompt_registry import PromptRegistry
+from symptom_classifier import SymptomClassifier
+
+load_dotenv()
+
+DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
+DEEPSEEK_API_URL = os.getenv('DEEPSEEK_API_URL', 'https://api.deepseek.com/v1/chat/completions')
+
+# Ответы, после которых запрос имеет смысл повторить
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def read_records(path):
+    """Потоковое чтение анкет без загрузки файла целиком: (id, запись)"""
+    if path.lower().endswith('.csv'):
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            for number, row in enumerate(csv.DictReader(f), 1):
+                yield str(row.get('id') or number), row
+        return
+
+    with open(path, encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                logging.error(f"Строка {number}: некорректный JSON")
+                continue
+            yield str(row.get('id') or number), row
+
+
+class RateLimiter:
+    """Не больше rate запросов в секунду на все потоки, 0 - без ограничения"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class ResultWriter:
+    """Построчная запись результатов. Анкеты с ошибкой при перезапуске обрабатываются снова"""
+
+    def __init__(self, path, fsync_every=50):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.done = self._load_done(path)
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+        self._written = 0
+
+    @staticmethod
+    def _load_done(path):
+        done = set()
+        if not os.path.exists(path):
+            return done
+        with open(path, 'rb+') as f:
+            data = f.read()
+            # Недописанная строка после аварийного завершения отрезается
+            end = data.rfind(b'\n') + 1
+            if end != len(data):
+                f.truncate(end)
+        for line in data[:end].splitlines():
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue
+            if result.get('status') != 'error':
+                done.add(result.get('id'))
+        return done
+
+    def write(self, result):
+        line = json.dumps(result, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            self._written += 1
+            if self._written % self.fsync_every == 0:
+                os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+
+class Triage:
+    """Обработка одной анкеты: классификатор, DeepSeek с повторами, разбор ответа"""
+
+    def __init__(self, prompts, classifier, limiter, max_attempts=3):
+        self.prompts = prompts
+        self.classifier = classifier
+        self.limiter = limiter
+        self.max_attempts = max_attempts
+
+    def query_deepseek(self, messages, step='get_symptoms'):
+        payload = booking_pipeline.completion_payload(
+            messages, booking_pipeline.generation_profile(self.prompts, step)
+        )
+        headers = {
+            'Authorization': f'Bearer {DEEPSEEK_API_KEY}',
+            'Content-Type': 'application/json'
+        }
+        for attempt in range(1, self.max_attempts + 1):
+            self.limiter.wait()
+            response = services.http_session().post(DEEPSEEK_API_URL, headers=headers, json=payload, timeout=30)
+            if response.status_code in RETRY_STATUSES and attempt < self.max_attempts:
+                try:
+                    delay = float(response.headers.get('Retry-After'))
+                except (TypeError, ValueError):
+                    delay = 2 ** attempt
+                logging.warning(f"DeepSeek ответил {response.status_code}, повтор через {delay} с")
+                time.sleep(delay)
+                continue
+            response.raise_for_status()
+            return response.json()
+
+    def process(self, record_id, row):
+        start = time.perf_counter()
+        name = (row.get('name') or '').strip()
+        symptoms = (row.get('symptoms') or '').strip()
+        result = {'id': record_id, 'name': name, 'symptoms': symptoms}
+
+        try:
+            if not symptoms:
+                raise ValueError(self.prompts['errors']['empty_message'])
+
+            proposal = None
+            if self.classifier is not None:
+                proposal = booking_pipeline.local_proposal(self.classifier, self.prompts, name, [symptoms])
+            if proposal is not None:
+                reply = proposal[0]
+                result['source'] = 'local'
+            else:
+                history = [{'role': 'user', 'content': name}, {'role': 'user', 'content': symptoms}]
+                response_json = self.query_deepseek(self.prompts.build_prompt(history, 'diagnosis_guide'))
+                reply = booking_pipeline.reply_text(response_json)
+                result['source'] = 'llm'
+                result['usage'] = response_json.get('usage')
+
+            details = booking_pipeline.extract_appointment_details(reply) \
+                if booking_pipeline.is_proposal(reply) else None
+            result['reply'] = reply
+            result['status'] = 'proposal' if details else 'clarify'
+            result.update(details or {})
+        except Exception as e:
+            result['status'] = 'error'
+            result['error'] = str(e)
+
+        result['latency_ms'] = round((time.perf_counter() - start) * 1000, 1)
+        return result
+
+
+def summarize(stats, latencies, elapsed, interrupted):
+    ordered = sorted(latencies)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+    processed = len(ordered)
+    return {
+        'interrupted': interrupted,
+        'processed': processed,
+        'skipped_from_checkpoint': stats['skipped'],
+        'proposal': stats['proposal'],
+        'clarify': stats['clarify'],
+        'error': stats['error'],
+        'local': stats['local'],
+        'llm': stats['llm'],
+        'tokens': stats['tokens'],
+        'elapsed_s': round(elapsed, 2),
+        'records_per_s': round(processed / elapsed, 2) if elapsed else 0.0,
+        'latency_p50_ms': pick(0.50),
+        'latency_p95_ms': pick(0.95),
+    }
+
+
+def run(input_path, output_path, triage, workers=4, limit=None):
+    writer = ResultWriter(output_path)
+    stats = Counter()
+    latencies = []
+    interrupted = False
+    start = time.perf_counter()
+
+    def collect(future):
+        result = future.result()
+        writer.write(result)
+        stats[result['status']] += 1
+        stats[result.get('source', 'none')] += 1
+        stats['tokens'] += (result.get('usage') or {}).get('total_tokens', 0)
+        latencies.append(result['latency_ms'])
+        if len(latencies) % 100 == 0:
+            logging.info(f"Обработано анкет: {len(latencies)}")
+
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='triage')
+    pending = set()
+    try:
+        submitted = 0
+        for record_id, row in read_records(input_path):
+            if record_id in writer.done:
+                stats['skipped'] += 1
+                continue
+            if limit is not None and submitted >= limit:
+                break
+            # Ограниченная очередь: файл читается по мере обработки, а не целиком
+            if len(pending) >= workers * 2:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    collect(future)
+            pending.add(pool.submit(triage.process, record_id, row))
+            submitted += 1
+
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                collect(future)
+    except KeyboardInterrupt:
+        interrupted = True
+        logging.warning("Прервано, незавершённые анкеты будут обработаны при следующем запуске")
+        for future in pending:
+            future.cancel()
+        for future in pending:
+            if future.done() and not future.cancelled():
+                collect(future)
+    finally:
+        pool.shutdown(wait=not interrupted, cancel_futures=True)
+        writer.close()
+
+    return summarize(stats, latencies, time.perf_counter() - start, interrupted)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Пакетная обработка анкет пациентов')
+    parser.add_argument('input', help='CSV или JSONL с полями name, symptoms')
+    parser.add_argument('output', help='JSONL с результатами (он же чекпоинт)')
+    parser.add_argument('--workers', type=int, default=4, help='одновременных анкет')
+    parser.add_argument('--rate', type=float, default=5.0, help='запросов к DeepSeek в секунду, 0 - без ограничения')
+    parser.add_argument('--max-attempts', type=int, default=3, help='попыток на 429/5xx от DeepSeek')
+    parser.add_argument('--limit', type=int, help='обработать не больше N анкет')
+    parser.add_argument('--prompts', default='prompts.json')
+    parser.add_argument('--specialists', default='specialists.json', help='пустое значение - только DeepSeek')
+    args = parser.parse_args(argv)
+
+    setup_logging(log_file=None)
+    if not DEEPSEEK_API_KEY:
+        logging.critical("DEEPSEEK_API_KEY не найден в .env")
+        raise SystemExit(1)
+
+    prompts = PromptRegistry(args.prompts).get()
+    classifier = None
+    if args.specialists:
+        classifier = SymptomClassifier.from_file(args.specialists, normalizer=booking_pipeline.normalize_text)
+
+    triage = Triage(prompts, classifier, RateLimiter(args.rate), args.max_attempts)
+    summary = run(args.input, args.output, triage, args.workers, args.limit)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""Загрузка страницы чата: байты по сети, число запросов и запросов в секунду для /.
+
+Эмулирует браузер: первый визит загружает / и всё, на что ссылается страница
+(href/src), повторный визит не обращается за ответами с immutable/max-age и
+перепроверяет остальные через If-None-Match / If-Modified-Since. Затем
+несколько потоков нагружают / в течение заданного времени.
+
+    python bench/bench_assets.py --app app-cal --threads 8 --duration 5
+"""
+import argparse
+import re
+import tempfile
+import threading
+import time
+
+import requests
+
+from common import dump, fake_service_account, percentiles, prepare_workdir
+from mock_servers import MockState, start_mock_server
+from run_bench import git_revision, start_app
+
+ACCEPT_ENCODING = 'gzip, deflate, br'
+LINK_RE = re.compile(r'(?:href|src)="(/[^"]+)"')
+
+
+def fetch(session, url, headers=None):
+    """Ответ и число байт тела в том виде, в каком оно пришло по сети"""
+    response = session.get(url, headers=dict(headers or {}, **{'Accept-Encoding': ACCEPT_ENCODING}))
+    # tell() считает байты, полученные из сокета, до распаковки
+    return response, response.raw.tell()
+
+
+def cached_without_request(response):
+    cache_control = response.headers.get('Cache-Control', '')
+    match = re.search(r'max-age=(\d+)', cache_control)
+    return 'immutable' in cache_control or bool(match and int(match.group(1)) > 0)
+
+
+def page_load(session, base, cache):
+    """Один визит; cache - {url: последний ответ} между визитами, как у браузера"""
+    stats = {'requests': 0, 'bytes': 0, 'not_modified': 0, 'from_cache': 0}
+
+    def load(url):
+        previous = cache.get(url)
+        if previous is not None and cached_without_request(previous):
+            stats['from_cache'] += 1
+            return None
+        headers = {}
+        if previous is not None:
+            if previous.headers.get('ETag'):
+                headers['If-None-Match'] = previous.headers['ETag']
+            if previous.headers.get('Last-Modified'):
+                headers['If-Modified-Since'] = previous.headers['Last-Modified']
+        response, size = fetch(session, f'{base}{url}', headers)
+        stats['requests'] += 1
+        stats['bytes'] += size
+        if response.status_code == 304:
+            stats['not_modified'] += 1
+        else:
+            cache[url] = response
+        return response
+
+    load('/')
+    # Ссылки страницы берутся отдельным запросом вне статистики
+    html = requests.get(f'{base}/', headers={'Accept-Encoding': 'identity'}).text
+    for url in sorted(set(LINK_RE.findall(html))):
+        load(url)
+    return stats
+
+
+def load_index(base, threads, duration):
+    samples = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker():
+        session = requests.Session()
+        local = []
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            response, _ = fetch(session, f'{base}/')
+            local.append(time.perf_counter() - start)
+            assert response.status_code == 200
+        with lock:
+            samples.extend(local)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--app', default='app-cal', choices=['app-cal', 'app-ds', 'app-cop', 'app-qw'])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=5.0, help='нагрузка на /, с')
+    args = parser.parse_args()
+
+    state = MockState()
+    mock = start_mock_server(state)
+    mock_base = f'http://127.0.0.1:{mock.server_address[1]}'
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    prepare_workdir(workdir, fake_service_account(f'{mock_base}/token'))
+    process, base = start_app(args.app, mock_base, workdir)
+    try:
+        session = requests.Session()
+        cache = {}
+        first = page_load(session, base, cache)
+        repeat = page_load(session, base, cache)
+        samples = load_index(base, args.threads, args.duration)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+        mock.shutdown()
+
+    dump({
+        'benchmark': 'assets',
+        'app': args.app,
+        'revision': git_revision(),
+        'first_visit': first,
+        'repeat_visit': repeat,
+        'index': {
+            'threads': args.threads,
+            'requests_per_s': round(len(samples) / args.duration, 1),
+            'latency': percentiles(samples),
+        },
+    })
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Локальный подбор специалиста против DeepSeek на шаге get_symptoms.
+
+Доля ходов, решённых классификатором без LLM, точность этих решений на
+размеченной выборке (bench/triage_samples.json), задержка классификации и
+сэкономленное время. DeepSeek подменяется заглушкой с задержкой --latency.
+
+    python bench/bench_classifier.py --latency 0.8 --llm-samples 20
+"""
+import argparse
+import json
+import os
+import time
+
+from common import dump, load_app, percentiles, prepare_workdir
+from mock_servers import MockState, start_mock_server
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0.8, help='задержка ответа заглушки DeepSeek, с')
+    parser.add_argument('--llm-samples', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=200, help='повторов классификации каждого примера')
+    parser.add_argument('--samples', default=os.path.join(HERE, 'triage_samples.json'))
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    with open(args.samples, encoding='utf-8') as f:
+        samples = json.load(f)
+
+    server = start_mock_server(MockState(latency=args.latency))
+    os.environ['DEEPSEEK_API_URL'] = f'http://127.0.0.1:{server.server_address[1]}/v1/chat/completions'
+    prepare_workdir()
+    app_module = load_app('app-cal')
+    app_module.create_app()
+    classifier = app_module.symptom_classifier
+
+    local = correct = wrong_on_unknown = 0
+    classify_samples = []
+    for sample in samples:
+        match = classifier.classify(sample['text'])
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            classifier.classify(sample['text'])
+            classify_samples.append(time.perf_counter() - start)
+        if match is None:
+            continue
+        local += 1
+        if match[0] == sample['doctor']:
+            correct += 1
+        elif sample['doctor'] is None:
+            wrong_on_unknown += 1
+
+    prompts = app_module.prompt_registry.get()
+    history = [{'role': 'user', 'content': samples[0]['text']}]
+    llm_samples = []
+    for _ in range(args.llm_samples):
+        start = time.perf_counter()
+        app_module.query_deepseek(prompts.build_prompt(history, 'diagnosis_guide'), 'get_symptoms', prompts)
+        llm_samples.append(time.perf_counter() - start)
+
+    classify_stats = percentiles(classify_samples)
+    llm_stats = percentiles(llm_samples)
+    local_share = local / len(samples)
+    saved_ms = llm_stats['mean_ms'] - classify_stats['mean_ms']
+    result = {
+        'benchmark': 'symptom_classifier',
+        'samples': len(samples),
+        'threshold': classifier.threshold,
+        'min_margin': classifier.min_margin,
+        'local_share': round(local_share, 3),
+        'local_precision': round(correct / local, 3) if local else None,
+        'local_on_unknown': wrong_on_unknown,
+        'classify_latency': classify_stats,
+        'deepseek_latency': llm_stats,
+        'saved_ms_per_local_turn': round(saved_ms, 3),
+        'saved_ms_per_turn': round(saved_ms * local_share, 3),
+    }
+    dump(result)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
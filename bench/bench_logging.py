@@ -0,0 +1,93 @@
+"""Задержка /chat в app-cal.py при разных режимах логирования.
+
+Режимы: disabled - логирование выключено, sync - прежняя схема
+(FileHandler + StreamHandler в потоке запроса), queue - logging_setup.
+DeepSeek подменяется через responses, поэтому сеть не нужна.
+
+    python bench/bench_logging.py --turns 500
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+import responses
+
+from common import dump, load_app, percentiles, prepare_workdir
+
+DEEPSEEK_REPLY = {
+    'choices': [{
+        'message': {'content': 'Иван Иванов, предлагаем запись к терапевту на 21.10.2026 в 10-00'},
+        'finish_reason': 'stop'
+    }],
+    'usage': {'prompt_tokens': 120, 'completion_tokens': 32}
+}
+
+
+def configure(mode, log_file):
+    from logging_setup import setup_logging
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    logging.disable(logging.NOTSET)
+
+    if mode == 'disabled':
+        logging.disable(logging.CRITICAL)
+        return None
+    if mode == 'sync':
+        for handler in (logging.FileHandler(log_file, encoding='utf-8'), logging.StreamHandler()):
+            handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+            root.addHandler(handler)
+        root.setLevel(logging.INFO)
+        return None
+    return setup_logging(log_file)
+
+
+def run(app, turns):
+    client = app.test_client()
+    samples = []
+    for _ in range(turns):
+        client.delete_cookie('session_id')
+        for message in ('Иван Иванов', 'Болит горло и температура 38'):
+            start = time.perf_counter()
+            response = client.post('/chat', json={'message': message})
+            samples.append(time.perf_counter() - start)
+            # Иначе меряется не логирование, а, например, отказ 429 ограничителя
+            assert response.status_code == 200, f'/chat: {response.status_code} {response.get_data(as_text=True)}'
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--turns', type=int, default=300)
+    args = parser.parse_args()
+
+    prepare_workdir()
+    # Меряем шаг с обращением к DeepSeek, локальный подбор специалиста отключён
+    os.environ['SYMPTOM_CLASSIFIER'] = ''
+    # Все запросы идут с одного IP со сменой cookie - ограничитель частоты отключён, как в run_bench
+    os.environ['RATE_LIMIT_RPM'] = '0'
+    # Прогрев на каждой новой сессии добавил бы фоновые потоки и записи лога о неудаче
+    os.environ['WARMUP'] = 'false'
+    # Консольный вывод логов уходит в /dev/null, чтобы не мерить терминал
+    sys.stderr = open(os.devnull, 'w')
+    app_module = load_app('app-cal')
+    app = app_module.create_app()
+
+    result = {'benchmark': 'logging', 'turns': args.turns, 'modes': {}}
+    with responses.RequestsMock(assert_all_requests_are_fired=False) as mock:
+        mock.add(responses.POST, app_module.DEEPSEEK_API_URL, json=DEEPSEEK_REPLY)
+        for mode in ('disabled', 'sync', 'queue'):
+            listener = configure(mode, f'bench-{mode}.log')
+            run(app, 20)  # прогрев
+            result['modes'][mode] = percentiles(run(app, args.turns))
+            if listener:
+                listener.stop()
+    dump(result)
+
+
+if __name__ == '__main__':
+    main()
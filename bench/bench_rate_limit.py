@@ -0,0 +1,216 @@
+"""Ограничение частоты: цена проверки, общий лимит воркеров и защита от скрипта.
+
+1. Время RateLimiter.check() для вёдер в памяти и в SQLite: пропуск и
+   повторный отказ (из кэша отказов процесса).
+2. Несколько процессов берут из одного ведра: с SQLite суммарно проходит
+   столько, сколько позволяет лимит, с вёдрами в памяти - в N раз больше.
+3. app-cal на заглушках: скрипт с одного IP шлёт /chat в несколько потоков,
+   меняя cookie, параллельно пациенты проходят записанные диалоги. Число
+   вызовов DeepSeek и задержка пациентов без лимитов и с ними.
+
+    python bench/bench_rate_limit.py --duration 10 --abuse-threads 8
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import requests
+
+from common import dump, fake_service_account, percentiles, prepare_workdir
+from mock_servers import MockState, start_mock_server
+from run_bench import HERE, start_app
+
+
+def time_checks(limiter, keys_list, rounds):
+    start = time.perf_counter()
+    for i in range(rounds):
+        limiter.check(keys_list[i % len(keys_list)])
+    return round((time.perf_counter() - start) / rounds * 1e6, 2)
+
+
+def check_cost(workdir, rounds):
+    from rate_limit import MemoryBucketStore, RateLimiter, SqliteBucketStore
+
+    result = {}
+    stores = {
+        'memory': MemoryBucketStore,
+        'sqlite': lambda: SqliteBucketStore(os.path.join(workdir, 'cost.db')),
+    }
+    for name, factory in stores.items():
+        clients = [[f'session:{n}', f'ip:10.0.{n // 250}.{n % 250}'] for n in range(200)]
+        allowed = RateLimiter(factory(), requests_per_minute=1e9, burst=1e9, llm_tokens_per_hour=1e9)
+        denied = RateLimiter(factory(), requests_per_minute=1, burst=1)
+        denied.check(['ip:10.66.0.1'])
+        denied.check(['ip:10.66.0.1'])
+        result[name] = {
+            'allowed_us': time_checks(allowed, clients, rounds),
+            'denied_us': time_checks(denied, [['ip:10.66.0.1']], rounds),
+        }
+    return result
+
+
+def hammer(store_kind, db_path, start_at, duration, queue):
+    from rate_limit import MemoryBucketStore, RateLimiter, SqliteBucketStore
+
+    store = SqliteBucketStore(db_path) if store_kind == 'sqlite' else MemoryBucketStore()
+    limiter = RateLimiter(store, requests_per_minute=600, burst=20, llm_tokens_per_hour=0)
+    time.sleep(max(0.0, start_at - time.time()))
+    allowed = 0
+    while time.time() < start_at + duration:
+        # Без кэша отказов: каждая попытка идёт в общее хранилище
+        wait, reason = limiter.store.take(limiter._items(['key:bench'], None))
+        allowed += reason is None
+        time.sleep(0.001)
+    queue.put(allowed)
+
+
+def shared_limit(workdir, processes, duration):
+    context = multiprocessing.get_context('fork')
+    result = {'processes': processes, 'expected_allowed': 20 + 10 * duration}
+    for kind in ('sqlite', 'memory'):
+        queue = context.Queue()
+        start_at = time.time() + 1.0
+        db_path = os.path.join(workdir, 'shared.db')
+        workers = [
+            context.Process(target=hammer, args=(kind, db_path, start_at, duration, queue))
+            for _ in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        result[f'{kind}_allowed'] = sum(queue.get() for _ in workers)
+        for worker in workers:
+            worker.join()
+    return result
+
+
+def abuse(base, deadline, threads, queue):
+    statuses = Counter()
+    lock = threading.Lock()
+
+    def worker():
+        while time.time() < deadline:
+            session = requests.Session()
+            session.headers['X-Forwarded-For'] = '10.66.0.1'
+            # Разный текст: одинаковые запросы app-cal мог бы отдать из кэша ответов
+            for message in ('Иван Иванов', f'мне плохо, всё болит {random.random()}'):
+                status = session.post(f'{base}/chat', json={'message': message}, timeout=60).status_code
+                with lock:
+                    statuses[status] += 1
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    queue.put(statuses)
+
+
+def run_abuse(mock_base, workdir, state, limits, duration, abuse_threads, patient_threads):
+    """Скрипт меняет cookie на каждую пару сообщений, пациенты - каждый со своего IP"""
+    os.environ.update(limits)
+    process, base = start_app('app-cal', mock_base, workdir)
+    with open(os.path.join(HERE, 'conversations.json'), encoding='utf-8') as f:
+        conversations = json.load(f)['app-cal']
+
+    patients = {'latency': [], 'errors': 0, 'rate_limited': 0, 'conversations': 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def patient(number):
+        turn = 0
+        while time.monotonic() < deadline:
+            session = requests.Session()
+            session.headers['X-Forwarded-For'] = f'10.1.{number}.{turn % 250}'
+            turn += 1
+            for message in conversations[turn % len(conversations)]['turns']:
+                start = time.perf_counter()
+                response = session.post(f'{base}/chat', json={'message': message}, timeout=60)
+                with lock:
+                    patients['latency'].append(time.perf_counter() - start)
+                    patients['errors'] += response.status_code >= 400
+                    patients['rate_limited'] += response.status_code == 429
+                if response.status_code >= 400:
+                    break
+            with lock:
+                patients['conversations'] += 1
+
+    state.reset()
+    # Скрипт - в отдельном процессе, чтобы его потоки не отнимали GIL у потоков пациентов
+    context = multiprocessing.get_context('fork')
+    queue = context.Queue()
+    abuser_process = context.Process(target=abuse, args=(base, time.time() + duration, abuse_threads, queue))
+    threads = [threading.Thread(target=patient, args=(n,)) for n in range(patient_threads)]
+    try:
+        abuser_process.start()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        abuser = queue.get()
+        abuser_process.join()
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+    calls = state.snapshot()
+    return {
+        'abuser_requests': sum(abuser.values()),
+        'abuser_allowed': abuser[200],
+        'abuser_rejected_429': abuser[429],
+        'deepseek_calls': calls.get('deepseek.completion', 0),
+        'patient_conversations': patients['conversations'],
+        'patient_errors': patients['errors'],
+        'patient_rate_limited': patients['rate_limited'],
+        'patient_latency': percentiles(patients['latency']),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=20000)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--abuse-threads', type=int, default=8)
+    parser.add_argument('--patient-threads', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.2, help='задержка DeepSeek, с')
+    args = parser.parse_args()
+
+    state = MockState(latency=args.latency)
+    mock = start_mock_server(state)
+    mock_base = f'http://127.0.0.1:{mock.server_address[1]}'
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    prepare_workdir(workdir, fake_service_account(f'{mock_base}/token'))
+
+    result = {
+        'benchmark': 'rate_limit',
+        'check_cost': check_cost(workdir, args.rounds),
+        'shared_limit': shared_limit(workdir, args.processes, 3),
+    }
+    # Пациентов ведёт DeepSeek, а не локальный классификатор: каждый ход с симптомами - платный вызов
+    common_env = {
+        'SYMPTOM_CLASSIFIER': '',
+        'RATE_LIMIT_TRUST_PROXY': 'true',
+        'RATE_LIMIT_DB': os.path.join(workdir, 'rate-limit.db'),
+    }
+    try:
+        result['without_limits'] = run_abuse(
+            mock_base, workdir, state, dict(common_env, RATE_LIMIT_RPM='0'),
+            args.duration, args.abuse_threads, args.patient_threads
+        )
+        result['with_limits'] = run_abuse(
+            mock_base, workdir, state, dict(common_env, RATE_LIMIT_RPM='20', RATE_LIMIT_BURST='6'),
+            args.duration, args.abuse_threads, args.patient_threads
+        )
+    finally:
+        mock.shutdown()
+    dump(result)
+
+
+if __name__ == '__main__':
+    main()
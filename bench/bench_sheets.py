@@ -0,0 +1,133 @@
+"""Буферизованная запись в Google Sheets против вызова API на каждую строку.
+
+Против локальной заглушки Sheets с квотой запросов в минуту: задержка
+append() в потоке запроса, число обращений к API, соблюдение квоты и
+восстановление неотправленных строк из журнала после падения процесса.
+
+    python bench/bench_sheets.py --rows 2000 --threads 8 --quota 60
+"""
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from common import ROOT, dump, fake_service_account, percentiles, prepare_workdir
+from mock_servers import MockState, start_mock_server
+
+SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
+
+CRASH_SCRIPT = '''
+import os, sys
+sys.path.insert(0, {root!r})
+from sheets_writer import SheetsWriter
+writer = SheetsWriter(lambda: None, 'crash', 'Bookings!A1', flush_interval=3600, spool_path={spool!r})
+for i in range({rows}):
+    writer.append(['crash', i])
+os._exit(1)
+'''
+
+
+def make_row(i):
+    return [f'2026-10-19T10:{i % 60:02d}:00', f'booking-{i}', 'Иван Иванов', 'терапевту', '20.10.2026', '10-00']
+
+
+def run_direct(service_factory, rows):
+    """Прежняя схема: один values().append в потоке запроса на каждую строку"""
+    samples = []
+    for i in range(rows):
+        start = time.perf_counter()
+        service_factory().spreadsheets().values().append(
+            spreadsheetId='direct', range='Bookings!A1', valueInputOption='USER_ENTERED',
+            body={'values': [make_row(i)]}
+        ).execute()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def run_buffered(writer, rows, threads):
+    samples = []
+    lock = threading.Lock()
+
+    def worker(offset):
+        local = []
+        for i in range(offset, rows, threads):
+            start = time.perf_counter()
+            writer.append(make_row(i))
+            local.append(time.perf_counter() - start)
+        with lock:
+            samples.extend(local)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--direct-rows', type=int, default=50, help='строк для схемы "вызов на строку"')
+    parser.add_argument('--quota', type=int, default=60, help='запросов на запись в минуту в заглушке')
+    parser.add_argument('--batch', type=int, default=500)
+    parser.add_argument('--interval', type=float, default=0.5)
+    parser.add_argument('--latency', type=float, default=0.0, help='задержка заглушки, с')
+    args = parser.parse_args()
+
+    state = MockState(latency=args.latency, sheets_quota=args.quota)
+    server = start_mock_server(state)
+    base = f'http://127.0.0.1:{server.server_address[1]}'
+    workdir = prepare_workdir(service_account=fake_service_account(f'{base}/token'))
+
+    import services
+    from sheets_writer import SheetsWriter
+
+    sa_path = os.path.join(workdir, 'service-account.json')
+
+    def service_factory():
+        return services.sheets_service(sa_path, SCOPES, f'{base}/sheets/')
+
+    direct = run_direct(service_factory, args.direct_rows)
+    state.reset()
+
+    spool = os.path.join(workdir, 'bench-sheet.jsonl')
+    writer = SheetsWriter(
+        service_factory, 'buffered', 'Bookings!A1', name='bench', flush_interval=args.interval,
+        max_batch=args.batch, writes_per_minute=args.quota, spool_path=spool
+    )
+    start = time.perf_counter()
+    buffered = run_buffered(writer, args.rows, args.threads)
+    delivered = writer.flush(timeout=120)
+    elapsed = time.perf_counter() - start
+    writer.close()
+    calls = state.snapshot()
+
+    # Падение процесса с неотправленными строками и восстановление новым писателем
+    crash_spool = os.path.join(workdir, 'crash-sheet.jsonl')
+    subprocess.run([sys.executable, '-c', CRASH_SCRIPT.format(root=ROOT, spool=crash_spool, rows=100)])
+    recovered = SheetsWriter(service_factory, 'crash', 'Bookings!A1', name='crash', spool_path=crash_spool)
+    recovered.flush(timeout=30)
+    recovered.close()
+
+    dump({
+        'benchmark': 'sheets_writer',
+        'rows': args.rows,
+        'threads': args.threads,
+        'direct_append_latency': percentiles(direct),
+        'buffered_append_latency': percentiles(buffered),
+        'delivered': delivered,
+        'rows_in_sheet': state.sheet_rows('buffered'),
+        'api_calls': calls.get('sheets.append', 0),
+        'rows_per_call': round(state.sheet_rows('buffered') / max(1, calls.get('sheets.append', 0)), 1),
+        'quota_exceeded': calls.get('sheets.quota_exceeded', 0),
+        'elapsed_s': round(elapsed, 2),
+        'crash_recovery': {'spooled': 100, 'recovered_rows': state.sheet_rows('crash')},
+    })
+
+
+if __name__ == '__main__':
+    main()
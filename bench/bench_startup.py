@@ -0,0 +1,103 @@
+"""Время старта приложений: разбор python -X importtime и время до первого ответа.
+
+    python bench/bench_startup.py --apps app-cal app-ds TG-bot-DS
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+from common import ROOT, dump, fake_service_account, prepare_workdir
+from run_bench import start_app
+
+APPS = ['app-cal', 'app-ds', 'app-cop', 'app-qw', 'TG-bot-DS']
+FIRST_REQUEST_PATH = {'TG-bot-DS': '/status'}
+
+IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+STARTUP_SCRIPT = '''
+import importlib, sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+module = importlib.import_module({module!r})
+imported = time.perf_counter()
+module.create_app()
+created = time.perf_counter()
+print(f"{{imported - start}} {{created - imported}}")
+'''
+
+
+def import_breakdown(module, workdir, env, top):
+    """Импорт + create_app() под -X importtime: общее время и самые тяжёлые пакеты верхнего уровня"""
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT.format(root=ROOT, module=module)],
+        cwd=workdir, env=env, capture_output=True, text=True, timeout=120
+    )
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr[-2000:])
+
+    import_s, create_s = (float(x) for x in process.stdout.split()[-2:])
+    packages = {}
+    for line in process.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        # Один пробел отступа - импорт верхнего уровня
+        if match and len(match.group(3)) == 1:
+            name = match.group(4).split('.')[0]
+            packages[name] = packages.get(name, 0) + int(match.group(2))
+
+    heaviest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        'import_ms': round(import_s * 1000, 1),
+        'create_app_ms': round(create_s * 1000, 1),
+        'top_imports_ms': {name: round(us / 1000, 1) for name, us in heaviest},
+    }
+
+
+def first_request(module, workdir, mock_base):
+    start = time.perf_counter()
+    process, base = start_app(module, mock_base, workdir)
+    try:
+        ready = time.perf_counter()
+        response = requests.get(base + FIRST_REQUEST_PATH.get(module, '/'), timeout=30)
+        done = time.perf_counter()
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+    return {
+        'ready_ms': round((ready - start) * 1000, 1),
+        'first_request_ms': round((done - ready) * 1000, 1),
+        'time_to_first_response_ms': round((done - start) * 1000, 1),
+        'status': response.status_code,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк старта приложений')
+    parser.add_argument('--apps', nargs='+', default=APPS, choices=APPS)
+    parser.add_argument('--top', type=int, default=8, help='сколько тяжёлых импортов показать')
+    args = parser.parse_args()
+
+    # Заглушки не нужны для старта, адрес указывает в никуда
+    mock_base = 'http://127.0.0.1:9'
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    prepare_workdir(workdir, fake_service_account(f'{mock_base}/token'))
+    # Старт в рабочей конфигурации: с локальным классификатором app-cal
+    os.environ.setdefault('SYMPTOM_CLASSIFIER', 'specialists.json')
+    env = dict(os.environ, DEEPSEEK_API_KEY='bench-key', LOG_FORMAT='text')
+
+    result = {'benchmark': 'startup', 'apps': {}}
+    for module in args.apps:
+        result['apps'][module] = {
+            **import_breakdown(module, workdir, env, args.top),
+            **first_request(module, workdir, mock_base),
+        }
+    dump(result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Упреждающий прогрев: задержка первого хода с симптомами и записи в календарь.
+
+Заглушка DeepSeek берёт connect_latency за каждое новое соединение (TCP +
+TLS) и закрывает простаивающие дольше idle_timeout. Пациенты приходят по
+одному с паузой больше idle_timeout - соединения к их приходу остывают, как
+при небольшой нагрузке. Каждый вводит имя, думает think секунд, вводит
+симптомы (ход через DeepSeek) и подтверждает запись. Прогон с WARMUP=false
+и с WARMUP=true.
+
+    python bench/bench_warmup.py --patients 8 --connect-latency 0.15 --think 1
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import requests
+
+from common import dump, fake_service_account, percentiles, prepare_workdir
+from mock_servers import MockState, start_mock_server
+from run_bench import git_revision, start_app, wait_booking
+
+
+def run_patients(base, patients, think, gap):
+    symptom_turn, booking = [], []
+    for number in range(patients):
+        session = requests.Session()
+        session.post(f'{base}/chat', json={'message': f'Пациент Номер{number}'}, timeout=60)
+        time.sleep(think)
+
+        start = time.perf_counter()
+        # Без локального классификатора: ход с симптомами идёт в DeepSeek
+        session.post(f'{base}/chat', json={'message': 'болит голова и ломит всё тело'}, timeout=60)
+        symptom_turn.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        response = session.post(f'{base}/chat', json={'message': 'да'}, timeout=60)
+        booking_id = response.json().get('booking_id')
+        if booking_id and wait_booking(session, f'{base}/booking/{booking_id}') == 'done':
+            booking.append(time.perf_counter() - start)
+        time.sleep(gap)
+    return symptom_turn, booking
+
+
+def run(mode, mock_base, workdir, state, args):
+    # Прогрев считается устаревшим раньше, чем заглушка закроет соединение
+    os.environ.update(WARMUP=mode, WARMUP_FRESH=str(args.idle_timeout / 2), SYMPTOM_CLASSIFIER='')
+    process, base = start_app('app-cal', mock_base, workdir)
+    try:
+        # Соединения, открытые при старте, должны остыть
+        time.sleep(args.gap)
+        state.reset()
+        symptom_turn, booking = run_patients(base, args.patients, args.think, args.gap)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+    calls = state.snapshot()
+    return {
+        'symptom_turn_latency': percentiles(symptom_turn),
+        'first_booking_s': round(booking[0], 3) if booking else None,
+        'booking_latency': percentiles(booking),
+        'connections': calls.get('connections', 0),
+        'warmup_requests': calls.get('deepseek.models', 0),
+        'token_requests': calls.get('google.token', 0),
+        'deepseek_calls': calls.get('deepseek.completion', 0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--patients', type=int, default=8)
+    parser.add_argument('--connect-latency', type=float, default=0.15, help='цена нового соединения, с')
+    parser.add_argument('--idle-timeout', type=float, default=2.0, help='заглушка закрывает простаивающие соединения, с')
+    parser.add_argument('--think', type=float, default=1.0, help='пауза между именем и симптомами, с')
+    parser.add_argument('--latency', type=float, default=0.1, help='задержка DeepSeek до первого байта, с')
+    args = parser.parse_args()
+    args.gap = args.idle_timeout + 0.5
+
+    state = MockState(latency=args.latency, connect_latency=args.connect_latency, idle_timeout=args.idle_timeout)
+    mock = start_mock_server(state)
+    mock_base = f'http://127.0.0.1:{mock.server_address[1]}'
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    prepare_workdir(workdir, fake_service_account(f'{mock_base}/token'))
+    try:
+        cold = run('false', mock_base, workdir, state, args)
+        warm = run('true', mock_base, workdir, state, args)
+    finally:
+        mock.shutdown()
+
+    saved = None
+    if cold['symptom_turn_latency']['count'] and warm['symptom_turn_latency']['count']:
+        saved = round(cold['symptom_turn_latency']['mean_ms'] - warm['symptom_turn_latency']['mean_ms'], 1)
+    dump({
+        'benchmark': 'warmup',
+        'revision': git_revision(),
+        'config': {
+            'patients': args.patients,
+            'connect_latency_s': args.connect_latency,
+            'idle_timeout_s': args.idle_timeout,
+            'think_s': args.think,
+        },
+        'without_warmup': cold,
+        'with_warmup': warm,
+        'symptom_turn_saved_ms': saved,
+    })
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+import importlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def prepare_workdir(workdir=None, service_account=None):
+    """Рабочий каталог с prompts.json и service-account.json.
+
+    Приложения читают файлы относительно текущего каталога, поэтому бенчмарк
+    переходит туда, чтобы не оставлять артефактов в репозитории.
+    """
+    workdir = workdir or tempfile.mkdtemp(prefix='bench-')
+    for name in ('prompts.json', 'specialists.json'):
+        shutil.copy(os.path.join(ROOT, name), workdir)
+    sa_path = os.path.join(workdir, 'service-account.json')
+    if service_account or not os.path.exists(sa_path):
+        with open(sa_path, 'w') as f:
+            json.dump(service_account or {}, f)
+    os.environ.setdefault('DEEPSEEK_API_KEY', 'bench-key')
+    os.chdir(workdir)
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    return workdir
+
+
+def load_app(module_name):
+    """Импорт приложения по имени файла (app-cal, app-ds, TG-bot-DS ...)"""
+    return importlib.import_module(module_name)
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    if not ordered:
+        return {'count': 0}
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return {
+        'count': len(ordered),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3),
+        'p50_ms': round(pick(0.50) * 1000, 3),
+        'p95_ms': round(pick(0.95) * 1000, 3),
+        'p99_ms': round(pick(0.99) * 1000, 3),
+    }
+
+
+def dump(result):
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+def fake_service_account(token_uri):
+    """Сервисный аккаунт с настоящим RSA ключом, токен выдаёт заглушка"""
+    import rsa
+
+    _, private_key = rsa.newkeys(1024)
+    return {
+        'type': 'service_account',
+        'project_id': 'bench',
+        'private_key_id': 'bench',
+        'private_key': private_key.save_pkcs1().decode('ascii'),
+        'client_email': 'bench@bench.iam.gserviceaccount.com',
+        'client_id': '1',
+        'token_uri': token_uri,
+    }
+
+
+def read_rss(pid):
+    """Текущий и пиковый RSS процесса в МБ (Linux /proc)"""
+    result = {}
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith(('VmRSS:', 'VmHWM:')):
+                    key, value = line.split(':', 1)
+                    result['rss_mb' if key == 'VmRSS' else 'peak_rss_mb'] = round(int(value.split()[0]) / 1024, 1)
+    except OSError:
+        pass
+    return result
@@ -0,0 +1,278 @@
+"""Локальные заглушки DeepSeek, Google Calendar, Google Sheets и Telegram Bot API для бенчмарков.
+
+Можно запускать отдельно:
+
+    python bench/mock_servers.py --latency 0.3 --token-rate 40
+"""
+import argparse
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+PROPOSAL_TEMPLATE = '{name}, предлагаем запись к терапевту на {date} в 10-00'
+CLARIFY_REPLY = 'Уточните, пожалуйста, как давно появились симптомы?'
+
+
+class MockState:
+    """Общие настройки и счётчики вызовов всех заглушек"""
+
+    def __init__(self, latency=0.0, token_rate=0.0, completion_tokens=None, sheets_quota=None,
+                 connect_latency=0.0, idle_timeout=None):
+        self.latency = latency
+        # Цена нового соединения (TCP + TLS до api.deepseek.com) и закрытие простаивающих keep-alive
+        self.connect_latency = connect_latency
+        self.idle_timeout = idle_timeout
+        self.token_rate = token_rate
+        self.completion_tokens = completion_tokens
+        # Квота Sheets API: запросов на запись в минуту, None - без ограничения
+        self.sheets_quota = sheets_quota
+        self.sheets_writes = deque()
+        self.calls = Counter()
+        self.events = {}
+        self.sheets = {}
+        self.lock = threading.Lock()
+
+    def count(self, key):
+        with self.lock:
+            self.calls[key] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.calls)
+
+    def reset(self):
+        with self.lock:
+            self.calls.clear()
+            self.events.clear()
+            self.sheets.clear()
+            self.sheets_writes.clear()
+
+    def sheet_rows(self, spreadsheet_id):
+        with self.lock:
+            return sum(len(rows) for (sheet_id, _), rows in self.sheets.items() if sheet_id == spreadsheet_id)
+
+
+def _completion_text(payload):
+    """Ответ модели: предложение записи на шаге диагностики, иначе уточняющий вопрос"""
+    messages = payload.get('messages', [])
+    guide = messages[-1].get('content', '') if messages else ''
+    if 'предлагаем' in guide or 'Сгенерируй' in guide:
+        date = (datetime.now() + timedelta(days=1)).strftime('%d.%m.%Y')
+        return PROPOSAL_TEMPLATE.format(name='Пациент', date=date)
+    return CLARIFY_REPLY
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        self.timeout = self.state.idle_timeout
+        super().setup()
+        self.state.count('connections')
+        if self.state.connect_latency:
+            time.sleep(self.state.connect_latency)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        if not body:
+            return {}
+        try:
+            return json.loads(body)
+        except ValueError:
+            return {}
+
+    def _send_json(self, data, status=200):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/__stats':
+            return self._send_json(self.state.snapshot())
+        if self.path.startswith('/discovery/v1/apis/calendar/v3/rest'):
+            self.state.count('calendar.discovery')
+            return self._send_json(_calendar_discovery())
+        if self.path.endswith('/models'):
+            self.state.count('deepseek.models')
+            return self._send_json({'object': 'list', 'data': [{'id': 'deepseek-chat', 'object': 'model'}]})
+        self._send_json({'error': 'not found'}, 404)
+
+    def do_POST(self):
+        path = self.path.split('?', 1)[0]
+        if path.endswith('/chat/completions'):
+            return self._deepseek()
+        if path == '/token':
+            self._read_json()
+            self.state.count('google.token')
+            return self._send_json({'access_token': 'bench-token', 'expires_in': 3600, 'token_type': 'Bearer'})
+        match = re.match(r'^/calendar/v3/calendars/([^/]+)/events$', path)
+        if match:
+            return self._calendar_insert()
+        match = re.match(r'^/sheets/v4/spreadsheets/([^/]+)/values/([^/]+):append$', path)
+        if match:
+            return self._sheets_append(match.group(1), unquote(match.group(2)))
+        match = re.match(r'^/bot([^/]+)/(\w+)$', path)
+        if match:
+            return self._telegram(match.group(2))
+        self._send_json({'error': 'not found'}, 404)
+
+    def _deepseek(self):
+        payload = self._read_json()
+        self.state.count('deepseek.stream' if payload.get('stream') else 'deepseek.completion')
+        text = _completion_text(payload)
+        tokens = text.split()
+        if self.state.completion_tokens:
+            tokens = (tokens * (self.state.completion_tokens // max(1, len(tokens)) + 1))[:self.state.completion_tokens]
+        usage = {
+            'prompt_tokens': sum(len(m.get('content', '').split()) for m in payload.get('messages', [])),
+            'completion_tokens': len(tokens),
+        }
+        usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+
+        time.sleep(self.state.latency)
+        delay = 1.0 / self.state.token_rate if self.state.token_rate else 0.0
+
+        if not payload.get('stream'):
+            time.sleep(delay * len(tokens))
+            return self._send_json({
+                'id': f'chatcmpl-{uuid.uuid4().hex[:12]}',
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': payload.get('model', 'deepseek-chat'),
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': ' '.join(tokens)},
+                    'finish_reason': 'stop'
+                }],
+                'usage': usage
+            })
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        chunk_id = f'chatcmpl-{uuid.uuid4().hex[:12]}'
+        for i, token in enumerate(tokens):
+            chunk = {
+                'id': chunk_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': payload.get('model', 'deepseek-chat'),
+                'choices': [{'index': 0, 'delta': {'content': token if i == 0 else ' ' + token}, 'finish_reason': None}]
+            }
+            self.wfile.write(f'data: {json.dumps(chunk, ensure_ascii=False)}\n\n'.encode('utf-8'))
+            self.wfile.flush()
+            time.sleep(delay)
+        final = {
+            'id': chunk_id,
+            'object': 'chat.completion.chunk',
+            'created': int(time.time()),
+            'model': payload.get('model', 'deepseek-chat'),
+            'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}],
+            'usage': usage
+        }
+        self.wfile.write(f'data: {json.dumps(final)}\n\ndata: [DONE]\n\n'.encode('utf-8'))
+        self.wfile.flush()
+        self.close_connection = True
+
+    def _calendar_insert(self):
+        event = self._read_json()
+        self.state.count('calendar.insert')
+        event_id = event.get('id') or uuid.uuid4().hex
+        with self.state.lock:
+            duplicate = event_id in self.state.events
+            self.state.events.setdefault(event_id, event)
+        if duplicate:
+            self.state.count('calendar.conflict')
+            return self._send_json({'error': {'code': 409, 'message': 'The requested identifier already exists.'}}, 409)
+        self._send_json({**event, 'id': event_id, 'status': 'confirmed', 'kind': 'calendar#event'})
+
+    def _sheets_append(self, spreadsheet_id, range_name):
+        body = self._read_json()
+        now = time.monotonic()
+        with self.state.lock:
+            writes = self.state.sheets_writes
+            while writes and now - writes[0] >= 60:
+                writes.popleft()
+            over_quota = self.state.sheets_quota is not None and len(writes) >= self.state.sheets_quota
+            if not over_quota:
+                writes.append(now)
+                rows = body.get('values', [])
+                self.state.sheets.setdefault((spreadsheet_id, range_name), []).extend(rows)
+        if over_quota:
+            self.state.count('sheets.quota_exceeded')
+            return self._send_json({'error': {'code': 429, 'message': 'Quota exceeded', 'status': 'RESOURCE_EXHAUSTED'}}, 429)
+        self.state.count('sheets.append')
+        self._send_json({
+            'spreadsheetId': spreadsheet_id,
+            'updates': {'spreadsheetId': spreadsheet_id, 'updatedRange': range_name, 'updatedRows': len(rows)}
+        })
+
+    def _telegram(self, method):
+        self._read_json()
+        self.state.count(f'telegram.{method}')
+        if method != 'sendMessage':
+            return self._send_json({'ok': True, 'result': True})
+        self._send_json({'ok': True, 'result': {
+            'message_id': int(time.time() * 1000) % 10 ** 9,
+            'date': int(time.time()),
+            'chat': {'id': 1, 'type': 'private'},
+            'text': 'ok'
+        }})
+
+
+def _calendar_discovery():
+    import googleapiclient
+
+    path = os.path.join(os.path.dirname(googleapiclient.__file__), 'discovery_cache', 'documents', 'calendar.v3.json')
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def start_mock_server(state, host='127.0.0.1', port=0):
+    """Запускает одну заглушку на все три API в фоновом потоке"""
+    handler = type('MockHandler', (_Handler,), {'state': state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Заглушки DeepSeek, Calendar, Sheets и Telegram')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency', type=float, default=0.0, help='задержка до первого байта, с')
+    parser.add_argument('--token-rate', type=float, default=0.0, help='токенов в секунду, 0 - без задержки')
+    args = parser.parse_args()
+
+    server = start_mock_server(MockState(args.latency, args.token_rate), port=args.port)
+    base = f'http://127.0.0.1:{server.server_address[1]}'
+    print(f'DEEPSEEK_API_URL={base}/v1/chat/completions')
+    print(f'DEEPSEEK_BASE_URL={base}')
+    print(f'CALENDAR_API_ENDPOINT={base}/calendar/v3/')
+    print(f'SHEETS_API_ENDPOINT={base}/sheets/')
+    print(f'TELEGRAM_API_URL={base}/bot')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+"""Нагрузочный прогон записанных диалогов через приложения на локальных заглушках.
+
+Запускает заглушки DeepSeek/Calendar/Sheets/Telegram, поднимает приложение в
+отдельном процессе и воспроизводит bench/conversations.json с заданной
+конкурентностью. Результат - JSON для сравнения между коммитами:
+
+    python bench/run_bench.py --app app-cal --concurrency 8 --iterations 40 \\
+        --latency 0.2 --token-rate 50 --output bench-app-cal.json
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from common import ROOT, dump, fake_service_account, percentiles, prepare_workdir, read_rss
+from mock_servers import MockState, start_mock_server
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TG_SECRET = 'bench-secret'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_app(module, mock_base, workdir):
+    port = free_port()
+    env = dict(
+        os.environ,
+        DEEPSEEK_API_KEY='bench-key',
+        DEEPSEEK_API_URL=f'{mock_base}/v1/chat/completions',
+        DEEPSEEK_BASE_URL=mock_base,
+        CALENDAR_API_ENDPOINT=f'{mock_base}/calendar/v3/',
+        SHEETS_API_ENDPOINT=f'{mock_base}/sheets/',
+        SHEETS_FLUSH_INTERVAL='0.2',
+        BOOKINGS_SPREADSHEET_ID='bench-bookings',
+        ORDERS_SPREADSHEET_ID='bench-orders',
+        CALENDAR_ID='bench@group.calendar.google.com',
+        SERVICE_ACCOUNT_JSON=os.path.join(workdir, 'service-account.json'),
+        TELEGRAM_API_URL=f'{mock_base}/bot',
+        TELEGRAM_BOT_TOKEN='123:bench',
+        TELEGRAM_ADMIN_CHAT_ID='1',
+        WEBHOOK_SECRET=TG_SECRET,
+        LOG_FORMAT=os.getenv('LOG_FORMAT', 'json'),
+        # Все диалоги идут с одного IP: без ограничения частоты, если не задано явно
+        RATE_LIMIT_RPM=os.getenv('RATE_LIMIT_RPM', '0'),
+        # Без локального классификатора, если не задано явно: вызовы DeepSeek сравнимы между коммитами
+        SYMPTOM_CLASSIFIER=os.getenv('SYMPTOM_CLASSIFIER', ''),
+    )
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, 'serve_app.py'), module, str(port), '--workdir', workdir],
+        env=env, cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'{module} завершился при старте с кодом {process.returncode}')
+        try:
+            requests.get(f'{base}/metrics', timeout=1)
+            return process, base
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f'{module} не запустился за 60 с')
+
+
+class Recorder:
+    def __init__(self):
+        self.requests = []
+        self.conversations = []
+        self.booking_completion = []
+        self.errors = 0
+        self.bookings = 0
+        self.lock = threading.Lock()
+
+    def request(self, session, method, url, **kwargs):
+        start = time.perf_counter()
+        response = session.request(method, url, timeout=120, **kwargs)
+        # Для SSE время ответа включает чтение всего потока
+        _ = response.content
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.requests.append(elapsed)
+            if response.status_code >= 400:
+                self.errors += 1
+        return response
+
+    def finish(self, started, booked):
+        with self.lock:
+            self.conversations.append(time.perf_counter() - started)
+            self.bookings += int(booked)
+
+
+def replay_app_cal(base, conversation, recorder):
+    session = requests.Session()
+    started = time.perf_counter()
+    response = None
+    for message in conversation['turns']:
+        response = recorder.request(session, 'POST', f'{base}/chat', json={'message': message})
+        if response.status_code >= 400:
+            break
+    booked = response is not None and response.ok and 'error' not in response.json()
+    booking_id = response.json().get('booking_id') if booked else None
+    if booking_id:
+        # Подтверждение приходит сразу, событие в календаре создаётся в фоне
+        replied = time.perf_counter()
+        status = wait_booking(session, f'{base}/booking/{booking_id}')
+        booked = status == 'done'
+        with recorder.lock:
+            recorder.booking_completion.append(time.perf_counter() - replied)
+    recorder.finish(started, booked)
+
+
+def wait_booking(session, url, timeout=60):
+    deadline = time.monotonic() + timeout
+    status = None
+    while time.monotonic() < deadline:
+        status = session.get(url, timeout=10).json().get('status')
+        if status in ('done', 'failed'):
+            break
+        time.sleep(0.02)
+    return status
+
+
+def replay_app_ds(base, conversation, recorder):
+    session = requests.Session()
+    # Каждый диалог - отдельный пациент: одинаковые события разных клиентов не склеиваются
+    session.headers['X-API-Key'] = uuid.uuid4().hex
+    started = time.perf_counter()
+    messages = []
+    for message in conversation['chat']:
+        response = recorder.request(session, 'POST', f'{base}/chat', json={'message': message, 'messages': messages})
+        for line in response.text.splitlines():
+            if line.startswith('data: ') and '"done"' in line:
+                messages = json.loads(line[6:]).get('messages', messages)
+    response = recorder.request(session, 'POST', f'{base}/create_event', json=conversation['event'])
+    recorder.finish(started, response.ok)
+
+
+def replay_tg_bot(base, conversation, recorder):
+    session = requests.Session()
+    started = time.perf_counter()
+    response = recorder.request(
+        session, 'POST', f'{base}/order_webhook',
+        json={'order': conversation['order']}, headers={'X-Telegram-Secret': TG_SECRET}
+    )
+    recorder.finish(started, response.ok)
+
+
+REPLAYERS = {
+    'app-cal': replay_app_cal,
+    'app-ds': replay_app_ds,
+    'TG-bot-DS': replay_tg_bot,
+}
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def run(app, concurrency, iterations, latency, token_rate):
+    with open(os.path.join(HERE, 'conversations.json'), encoding='utf-8') as f:
+        conversations = json.load(f)[app]
+
+    state = MockState(latency=latency, token_rate=token_rate)
+    mock = start_mock_server(state)
+    mock_base = f'http://127.0.0.1:{mock.server_address[1]}'
+
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    prepare_workdir(workdir, fake_service_account(f'{mock_base}/token'))
+    process, base = start_app(app, mock_base, workdir)
+    try:
+        replay = REPLAYERS[app]
+        # Прогрев: один проход по всем диалогам без учёта в статистике
+        for conversation in conversations:
+            replay(base, conversation, Recorder())
+        state.reset()
+        rss_before = read_rss(process.pid)
+
+        recorder = Recorder()
+        jobs = [conversations[i % len(conversations)] for i in range(iterations)]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(lambda c: replay(base, c, recorder), jobs))
+        wall = time.perf_counter() - started
+        rss_after = read_rss(process.pid)
+        # Строки для Google Sheets уходят пачкой по SHEETS_FLUSH_INTERVAL
+        time.sleep(0.5)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+        mock.shutdown()
+
+    upstream = state.snapshot()
+    upstream_total = sum(upstream.values())
+    bookings = recorder.bookings
+    return {
+        'benchmark': 'replay',
+        'app': app,
+        'revision': git_revision(),
+        'config': {
+            'concurrency': concurrency,
+            'iterations': iterations,
+            'latency_s': latency,
+            'token_rate': token_rate,
+        },
+        'wall_s': round(wall, 3),
+        'throughput': {
+            'conversations_per_s': round(len(recorder.conversations) / wall, 2),
+            'requests_per_s': round(len(recorder.requests) / wall, 2),
+        },
+        'request_latency': percentiles(recorder.requests),
+        'conversation_latency': percentiles(recorder.conversations),
+        'booking_completion_latency': percentiles(recorder.booking_completion),
+        'errors': recorder.errors,
+        'bookings': bookings,
+        'rss': {'before': rss_before, 'after': rss_after},
+        'upstream_calls': upstream,
+        'upstream_calls_per_booking': round(upstream_total / bookings, 3) if bookings else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay-бенчмарк на локальных заглушках')
+    parser.add_argument('--app', choices=sorted(REPLAYERS), default='app-cal')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--iterations', type=int, default=40)
+    parser.add_argument('--latency', type=float, default=0.05, help='задержка DeepSeek до первого байта, с')
+    parser.add_argument('--token-rate', type=float, default=200.0, help='скорость генерации, токенов/с')
+    parser.add_argument('--output', help='куда записать JSON (по умолчанию stdout)')
+    parser.add_argument('--classifier', action='store_true', help='включить локальный подбор специалиста в app-cal')
+    args = parser.parse_args()
+    if args.classifier:
+        os.environ['SYMPTOM_CLASSIFIER'] = 'specialists.json'
+
+    result = run(args.app, args.concurrency, args.iterations, args.latency, args.token_rate)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    dump(result)
+
+
+if __name__ == '__main__':
+    main()
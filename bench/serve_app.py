@@ -0,0 +1,25 @@
+"""Запуск приложения из корня репозитория на заданном порту для бенчмарков.
+
+    python bench/serve_app.py app-cal 5001 --workdir /tmp/bench-xyz
+"""
+import argparse
+
+from werkzeug.serving import make_server
+
+from common import load_app, prepare_workdir
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Запуск приложения для бенчмарка')
+    parser.add_argument('module')
+    parser.add_argument('port', type=int)
+    parser.add_argument('--workdir')
+    args = parser.parse_args()
+
+    prepare_workdir(args.workdir)
+    app = load_app(args.module).create_app()
+    make_server('127.0.0.1', args.port, app, threaded=True).serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Шаги сценария записи без привязки к Flask.
+
+Общие для app-cal.py (диалог) и batch_triage.py (пакетная обработка анкет):
+нормализация текста, параметры генерации, локальный подбор специалиста и
+разбор предложения о записи.
+"""
+import logging
+import re
+
+APPOINTMENT_PATTERNS = {
+    'doctor': r'к\s+([а-яё\s]+?)\s+на',
+    'date': r'(\d{1,2}\.\d{1,2}\.\d{4})',
+    'time': r'в\s+(\d{1,2}-\d{2})'
+}
+
+
+def normalize_text(text):
+    replacements = {
+        'нз': 'низ', 'врaч': 'врач', 'чеез': 'через',
+        'завтрак': 'завтра', 'симпотомы': 'симптомы'
+    }
+    for wrong, correct in replacements.items():
+        text = text.replace(wrong, correct)
+    return text.lower()
+
+
+def generation_profile(prompts, step):
+    """Параметры генерации для шага: default + переопределения шага"""
+    profiles = prompts['medical_assistant'].get('generation', {})
+    profile = dict(profiles.get('default', {}))
+    profile.update(profiles.get(step, {}))
+    return profile
+
+
+def completion_payload(messages, profile):
+    return {
+        'model': profile.get('model', 'deepseek-chat'),
+        'messages': messages,
+        **{k: v for k, v in profile.items() if k != 'model'}
+    }
+
+
+def reply_text(response_json):
+    return response_json.get('choices', [{}])[0].get('message', {}).get('content', '')
+
+
+def is_proposal(text):
+    return 'предлагаем' in text.lower()
+
+
+def local_proposal(classifier, prompts, name, symptoms):
+    """(текст предложения, специалист, уверенность) или None, если решать должна LLM"""
+    match = classifier.classify(' '.join(symptoms))
+    if match is None:
+        return None
+
+    doctor, confidence = match
+    date, time = classifier.next_slot(doctor)
+    text = prompts.render(
+        'medical_assistant', 'local_proposal',
+        name=name, doctor=doctor, date=date, time=time
+    )
+    return text, doctor, confidence
+
+
+def extract_appointment_details(response):
+    try:
+        normalized = normalize_text(response)
+
+        details = {}
+        for key, pattern in APPOINTMENT_PATTERNS.items():
+            match = re.search(pattern, normalized)
+            if not match:
+                raise ValueError(f"Не найден {key}")
+            details[key] = match.group(1).strip()
+
+        return details
+    except Exception as e:
+        logging.error(f"Ошибка извлечения: {str(e)}")
+        return None
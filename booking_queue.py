@@ -0,0 +1,299 @@
+"""Фоновая очередь записи в календарь.
+
+Подтверждение пациента сразу получает booking_id, а вставка события в
+Google Calendar выполняется пулом потоков с повторами и экспоненциальной
+задержкой. Необязательно состояние хранится в SQLite и переживает рестарт.
+"""
+import heapq
+import json
+import logging
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+PENDING = 'pending'
+RUNNING = 'running'
+RETRYING = 'retrying'
+DONE = 'done'
+FAILED = 'failed'
+
+FINAL_STATUSES = (DONE, FAILED)
+
+
+class PermanentError(Exception):
+    """Ошибка, которую повтор не исправит (неверные данные, 4xx): заявка сразу получает failed"""
+
+
+def _process_alive(owner):
+    """owner = host:pid; процесс на другом хосте считаем живым"""
+    if not owner:
+        return False
+    host, _, pid = owner.rpartition(':')
+    if host != socket.gethostname():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except (OSError, ValueError):
+        return False
+    return True
+
+
+class BookingStore:
+    """Хранилище заявок в SQLite. Соединение одно на процесс, доступ под блокировкой"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS bookings (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                owner TEXT
+            )
+        ''')
+        self._conn.commit()
+
+    def save(self, job, owner):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO bookings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (job['id'], job['status'], job['attempts'], json.dumps(job['payload'], ensure_ascii=False),
+                 json.dumps(job['result'], ensure_ascii=False), job['error'],
+                 job['created_at'], job['updated_at'], owner)
+            )
+            self._conn.commit()
+
+    def claim(self, booking_id, previous_owner, owner):
+        """Атомарно забирает заявку у завершившегося процесса; False - её уже забрали"""
+        with self._lock:
+            cursor = self._conn.execute(
+                'UPDATE bookings SET owner = ? WHERE id = ? AND owner IS ?',
+                (owner, booking_id, previous_owner)
+            )
+            self._conn.commit()
+        return cursor.rowcount == 1
+
+    def load(self, booking_id):
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM bookings WHERE id = ?', (booking_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def unfinished(self):
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT * FROM bookings WHERE status NOT IN (?, ?)', FINAL_STATUSES
+            ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    @staticmethod
+    def _row_to_job(row):
+        return {
+            'id': row[0],
+            'status': row[1],
+            'attempts': row[2],
+            'payload': json.loads(row[3]),
+            'result': json.loads(row[4]) if row[4] else None,
+            'error': row[5],
+            'created_at': row[6],
+            'updated_at': row[7],
+            'owner': row[8],
+        }
+
+
+class BookingQueue:
+    """Очередь заявок с пулом потоков и повторами.
+
+    handler(payload) должен вернуть словарь результата или бросить исключение;
+    после max_attempts неудач или PermanentError заявка получает статус failed.
+    """
+
+    def __init__(self, handler, workers=2, max_attempts=5, base_delay=1.0, max_delay=60.0,
+                 db_path=None, keep_finished=3600.0):
+        self.handler = handler
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.keep_finished = keep_finished
+        self.db_path = db_path
+        self.store = None
+        self.owner = None
+
+        self._jobs = {}
+        self._heap = []
+        self._cond = threading.Condition()
+        self._threads = []
+        self._pid = None
+        self._stopped = False
+
+    def _ensure_workers(self):
+        # Потоки и соединение SQLite не переживают fork (gunicorn --preload),
+        # поэтому всё поднимается лениво в процессе, который обрабатывает заявки
+        if self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.owner = f'{socket.gethostname()}:{self._pid}'
+            self._jobs.clear()
+            self._heap.clear()
+            if self.db_path:
+                self.store = BookingStore(self.db_path)
+                self._recover()
+            self._threads = [
+                threading.Thread(target=self._worker, name=f'booking-worker-{i}', daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def _recover(self):
+        # Незавершённые заявки упавших процессов возвращаются в очередь
+        for job in self.store.unfinished():
+            owner = job.pop('owner')
+            # Заявки живых процессов (другие воркеры gunicorn) не трогаем
+            if owner != self.owner and _process_alive(owner):
+                continue
+            if self.store.claim(job['id'], owner, self.owner):
+                job['status'] = PENDING
+                self._jobs[job['id']] = job
+                heapq.heappush(self._heap, (time.time(), job['id']))
+        if self._jobs:
+            logging.info(f"Восстановлено заявок на запись: {len(self._jobs)}")
+
+    def submit(self, payload, booking_id=None):
+        """Повторная заявка с уже известным booking_id не ставится в очередь второй раз.
+
+        Исключение - заявка в статусе failed: она ставится в очередь заново с нуля попыток.
+        """
+        self._ensure_workers()
+        if booking_id is not None:
+            existing = self.get(booking_id)
+            if existing is not None and existing['status'] != FAILED:
+                return booking_id
+        now = time.time()
+        job = {
+            'id': booking_id or uuid.uuid4().hex,
+            'status': PENDING,
+            'attempts': 0,
+            'payload': payload,
+            'result': None,
+            'error': None,
+            'created_at': now,
+            'updated_at': now,
+        }
+        with self._cond:
+            current = self._jobs.get(job['id'])
+            if current is not None and current['status'] != FAILED:
+                return job['id']
+            self._prune(now)
+            self._jobs[job['id']] = job
+            heapq.heappush(self._heap, (now, job['id']))
+            self._cond.notify()
+        self._persist(job)
+        return job['id']
+
+    def get(self, booking_id):
+        self._ensure_workers()
+        with self._cond:
+            job = self._jobs.get(booking_id)
+            if job is not None:
+                return dict(job)
+        return self.store.load(booking_id) if self.store else None
+
+    def start(self):
+        self._ensure_workers()
+
+    def shutdown(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=5)
+
+    def _persist(self, job):
+        if self.store:
+            try:
+                self.store.save(job, self.owner)
+            except Exception as e:
+                logging.error(f"Ошибка сохранения заявки {job['id']}: {str(e)}")
+
+    def _prune(self, now):
+        expired = [
+            booking_id for booking_id, job in self._jobs.items()
+            if job['status'] in FINAL_STATUSES and now - job['updated_at'] > self.keep_finished
+        ]
+        for booking_id in expired:
+            del self._jobs[booking_id]
+
+    def _next_job(self):
+        with self._cond:
+            while not self._stopped:
+                now = time.time()
+                if self._heap and self._heap[0][0] <= now:
+                    _, booking_id = heapq.heappop(self._heap)
+                    job = self._jobs.get(booking_id)
+                    if job is None or job['status'] in FINAL_STATUSES:
+                        continue
+                    job['status'] = RUNNING
+                    job['attempts'] += 1
+                    job['updated_at'] = now
+                    return job
+                self._cond.wait(self._heap[0][0] - now if self._heap else None)
+        return None
+
+    def _backoff(self, attempts):
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            self._persist(job)
+
+            permanent = False
+            try:
+                result = self.handler(job['payload'])
+                error = None
+            except PermanentError as e:
+                result, error, permanent = None, str(e), True
+            except Exception as e:
+                result, error = None, str(e)
+
+            with self._cond:
+                job['updated_at'] = time.time()
+                if error is None:
+                    job['status'] = DONE
+                    job['result'] = result
+                    job['error'] = None
+                elif permanent or job['attempts'] >= self.max_attempts:
+                    job['status'] = FAILED
+                    job['error'] = error
+                else:
+                    job['status'] = RETRYING
+                    job['error'] = error
+                    heapq.heappush(self._heap, (job['updated_at'] + self._backoff(job['attempts']), job['id']))
+                    self._cond.notify()
+            self._persist(job)
+
+            if permanent:
+                logging.warning(f"Заявка {job['id']}: ошибка без повтора: {error}")
+            elif error is not None:
+                logging.warning(
+                    f"Заявка {job['id']}: попытка {job['attempts']}/{self.max_attempts} не удалась: {error}"
+                )
@@ -1,11 +1,9 @@
 import os
 import ssl
 import certifi
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from dotenv import load_dotenv
+import services
 
 # Установка пути к сертификатам
 os.environ["REQUESTS_CA_BUNDLE"] = certifi.where()
@@ -20,22 +18,8 @@ SPREADSHEET_ID = os.getenv("SPREADSHEET_ID")
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
 
 def main():
-    creds = None
-    if os.path.exists('token.json'):
-        creds = Credentials.from_authorized_user_file('token.json', SCOPES)
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            try:
-                creds.refresh(Request())
-            except Exception as e:
-                print(f"Ошибка обновления токена: {e}")
-                flow = InstalledAppFlow.from_client_secrets_file('credentials.json', SCOPES)
-                creds = flow.run_local_server(port=0)
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file('credentials.json', SCOPES)
-            creds = flow.run_local_server(port=0)
-        with open('token.json', 'w') as token:
-            token.write(creds.to_json())
+    # Обновление токена и повторная авторизация при отозванном refresh_token - в oauth_credentials.py
+    creds = services.oauth_credentials('token.json', SCOPES)
 
     service = build('sheets', 'v4', credentials=creds)
     sheet = service.spreadsheets()
@@ -0,0 +1,29 @@
+# Пример: gunicorn -c gunicorn.conf.py 'app-cal:create_app()'
+#
+# preload_app: приложение импортируется и собирается один раз в мастере,
+# воркеры получают его через fork. Клиенты HTTP, Google и Telegram, поток
+# логирования и экспорт трасс пересоздаются в каждом воркере.
+#
+# По умолчанию один воркер с потоками: сессии app-cal, метрики и (без
+# BOOKING_DB / RATE_LIMIT_DB) заявки и лимиты хранятся в памяти процесса.
+# Приложение с таким состоянием не запустится при GUNICORN_WORKERS > 1.
+import os
+
+bind = os.getenv('GUNICORN_BIND', '127.0.0.1:5000')
+workers = int(os.getenv('GUNICORN_WORKERS', 1))
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+preload_app = True
+
+
+def post_fork(server, worker):
+    # services сбрасывается и через os.register_at_fork, здесь - явно для наглядности
+    import services
+
+    services.reset_after_fork()
+
+
+def post_worker_init(worker):
+    # Приложение уже загружено (в мастере или в воркере); ошибка здесь останавливает gunicorn
+    import services
+
+    services.check_workers(worker.cfg.workers)
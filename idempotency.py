@@ -0,0 +1,192 @@
+"""Идемпотентная вставка событий в Google Calendar.
+
+Детерминированный id события выводится только из ключа, который прислал
+клиент (заголовок Idempotency-Key) или который принадлежит одной сессии
+(app-cal: сессия + врач + слот), и всегда ограничен клиентом: API-ключом,
+cookie session_id или IP. Повтор с тем же ключом отвечается из кэша
+результатов, а 409 от Google (событие с таким id уже есть) считается успехом.
+
+Без ключа id события случайный: одинаковые события разных людей не
+склеиваются, а Calendar не хранит занятый id после удаления события.
+Двойной клик и ретрай после таймаута гасит короткий кэш по отпечатку
+запроса (клиент + поля события).
+"""
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import metrics
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+# Сколько секунд повтор запроса без Idempotency-Key считается тем же запросом
+FINGERPRINT_TTL = 30.0
+
+CALENDAR_INSERTS = metrics.REGISTRY.counter(
+    'calendar_idempotent_inserts_total', 'Вставки событий с ключом идемпотентности', ('result',)
+)
+
+
+def make_key(*parts):
+    """Ключ из частей запроса. Hex-алфавит подходит для id события Calendar (a-v, 0-9)"""
+    raw = '\x1f'.join('' if part is None else str(part) for part in parts)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+
+
+def new_event_id():
+    """Случайный id события в алфавите Calendar"""
+    return uuid.uuid4().hex
+
+
+def client_scope(req):
+    """Клиент запроса: хэш X-API-Key, cookie session_id или IP"""
+    api_key = req.headers.get('X-API-Key')
+    if api_key:
+        return 'key:' + hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+    session_id = req.cookies.get('session_id')
+    if session_id:
+        return 'session:' + session_id[:64]
+    return f'ip:{req.remote_addr}'
+
+
+def header_key(req):
+    """Ключ из заголовка Idempotency-Key в пределах клиента или None, если заголовка нет"""
+    header = req.headers.get(IDEMPOTENCY_HEADER)
+    if not header:
+        return None
+    return make_key('header', client_scope(req), header.strip())
+
+
+def request_key(req, *parts):
+    """(ключ, детерминирован ли id события) для insert_event.
+
+    С Idempotency-Key ключ и есть id события. Без него ключ - отпечаток
+    запроса для короткого кэша, а id события случайный.
+    """
+    key = header_key(req)
+    if key:
+        return key, True
+    return make_key('request', client_scope(req), *parts), False
+
+
+class ResultCache:
+    """Кэш результатов с TTL. Одновременные запросы с одним ключом ждут первый"""
+
+    def __init__(self, ttl=600.0, max_size=1000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._results = OrderedDict()
+        self._inflight = {}
+
+    def get(self, key):
+        with self._lock:
+            return self._get(key, time.monotonic())
+
+    def _get(self, key, now):
+        entry = self._results.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < now:
+            del self._results[key]
+            return None
+        return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._results[key] = (time.monotonic() + self.ttl, value)
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_size:
+                self._results.popitem(last=False)
+
+    def run(self, key, func):
+        """(результат, True если из кэша). Ошибки не кэшируются"""
+        while True:
+            with self._lock:
+                value = self._get(key, time.monotonic())
+                if value is not None:
+                    return value, True
+                event = self._inflight.get(key)
+                if event is None:
+                    event = self._inflight[key] = threading.Event()
+                    break
+            # Такой же запрос уже выполняется - ждём его результат
+            event.wait(30)
+
+        try:
+            value = func()
+            self.put(key, value)
+            return value, False
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+
+RESULTS = ResultCache()
+# Повторы запросов без Idempotency-Key: только двойной клик и ретрай после таймаута
+RECENT = ResultCache(ttl=FINGERPRINT_TTL)
+
+
+def _http_status(error):
+    status = getattr(getattr(error, 'resp', None), 'status', None)
+    return int(status) if status is not None else None
+
+
+def is_duplicate_error(error):
+    return _http_status(error) == 409
+
+
+def is_transient_error(error):
+    """Имеет ли смысл повтор: 5xx, 408, 429, таймауты и сетевые ошибки; 4xx и неверные данные - нет"""
+    status = _http_status(error)
+    if status is not None:
+        return status in (408, 429) or status >= 500
+    if isinstance(error, (OSError, TimeoutError)):
+        return True
+    # Сетевые ошибки httplib2 и обновления токена не наследуют OSError
+    from google.auth.exceptions import TransportError
+    import httplib2
+
+    return isinstance(error, (TransportError, httplib2.HttpLib2Error))
+
+
+def insert_event(service, calendar_id, event, key, headers=None, deterministic=True, cache=None):
+    """Вставляет событие не более одного раза на ключ, возвращает событие Calendar.
+
+    deterministic=True - id события равен key (ключ клиента или сессии), иначе
+    key - отпечаток запроса, а id события случайный.
+    """
+    if cache is None:
+        cache = RESULTS if deterministic else RECENT
+
+    def call():
+        start = time.perf_counter()
+        event_id = key if deterministic else new_event_id()
+        insert_request = service.events().insert(calendarId=calendar_id, body={**event, 'id': event_id})
+        if headers:
+            insert_request.headers.update(headers)
+        try:
+            created = insert_request.execute()
+        except Exception as e:
+            if not is_duplicate_error(e):
+                metrics.observe_dependency('calendar', 'insert', time.perf_counter() - start, 'error')
+                raise
+            # Событие уже создано предыдущей попыткой (повтор после таймаута или другой воркер)
+            metrics.observe_dependency('calendar', 'insert', time.perf_counter() - start, 'conflict')
+            CALENDAR_INSERTS.inc(result='duplicate')
+            logging.info(f"Событие {event_id} уже существует, повтор вставки пропущен")
+            return {'id': event_id, 'duplicate': True}
+
+        metrics.observe_dependency('calendar', 'insert', time.perf_counter() - start)
+        CALENDAR_INSERTS.inc(result='created')
+        return created
+
+    result, cached = cache.run(key, call)
+    if cached:
+        CALENDAR_INSERTS.inc(result='cached')
+    return result
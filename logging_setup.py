@@ -0,0 +1,244 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Стандартные атрибуты LogRecord, всё остальное считаем полями из extra=
+RESERVED_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+# Поля extra=, которые никогда не пишутся в лог как есть
+SENSITIVE_FIELDS = frozenset({'patient_name', 'symptoms', 'patient_info', 'message_text'})
+
+REDACTED = '[скрыто]'
+
+PII_PATTERNS = (
+    # Строки описания события календаря и подобные: "Пациент: ...", "Симптомы: ..."
+    (re.compile(r'(Пациент|Симптомы|Имя)\s*:\s*[^\n,;]+', re.IGNORECASE), r'\1: ' + REDACTED),
+    # Полное имя: два слова с заглавной кириллической буквы подряд
+    (re.compile(r'\b[А-ЯЁ][а-яё]+(?:\s+[А-ЯЁ][а-яё]+){1,2}\b'), REDACTED),
+    (re.compile(r'[\w.+-]+@[\w-]+\.[\w.]+'), REDACTED),
+    # Телефон: +7/8 и 10 цифр с разделителями или без. Цифры внутри id, uuid и hex не задеваются
+    (re.compile(r'(?<![\w-])(?:\+7|8)[\s(-]*\d{3}[\s)-]*\d{3}[\s-]*\d{2}[\s-]*\d{2}(?![\w-])'), REDACTED),
+)
+
+# Значения пациента текущего запроса (имя и симптомы как их ввели): скрываются
+# в любом регистре и без подписи "Пациент:" - шаблонами такой текст не поймать
+_sensitive = contextvars.ContextVar('log_sensitive_values', default=None)
+
+# Короче не скрываем: "да", "нет" и т.п. испортили бы все сообщения
+MIN_SENSITIVE_LENGTH = 3
+
+
+@contextmanager
+def sensitive_values(*values):
+    """Сообщения, записанные внутри блока, не содержат values"""
+    values = sorted({v.strip() for v in values if v and len(v.strip()) >= MIN_SENSITIVE_LENGTH}, key=len, reverse=True)
+    pattern = re.compile('|'.join(re.escape(v) for v in values), re.IGNORECASE) if values else None
+    token = _sensitive.set(pattern)
+    try:
+        yield
+    finally:
+        _sensitive.reset(token)
+
+
+def redact(text):
+    for pattern, replacement in PII_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+class RedactingFilter(logging.Filter):
+    """Удаляет персональные данные пациента. Работает в потоке QueueListener"""
+
+    def filter(self, record):
+        record.msg = redact(record.getMessage())
+        record.args = None
+        for field in SENSITIVE_FIELDS.intersection(vars(record)):
+            setattr(record, field, REDACTED)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает первые burst сообщений из одного места кода за окно, дальше - каждое rate-е.
+
+    WARNING и выше не сэмплируются никогда.
+    """
+
+    def __init__(self, burst=20, rate=10, window=60.0):
+        super().__init__()
+        self.burst = burst
+        self.rate = max(1, rate)
+        self.window = window
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            started, seen = self._counters.get(key, (now, 0))
+            if now - started > self.window:
+                started, seen = now, 0
+            seen += 1
+            self._counters[key] = (started, seen)
+        return seen <= self.burst or (seen - self.burst) % self.rate == 0
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RESERVED_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc_info'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue, redact_values=True):
+        super().__init__(log_queue)
+        self.redact_values = redact_values
+
+    def prepare(self, record):
+        # Форматирование и редакция выполняются в потоке слушателя,
+        # здесь только фиксируем текст сообщения, чтобы не держать ссылки на args
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        # Контекст запроса есть только в потоке вызывающего, слушателю он не виден
+        pattern = _sensitive.get() if self.redact_values else None
+        if pattern is not None:
+            record.msg = pattern.sub(REDACTED, record.msg)
+            if record.exc_text:
+                record.exc_text = pattern.sub(REDACTED, record.exc_text)
+        return record
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    def __init__(self, log_queue, *handlers, redactor=None):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.redactor = redactor
+
+    def prepare(self, record):
+        # Редакция один раз на запись, до раздачи по обработчикам
+        if self.redactor:
+            self.redactor.filter(record)
+        return record
+
+    def stop(self):
+        # Повторная остановка (вручную и из atexit) не должна падать
+        if self._thread is not None:
+            super().stop()
+
+    def restart_in_child(self):
+        # Поток слушателя не переживает fork (gunicorn --preload), запускаем заново
+        if self._thread is not None:
+            self._thread = None
+            self.handlers = tuple(_per_process(handler) for handler in self.handlers)
+            self.start()
+
+
+def process_log_file(log_file, pid=None):
+    """app.log -> app.<pid>.log: у каждого воркера свой файл и своя ротация"""
+    root, ext = os.path.splitext(log_file)
+    return f'{root}.{pid or os.getpid()}{ext}'
+
+
+def _per_process(handler):
+    # Ротация по размеру из нескольких процессов в один файл теряет и рвёт строки
+    if not isinstance(handler, logging.handlers.RotatingFileHandler):
+        return handler
+    replacement = logging.handlers.RotatingFileHandler(
+        process_log_file(handler.baseFilename),
+        maxBytes=handler.maxBytes,
+        backupCount=handler.backupCount,
+        encoding=handler.encoding
+    )
+    replacement.setFormatter(handler.formatter)
+    replacement.setLevel(handler.level)
+    # Дескриптор унаследован от мастера, закрываем только копию воркера
+    handler.close()
+    return replacement
+
+
+_active_listener = None
+
+
+def _restart_listener():
+    if _active_listener is not None:
+        _active_listener.restart_in_child()
+
+
+os.register_at_fork(after_in_child=_restart_listener)
+
+
+def setup_logging(log_file='app.log', level=logging.INFO):
+    """Настраивает неблокирующее логирование: QueueHandler -> QueueListener -> файл/консоль.
+
+    Настройки из окружения: LOG_FORMAT (json|text), LOG_MAX_BYTES, LOG_BACKUP_COUNT,
+    LOG_SAMPLE_BURST, LOG_SAMPLE_RATE, LOG_REDACT (true|false).
+
+    После fork (воркеры gunicorn --preload) каждый процесс пишет в свой файл
+    app.<pid>.log, мастер - в log_file.
+    """
+    if os.getenv('LOG_FORMAT', 'json').lower() == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(logging.handlers.RotatingFileHandler(
+            log_file,
+            maxBytes=int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024)),
+            backupCount=int(os.getenv('LOG_BACKUP_COUNT', 5)),
+            encoding='utf-8'
+        ))
+
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    redact_enabled = os.getenv('LOG_REDACT', 'true').lower() == 'true'
+    log_queue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue, redact_values=redact_enabled)
+    queue_handler.addFilter(SamplingFilter(
+        burst=int(os.getenv('LOG_SAMPLE_BURST', 20)),
+        rate=int(os.getenv('LOG_SAMPLE_RATE', 10))
+    ))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    global _active_listener
+    if _active_listener is not None:
+        _active_listener.stop()
+
+    listener = _QueueListener(log_queue, *handlers, redactor=RedactingFilter() if redact_enabled else None)
+    listener.start()
+    atexit.register(listener.stop)
+    _active_listener = listener
+    return listener
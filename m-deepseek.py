@@ -2,6 +2,7 @@ from flask import Flask, request, jsonify
 import requests
 import requests
 import os
+import logging
 from dotenv import load_dotenv
 
 # Загрузка переменных окружения
@@ -95,7 +96,8 @@ def chat():
             return jsonify({'error': 'Message too long'}), 400
 
         response = query_deepseek(message)
-        print(f"Response from DeepSeek API: {response}")  # Логирование в консоль сервера
+        # Полный ответ не пишем: только идентификатор и расход токенов
+        logging.info(f"Response from DeepSeek API: id={response.get('id')}, usage={response.get('usage')}")
         return jsonify(response)
 
     except Exception as e:
@@ -1,9 +1,7 @@
 import os
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from dotenv import load_dotenv
+import services
 
 load_dotenv()
 SECRET_KEY = os.getenv("FLASK_SECRET_KEY")
@@ -12,17 +10,8 @@ SPREADSHEET_ID = os.getenv("SPREADSHEET_ID")  # Убедитесь, что в .e
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
 
 def main():
-    creds = None
-    if os.path.exists('token.json'):
-        creds = Credentials.from_authorized_user_file('token.json', SCOPES)
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file('credentials.json', SCOPES)
-            creds = flow.run_local_server(port=0)
-        with open('token.json', 'w') as token:
-            token.write(creds.to_json())
+    # Токен из token.json держится в памяти и обновляется заранее, с блокировкой между процессами
+    creds = services.oauth_credentials('token.json', SCOPES)
 
     # Инициализация service ВНЕ условий
     service = build('sheets', 'v4', credentials=creds)
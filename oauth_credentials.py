@@ -0,0 +1,162 @@
+"""Общий кэш OAuth-токена пользователя (token.json) для скриптов Google Sheets.
+
+Токен хранится в памяти и обновляется фоновым потоком заранее, до истечения.
+Обновление между процессами согласовано файловой блокировкой: процесс,
+получивший блокировку, сначала перечитывает token.json - если его уже обновил
+другой процесс, запрос к Google не делается. Файл переписывается атомарно.
+Интерактивный InstalledAppFlow запускается только если токена нет или
+refresh_token отозван.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """Межпроцессная блокировка на файле рядом с token.json"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, 'a+')
+        if fcntl:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        else:
+            self._file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()
+        self._file = None
+
+
+def _seconds_left(credentials):
+    if credentials is None or not credentials.token:
+        return 0.0
+    if credentials.expiry is None:
+        return float('inf')
+    # google-auth хранит expiry как naive UTC
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    return (credentials.expiry - now).total_seconds()
+
+
+class CredentialManager:
+    """Готовые Credentials за O(1): get() не трогает диск, пока токен действителен"""
+
+    def __init__(self, token_path, scopes, client_secrets='credentials.json',
+                 refresh_margin=300.0, interactive=True):
+        self.token_path = token_path
+        self.scopes = list(scopes)
+        self.client_secrets = client_secrets
+        self.refresh_margin = refresh_margin
+        self.interactive = interactive
+        self.lock_path = f'{token_path}.lock'
+
+        self._credentials = None
+        # Срок действия по monotonic: проверка в get() без разбора дат
+        self._valid_until = 0.0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def get(self):
+        if time.monotonic() < self._valid_until:
+            return self._credentials
+        # Первое обращение или фоновое обновление не успело/не смогло
+        with self._lock:
+            if self._credentials is None or _seconds_left(self._credentials) <= self.refresh_margin:
+                self._set(self._refresh_shared(self.interactive))
+            self._start_refresher()
+            return self._credentials
+
+    def _set(self, credentials):
+        self._credentials = credentials
+        self._valid_until = time.monotonic() + min(_seconds_left(credentials), 10 ** 9)
+
+    def _start_refresher(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._refresh_loop, name='oauth-refresh', daemon=True)
+            self._thread.start()
+
+    def _refresh_loop(self):
+        while True:
+            delay = _seconds_left(self._credentials) - self.refresh_margin
+            if delay > 0:
+                self._wakeup.wait(min(delay, 3600))
+                self._wakeup.clear()
+                continue
+            try:
+                # Браузерную авторизацию из фона не запускаем: её сделает get() в потоке вызывающего
+                with self._lock:
+                    self._set(self._refresh_shared(interactive=False))
+            except Exception as e:
+                logging.error(f"Ошибка фонового обновления OAuth токена: {str(e)}")
+                self._wakeup.wait(30)
+                self._wakeup.clear()
+
+    def _load_file(self):
+        from google.oauth2.credentials import Credentials
+
+        if not os.path.exists(self.token_path):
+            return None
+        return Credentials.from_authorized_user_file(self.token_path, self.scopes)
+
+    def _save_file(self, credentials):
+        tmp_path = f'{self.token_path}.tmp'
+        with open(tmp_path, 'w') as token:
+            token.write(credentials.to_json())
+        os.replace(tmp_path, self.token_path)
+
+    def _refresh_shared(self, interactive):
+        """Обновление под файловой блокировкой: один процесс обновляет, остальные читают результат"""
+        from google.auth.exceptions import RefreshError
+        from google.auth.transport.requests import Request
+
+        with FileLock(self.lock_path):
+            credentials = self._load_file()
+            if _seconds_left(credentials) > self.refresh_margin:
+                # Токен уже обновил другой процесс
+                return credentials
+
+            if credentials and credentials.refresh_token:
+                try:
+                    start = time.perf_counter()
+                    credentials.refresh(Request())
+                    logging.info(f"OAuth токен обновлён за {time.perf_counter() - start:.2f} с")
+                except RefreshError as e:
+                    logging.error(f"Ошибка обновления токена: {str(e)}")
+                    credentials = self._authorize(interactive)
+            else:
+                credentials = self._authorize(interactive)
+
+            self._save_file(credentials)
+            return credentials
+
+    def _authorize(self, interactive):
+        if not interactive:
+            raise RuntimeError(f"Нет действительного токена в {self.token_path}, нужна авторизация")
+        from google_auth_oauthlib.flow import InstalledAppFlow
+
+        flow = InstalledAppFlow.from_client_secrets_file(self.client_secrets, self.scopes)
+        return flow.run_local_server(port=0)
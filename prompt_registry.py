@@ -0,0 +1,166 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from string import Template
+
+# Ключи, без которых приложение записи не может работать
+REQUIRED_KEYS = {
+    'medical_assistant': (
+        'system', 'ask_symptoms', 'confirmation', 'booking_pending', 'reschedule',
+        'reschedule_confirm', 'local_proposal', 'name_validation', 'diagnosis_guide',
+        'clarification_guide'
+    ),
+    'errors': (
+        'invalid_format', 'empty_message', 'long_message', 'api_error',
+        'parse_error', 'calendar_error', 'server_error', 'invalid_time_format',
+        'booking_not_found'
+    )
+}
+
+# Поля, которые используются как системные инструкции к шагу
+GUIDE_KEYS = ('diagnosis_guide', 'clarification_guide')
+
+
+class PromptError(ValueError):
+    pass
+
+
+class FrozenDict(dict):
+    """Неизменяемый dict: разделяется между сессиями и сериализуется json как обычный"""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("Промпты доступны только для чтения")
+
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __hash__(self):
+        return id(self)
+
+
+def freeze(value):
+    if isinstance(value, dict):
+        return FrozenDict((k, freeze(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+class PromptSnapshot:
+    """Проверенная и предкомпилированная версия prompts.json"""
+
+    def __init__(self, raw, version):
+        validate(raw)
+        self.version = version
+        self.data = freeze(raw)
+        assistant = self.data['medical_assistant']
+
+        # Общий префикс диалога: один кортеж на все сессии вместо копии на каждую
+        self.system_prefix = assistant['system']
+        self.guides = FrozenDict(
+            (key, FrozenDict(role='system', content=assistant[key]))
+            for key in GUIDE_KEYS
+        )
+        self.templates = {
+            (section, key): Template(text)
+            for section, values in self.data.items() if isinstance(values, dict)
+            for key, text in values.items() if isinstance(text, str)
+        }
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def build_prompt(self, history, guide_key):
+        return [*self.system_prefix, *history, self.guides[guide_key]]
+
+    def render(self, section, key, **values):
+        return self.templates[(section, key)].substitute(values)
+
+
+def validate(raw):
+    if not isinstance(raw, dict):
+        raise PromptError("prompts.json должен содержать объект")
+
+    for section, keys in REQUIRED_KEYS.items():
+        values = raw.get(section)
+        if not isinstance(values, dict):
+            raise PromptError(f"Нет раздела {section}")
+        missing = [key for key in keys if key not in values]
+        if missing:
+            raise PromptError(f"В разделе {section} нет ключей: {', '.join(missing)}")
+
+    system = raw['medical_assistant']['system']
+    if not isinstance(system, list) or not all(
+        isinstance(m, dict) and m.get('role') and isinstance(m.get('content'), str)
+        for m in system
+    ):
+        raise PromptError("medical_assistant.system должен быть списком сообщений role/content")
+
+    for section, values in raw.items():
+        if not isinstance(values, dict):
+            continue
+        for key, text in values.items():
+            if isinstance(text, str) and not Template(text).is_valid():
+                raise PromptError(f"Некорректный шаблон {section}.{key}")
+
+    for step, profile in raw['medical_assistant'].get('generation', {}).items():
+        if not isinstance(profile, dict):
+            raise PromptError(f"Профиль генерации {step} должен быть объектом")
+
+
+class PromptRegistry:
+    """Реестр промптов с горячей перезагрузкой по mtime файла"""
+
+    def __init__(self, path='prompts.json', check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked_at = 0.0
+        self._snapshot = None
+        self.reload()
+
+    @property
+    def version(self):
+        return self._snapshot.version
+
+    def _load(self):
+        with open(self.path, 'rb') as f:
+            raw_bytes = f.read()
+        version = hashlib.sha256(raw_bytes).hexdigest()[:12]
+        return PromptSnapshot(json.loads(raw_bytes.decode('utf-8')), version)
+
+    def reload(self):
+        with self._lock:
+            mtime = os.stat(self.path).st_mtime_ns
+            snapshot = self._load()
+            # Подмена одной ссылкой: запросы видят либо старую, либо новую версию целиком
+            self._snapshot = snapshot
+            self._mtime = mtime
+            self._checked_at = time.monotonic()
+        logging.info(f"Промпты загружены, версия {snapshot.version}")
+        return snapshot
+
+    def get(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return self._snapshot
+
+        self._checked_at = now
+        try:
+            if os.stat(self.path).st_mtime_ns != self._mtime:
+                return self.reload()
+        except Exception as e:
+            # Битый файл не должен ронять работающее приложение
+            logging.error(f"Ошибка перезагрузки промптов: {str(e)}")
+            try:
+                self._mtime = os.stat(self.path).st_mtime_ns
+            except OSError:
+                pass
+        return self._snapshot
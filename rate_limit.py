@@ -0,0 +1,254 @@
+"""Ограничение частоты запросов к /chat и расхода токенов DeepSeek по клиентам.
+
+Клиент определяется по заголовку X-API-Key, cookie session_id или IP. У
+каждого два ведра (token bucket): запросы в минуту и токены LLM в час.
+Токены списываются после ответа по полю usage и могут увести ведро в
+минус - тогда следующие запросы отклоняются, пока оно не пополнится. Вёдра
+IP дополнительно ограничивают клиентов, которые меняют cookie.
+
+Проверка идёт в before_request, до разбора тела запроса и обращения к
+DeepSeek. Отклонённое ведро запоминается в процессе до Retry-After, так что
+повторные запросы отсекаются без обращения к хранилищу. Состояние хранится
+в памяти процесса или в файле SQLite (RATE_LIMIT_DB), общем для воркеров.
+"""
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from flask import current_app, g, has_request_context, jsonify, request
+
+import metrics
+import services
+
+RATE_LIMITED = metrics.REGISTRY.counter(
+    'rate_limited_total', 'Запросы, отклонённые ограничением частоты', ('reason',)
+)
+
+REJECT_MESSAGE = 'Слишком много запросов, повторите позже'
+REASONS = {'req': 'requests', 'llm': 'llm_tokens'}
+
+
+def spend(tokens, updated, now, cost, rate, burst, debt=False):
+    """Пополняет ведро и списывает cost: (остаток, ожидание в секундах, 0 - списано)"""
+    tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+    if debt or tokens >= cost:
+        return tokens - cost, 0.0
+    return tokens, (cost - tokens) / rate
+
+
+class MemoryBucketStore:
+    """Вёдра в памяти процесса: для одного воркера или разработки"""
+
+    def __init__(self, expire=7200.0, max_keys=100000):
+        self.expire = expire
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, items, debt=False):
+        """items - (ключ, стоимость, скорость в секунду, ёмкость); списывает всё или ничего.
+
+        Возвращает (ожидание, ключ отказавшего ведра) или (0, None).
+        """
+        now = time.time()
+        with self._lock:
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+            updates, wait, denied = {}, 0.0, None
+            for key, cost, rate, burst in items:
+                tokens, updated = self._buckets.get(key, (burst, now))
+                tokens, delay = spend(tokens, updated, now, cost, rate, burst, debt)
+                updates[key] = (tokens, now)
+                if delay > wait:
+                    wait, denied = delay, key
+            if not denied:
+                self._buckets.update(updates)
+        return wait, denied
+
+    def _prune(self, now):
+        self._buckets = {key: value for key, value in self._buckets.items() if now - value[1] < self.expire}
+
+
+class SqliteBucketStore:
+    """Вёдра в файле SQLite: общие для воркеров gunicorn на одной машине"""
+
+    def __init__(self, path, expire=7200.0, prune_every=1000):
+        self.path = path
+        self.expire = expire
+        self.prune_every = prune_every
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._takes = 0
+
+    def _connection(self):
+        # Соединение SQLite нельзя переносить через fork (gunicorn --preload)
+        if self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS buckets (
+                    key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated REAL NOT NULL
+                )
+            ''')
+            self._pid = os.getpid()
+        return self._conn
+
+    def take(self, items, debt=False):
+        with self._lock:
+            conn = self._connection()
+            keys = [item[0] for item in items]
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                now = time.time()
+                rows = conn.execute(
+                    f'SELECT key, tokens, updated FROM buckets WHERE key IN ({",".join("?" * len(keys))})', keys
+                ).fetchall()
+                current = {key: (tokens, updated) for key, tokens, updated in rows}
+                updates, wait, denied = [], 0.0, None
+                for key, cost, rate, burst in items:
+                    tokens, updated = current.get(key, (burst, now))
+                    tokens, delay = spend(tokens, updated, now, cost, rate, burst, debt)
+                    updates.append((key, tokens, now))
+                    if delay > wait:
+                        wait, denied = delay, key
+                if not denied:
+                    conn.executemany('INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)', updates)
+                self._takes += 1
+                if self._takes % self.prune_every == 0:
+                    conn.execute('DELETE FROM buckets WHERE updated < ?', (now - self.expire,))
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        return wait, denied
+
+
+class RateLimiter:
+    """Лимиты на клиента; вёдра IP в ip_factor раз больше (за одним IP бывает несколько пациентов)"""
+
+    def __init__(self, store, requests_per_minute=30, burst=10, llm_tokens_per_hour=100000,
+                 ip_factor=5, trust_proxy=False):
+        self.store = store
+        self.requests_per_minute = requests_per_minute
+        self.burst = burst
+        self.llm_tokens_per_hour = llm_tokens_per_hour
+        self.ip_factor = ip_factor
+        self.trust_proxy = trust_proxy
+        self._denied = {}
+        self._denied_lock = threading.Lock()
+
+    def client_keys(self, req):
+        """Ключи вёдер запроса: клиент (API-ключ или сессия) и его IP"""
+        keys = []
+        api_key = req.headers.get('X-API-Key')
+        session_id = req.cookies.get('session_id')
+        if api_key:
+            keys.append('key:' + hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16])
+        elif session_id:
+            keys.append('session:' + session_id[:64])
+        # За прокси адрес клиента - последний в X-Forwarded-For, его дописал сам прокси
+        ip = req.access_route[-1] if self.trust_proxy and req.access_route else req.remote_addr
+        if self.ip_factor or not keys:
+            keys.append(f'ip:{ip}')
+        return keys
+
+    def _items(self, keys, llm_cost):
+        items = []
+        for key in keys:
+            factor = (self.ip_factor or 1) if key.startswith('ip:') else 1
+            if llm_cost is None:
+                items.append((f'{key}:req', 1, self.requests_per_minute * factor / 60, self.burst * factor))
+            if self.llm_tokens_per_hour:
+                limit = self.llm_tokens_per_hour * factor
+                # Перед запросом нужен хотя бы один токен в ведре, фактический расход - после ответа
+                items.append((f'{key}:llm', llm_cost or 1, limit / 3600, limit))
+        return items
+
+    def check(self, keys):
+        """(ожидание в секундах, причина) при отказе, иначе (0, None)"""
+        items = self._items(keys, None)
+        now = time.monotonic()
+        with self._denied_lock:
+            for key, *_ in items:
+                until = self._denied.get(key)
+                if until and until > now:
+                    return until - now, REASONS[key.rsplit(':', 1)[1]]
+
+        wait, denied = self.store.take(items)
+        if not denied:
+            return 0.0, None
+        with self._denied_lock:
+            if len(self._denied) > 10000:
+                self._denied = {key: until for key, until in self._denied.items() if until > now}
+            self._denied[denied] = now + wait
+        return wait, REASONS[denied.rsplit(':', 1)[1]]
+
+    def charge(self, keys, tokens):
+        """Списывает фактически израсходованные токены LLM, ведро может уйти в минус"""
+        if tokens and self.llm_tokens_per_hour:
+            self.store.take(self._items(keys, tokens), debt=True)
+
+
+def charge_tokens(tokens):
+    """Списание usage.total_tokens для клиента текущего запроса; вне запроса ничего не делает"""
+    if not has_request_context():
+        return
+    limiter = current_app.extensions.get('rate_limit')
+    keys = g.get('rate_limit_keys')
+    if limiter and keys:
+        limiter.charge(keys, tokens)
+
+
+def limiter_from_env():
+    """Лимитер по RATE_LIMIT_* или None, если RATE_LIMIT_RPM=0.
+
+    Окружение: RATE_LIMIT_RPM, RATE_LIMIT_BURST, RATE_LIMIT_LLM_TOKENS_PER_HOUR
+    (0 - без лимита токенов), RATE_LIMIT_IP_FACTOR (0 - без вёдер IP, кроме
+    запросов без cookie и ключа), RATE_LIMIT_DB (файл SQLite,
+    общий для воркеров), RATE_LIMIT_TRUST_PROXY.
+    """
+    requests_per_minute = float(os.getenv('RATE_LIMIT_RPM', 30))
+    if not requests_per_minute:
+        return None
+    db_path = os.getenv('RATE_LIMIT_DB')
+    if not db_path:
+        services.process_local_state('вёдра лимитов запросов (задайте RATE_LIMIT_DB)')
+    return RateLimiter(
+        SqliteBucketStore(db_path) if db_path else MemoryBucketStore(),
+        requests_per_minute=requests_per_minute,
+        burst=float(os.getenv('RATE_LIMIT_BURST', 10)),
+        llm_tokens_per_hour=float(os.getenv('RATE_LIMIT_LLM_TOKENS_PER_HOUR', 100000)),
+        ip_factor=float(os.getenv('RATE_LIMIT_IP_FACTOR', 5)),
+        trust_proxy=os.getenv('RATE_LIMIT_TRUST_PROXY', 'false').lower() == 'true'
+    )
+
+
+def init_app(app, limiter, endpoints=('chat.chat',)):
+    """Подключает проверку лимитов к эндпоинтам endpoints; limiter=None - без ограничений"""
+    if limiter is None:
+        return app
+    app.extensions['rate_limit'] = limiter
+
+    @app.before_request
+    def _rate_limit():
+        if request.endpoint not in endpoints:
+            return None
+        keys = limiter.client_keys(request)
+        wait, reason = limiter.check(keys)
+        if reason:
+            RATE_LIMITED.inc(reason=reason)
+            response = jsonify({'error': REJECT_MESSAGE})
+            response.status_code = 429
+            response.headers['Retry-After'] = str(max(1, math.ceil(wait)))
+            return response
+        g.rate_limit_keys = keys
+        return None
+
+    return app
@@ -0,0 +1,149 @@
+"""Ленивые клиенты внешних сервисов.
+
+Тяжёлые библиотеки (googleapiclient, google.oauth2, openai, telegram)
+импортируются при первом обращении, а не при импорте приложения. Клиенты
+кэшируются на процесс и сбрасываются после fork: HTTP-пулы, сокеты и
+потоки родителя в дочернем процессе (gunicorn --preload) использовать нельзя.
+"""
+import os
+import threading
+
+_lock = threading.Lock()
+_clients = {}
+_local = threading.local()
+
+
+def reset_after_fork():
+    """Забывает клиенты родителя. Вызывается автоматически в дочернем процессе"""
+    global _lock, _local
+    _lock = threading.Lock()
+    _clients.clear()
+    _local = threading.local()
+
+
+os.register_at_fork(after_in_child=reset_after_fork)
+
+
+# Состояние, которое есть только в памяти процесса. С несколькими воркерами
+# gunicorn запросы одного клиента попадают в разные процессы и его не видят
+_process_local_state = []
+
+
+def process_local_state(description):
+    """Отмечает состояние в памяти процесса, с которым приложению нужен один воркер"""
+    if description not in _process_local_state:
+        _process_local_state.append(description)
+
+
+def check_workers(workers):
+    """Отказ запускаться с workers > 1, если часть состояния живёт в памяти процесса"""
+    if workers > 1 and _process_local_state:
+        raise RuntimeError(
+            f"Воркеров {workers}, но в памяти процесса хранятся: {'; '.join(_process_local_state)}. "
+            f"Запустите один воркер с потоками (GUNICORN_WORKERS=1)"
+        )
+
+
+def get_client(key, factory):
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = factory()
+    return client
+
+
+def _make_http_session():
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def http_session():
+    """Общая requests.Session с keep-alive пулом соединений"""
+    return get_client('http', _make_http_session)
+
+
+def service_account_credentials(path, scopes):
+    def factory():
+        from google.oauth2 import service_account
+
+        return service_account.Credentials.from_service_account_file(path, scopes=scopes)
+
+    return get_client(('service_account', path, tuple(scopes)), factory)
+
+
+def _google_service(api, version, path, scopes, api_endpoint=None):
+    # httplib2 не потокобезопасен, поэтому клиент свой на каждый поток
+    services = getattr(_local, 'google', None)
+    if services is None:
+        services = _local.google = {}
+
+    key = (api, version, path, tuple(scopes), api_endpoint)
+    service = services.get(key)
+    if service is None:
+        from googleapiclient.discovery import build
+
+        service = services[key] = build(
+            api, version,
+            credentials=service_account_credentials(path, scopes),
+            client_options={'api_endpoint': api_endpoint},
+            cache_discovery=False
+        )
+    return service
+
+
+def calendar_service(path, scopes, api_endpoint=None):
+    """Клиент Calendar API текущего потока"""
+    return _google_service('calendar', 'v3', path, scopes, api_endpoint)
+
+
+def sheets_service(path, scopes, api_endpoint=None):
+    """Клиент Sheets API текущего потока"""
+    return _google_service('sheets', 'v4', path, scopes, api_endpoint)
+
+
+def oauth_credentials(token_path, scopes, client_secrets='credentials.json'):
+    """Credentials пользователя из token.json с фоновым обновлением (oauth_credentials.py)"""
+    def factory():
+        from oauth_credentials import CredentialManager
+
+        return CredentialManager(token_path, scopes, client_secrets)
+
+    return get_client(('oauth', token_path, tuple(scopes)), factory).get()
+
+
+def openai_client(api_key, base_url):
+    def factory():
+        from openai import OpenAI
+
+        return OpenAI(api_key=api_key, base_url=base_url)
+
+    return get_client(('openai', api_key, base_url), factory)
+
+
+def telegram_bot(token, base_url):
+    def factory():
+        from telegram import Bot
+
+        return Bot(token=token, base_url=base_url)
+
+    return get_client(('telegram', token, base_url), factory)
+
+
+def event_loop():
+    """Фоновый цикл событий для корутин (Telegram) из синхронных обработчиков Flask"""
+    def factory():
+        import asyncio
+
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, daemon=True).start()
+        return loop
+
+    return get_client('event_loop', factory)
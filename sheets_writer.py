@@ -0,0 +1,324 @@
+"""Буферизованная запись строк в Google Sheets.
+
+Обработчики запросов только кладут строку в память (и в локальный журнал),
+а фоновый поток отправляет накопленное одним values().append по интервалу
+или при достижении размера пачки, не превышая квоту запросов в минуту.
+Доставка "хотя бы один раз": после падения между успешной отправкой и
+очисткой журнала последняя пачка может уйти повторно.
+
+Квота - ведро rate_limit ёмкостью в одну запись, пополняемое
+writes_per_minute раз в минуту: в любой минуте не больше writes_per_minute
+запросов. В SqliteBucketStore (SHEETS_QUOTA_DB) квота общая для всех
+процессов, пишущих от одного сервисного аккаунта.
+
+Журнал у каждого процесса свой: bookings-sheet.<pid>.jsonl. При старте
+процесс под файловой блокировкой забирает журналы завершившихся процессов
+и сразу отправляет их строки, не дожидаясь следующего append().
+"""
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+import metrics
+from oauth_credentials import FileLock
+from rate_limit import MemoryBucketStore
+
+QUOTA_KEY = 'sheets:writes'
+
+SHEETS_ROWS = metrics.REGISTRY.counter(
+    'sheets_rows_total', 'Строки для Google Sheets', ('sheet', 'outcome')
+)
+
+
+def process_spool_path(spool_path, pid=None):
+    """bookings-sheet.jsonl -> bookings-sheet.<pid>.jsonl"""
+    root, ext = os.path.splitext(spool_path)
+    return f'{root}.{pid or os.getpid()}{ext}'
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read_spool(path):
+    rows = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                # Недописанная строка при падении процесса
+                continue
+    return rows
+
+
+class SheetsWriter:
+    """service_factory() возвращает клиент Sheets API (services.sheets_service).
+
+    spool_path - базовое имя журнала, процесс пишет в process_spool_path(spool_path).
+    quota_store - хранилище вёдер rate_limit для квоты записи; по умолчанию в памяти процесса.
+    """
+
+    def __init__(self, service_factory, spreadsheet_id, range_name, name='sheet',
+                 flush_interval=5.0, max_batch=500, writes_per_minute=60,
+                 spool_path=None, max_buffer=100000, quota_store=None):
+        self.service_factory = service_factory
+        self.spreadsheet_id = spreadsheet_id
+        self.range_name = range_name
+        self.name = name
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.writes_per_minute = writes_per_minute
+        self.spool_path = spool_path
+        self.max_buffer = max_buffer
+        self.quota_store = quota_store or MemoryBucketStore()
+
+        self._stopped = False
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        # После fork строки и журнал родителя остаются родителю, а блокировку
+        # могли держать его потоки - у дочернего процесса всё своё
+        self._rows = []
+        self._cond = threading.Condition()
+        self._spool = None
+        self._own_spool = None
+        self._thread = None
+        self._pid = None
+        self._force = False
+        self._failures = 0
+
+    def start(self):
+        """Поднимает поток и отправляет строки из журналов завершившихся процессов"""
+        self._ensure_thread()
+
+    def _ensure_thread(self):
+        # Поток и файл журнала поднимаются в процессе, который пишет строки (gunicorn --preload)
+        if self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            if self.spool_path:
+                self._own_spool = process_spool_path(self.spool_path)
+                self._adopt_spools()
+            # Восстановленные строки уходят сразу
+            self._force = bool(self._rows)
+            self._thread = threading.Thread(target=self._run, name=f'sheets-{self.name}', daemon=True)
+            self._thread.start()
+        atexit.register(self.close)
+
+    def _orphan_spools(self):
+        """Журналы завершившихся процессов и журнал без pid от прежних версий"""
+        directory = os.path.dirname(os.path.abspath(self.spool_path))
+        root, ext = os.path.splitext(os.path.basename(self.spool_path))
+        pattern = re.compile(rf'^{re.escape(root)}(?:\.(\d+))?{re.escape(ext)}$')
+        orphans = []
+        for filename in sorted(os.listdir(directory)):
+            match = pattern.match(filename)
+            if not match:
+                continue
+            path = os.path.join(directory, filename)
+            if match.group(1) is None or not _pid_alive(int(match.group(1))):
+                orphans.append(path)
+        return orphans
+
+    def _adopt_spools(self):
+        # Вызывается под self._cond. Блокировка файла - чтобы один журнал не забрали два процесса
+        with FileLock(f'{self.spool_path}.lock'):
+            own = os.path.abspath(self._own_spool)
+            orphans = [path for path in self._orphan_spools() if path != own]
+            # Свой файл может остаться от упавшего процесса с тем же pid
+            for path in [own] + orphans:
+                if os.path.exists(path):
+                    self._rows.extend(_read_spool(path))
+            # Сначала свой журнал со всеми строками, потом удаление чужих:
+            # при падении между ними строки уйдут дважды, но не потеряются
+            self._compact_spool()
+            for path in orphans:
+                os.remove(path)
+        if self._rows:
+            logging.info(f"Sheets {self.name}: восстановлено неотправленных строк: {len(self._rows)}")
+
+    def append(self, row):
+        """Добавляет строку без обращения к API; row - список значений ячеек"""
+        self._ensure_thread()
+        row = ['' if value is None else value for value in row]
+        with self._cond:
+            if len(self._rows) >= self.max_buffer:
+                SHEETS_ROWS.inc(sheet=self.name, outcome='dropped')
+                logging.error(f"Sheets {self.name}: буфер переполнен, строка отброшена")
+                return
+            self._rows.append(row)
+            if self._spool:
+                # Без буфера Python: одна запись write() на строку, в дочернем процессе нечего дописывать
+                self._spool.write((json.dumps(row, ensure_ascii=False) + '\n').encode('utf-8'))
+            if len(self._rows) >= self.max_batch:
+                self._cond.notify()
+
+    def pending(self):
+        with self._cond:
+            return len(self._rows)
+
+    def flush(self, timeout=30.0):
+        """Отправляет всё накопленное и ждёт результата (тесты, завершение работы)"""
+        self._ensure_thread()
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._force = True
+            self._cond.notify()
+        while self.pending() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return self.pending() == 0
+
+    def close(self, timeout=10.0):
+        if self._pid != os.getpid() or self._stopped:
+            return
+        self.flush(timeout=timeout)
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=5)
+        with self._cond:
+            if self._spool:
+                self._spool.close()
+                self._spool = None
+            # Пустой журнал не нужен; с неотправленными строками его заберёт следующий процесс
+            if self._own_spool and not self._rows and os.path.exists(self._own_spool):
+                os.remove(self._own_spool)
+
+    def _quota_delay(self):
+        """0 - запись списана из квоты, иначе сколько ждать следующей"""
+        try:
+            wait, denied = self.quota_store.take([(QUOTA_KEY, 1, self.writes_per_minute / 60, 1)])
+        except Exception as e:
+            logging.error(f"Sheets {self.name}: квота записи недоступна: {str(e)}")
+            return self.flush_interval
+        return wait if denied else 0.0
+
+    def _run(self):
+        next_flush = time.monotonic() + self.flush_interval
+        not_before = 0.0
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    now = time.monotonic()
+                    if self._rows and (self._force or len(self._rows) >= self.max_batch or now >= next_flush):
+                        if now >= not_before:
+                            break
+                        self._cond.wait(not_before - now)
+                        continue
+                    self._cond.wait(max(0.0, next_flush - now) if self._rows else self.flush_interval)
+                    if not self._rows:
+                        next_flush = time.monotonic() + self.flush_interval
+                if self._stopped and not self._rows:
+                    return
+
+            # Хранилище квоты может быть общим файлом SQLite - не под self._cond, чтобы не держать append()
+            delay = self._quota_delay()
+            if delay > 0:
+                if self._stopped:
+                    # Строки остаются в журнале, их отправит следующий процесс
+                    return
+                not_before = time.monotonic() + delay
+                continue
+            with self._cond:
+                batch = self._rows[:self.max_batch]
+
+            sent = self._send(batch)
+            with self._cond:
+                if sent:
+                    del self._rows[:len(batch)]
+                    self._failures = 0
+                    self._force = bool(self._force and self._rows)
+                    self._compact_spool()
+                    # Остаток неполной пачки ждёт прежнего срока, а не уходит отдельным запросом
+                    if not self._rows:
+                        next_flush = time.monotonic() + self.flush_interval
+                else:
+                    self._failures += 1
+                    self._force = False
+                    next_flush = time.monotonic() + min(300.0, self.flush_interval * 2 ** self._failures)
+                if self._stopped:
+                    return
+
+    def _send(self, batch):
+        try:
+            with metrics.track_dependency('sheets', 'append'):
+                self.service_factory().spreadsheets().values().append(
+                    spreadsheetId=self.spreadsheet_id,
+                    range=self.range_name,
+                    valueInputOption='USER_ENTERED',
+                    insertDataOption='INSERT_ROWS',
+                    body={'values': batch}
+                ).execute()
+        except Exception as e:
+            logging.error(f"Sheets {self.name}: ошибка отправки {len(batch)} строк: {str(e)}")
+            return False
+        SHEETS_ROWS.inc(len(batch), sheet=self.name, outcome='sent')
+        return True
+
+    def _compact_spool(self):
+        # Свой журнал переписывается оставшимися строками; вызывается под self._cond
+        if not self._own_spool:
+            return
+        tmp_path = f'{self._own_spool}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for row in self._rows:
+                f.write(json.dumps(row, ensure_ascii=False) + '\n')
+        if self._spool:
+            self._spool.close()
+        os.replace(tmp_path, self._own_spool)
+        self._spool = open(self._own_spool, 'ab', buffering=0)
+
+
+def writer_from_env(name, service_account_file, default_range):
+    """Запущенный писатель для листа name, если задан {NAME}_SPREADSHEET_ID, иначе None.
+
+    Окружение: {NAME}_SPREADSHEET_ID, {NAME}_SHEET_RANGE, {NAME}_SHEET_SPOOL,
+    SHEETS_API_ENDPOINT, SHEETS_FLUSH_INTERVAL, SHEETS_WRITES_PER_MINUTE,
+    SHEETS_QUOTA_DB (файл SQLite с квотой, общий для воркеров).
+    """
+    import services
+    from rate_limit import SqliteBucketStore
+
+    prefix = name.upper()
+    spreadsheet_id = os.getenv(f'{prefix}_SPREADSHEET_ID')
+    if not spreadsheet_id:
+        return None
+
+    quota_db = os.getenv('SHEETS_QUOTA_DB')
+    if quota_db:
+        quota_store = SqliteBucketStore(quota_db)
+    else:
+        quota_store = MemoryBucketStore()
+        services.process_local_state('квота записи Google Sheets (задайте SHEETS_QUOTA_DB)')
+
+    scopes = ['https://www.googleapis.com/auth/spreadsheets']
+    api_endpoint = os.getenv('SHEETS_API_ENDPOINT')
+    writer = SheetsWriter(
+        lambda: services.sheets_service(service_account_file, scopes, api_endpoint),
+        spreadsheet_id,
+        os.getenv(f'{prefix}_SHEET_RANGE', default_range),
+        name=name,
+        flush_interval=float(os.getenv('SHEETS_FLUSH_INTERVAL', 5.0)),
+        writes_per_minute=int(os.getenv('SHEETS_WRITES_PER_MINUTE', 60)),
+        spool_path=os.getenv(f'{prefix}_SHEET_SPOOL', f'{name}-sheet.jsonl') or None,
+        quota_store=quota_store
+    )
+    # Строки, не отправленные прошлым запуском, уходят сразу, а не с первым append()
+    writer.start()
+    return writer
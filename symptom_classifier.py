@@ -0,0 +1,160 @@
+"""Локальный подбор специалиста по симптомам.
+
+TF-IDF по символьным n-граммам и косинусная близость с примерами из
+specialists.json. Символьные n-граммы устойчивы к опечаткам и падежам
+("болит голова" / "головная боль"), а весь индекс - одна плотная матрица
+NumPy: классификация занимает доли миллисекунды вместо обращения к DeepSeek.
+"""
+import json
+import logging
+import math
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+
+import numpy as np
+
+
+def char_ngrams(text, ngram_range=(2, 4)):
+    """n-граммы внутри слов с границами-пробелами, как analyzer='char_wb'"""
+    low, high = ngram_range
+    grams = Counter()
+    for word in text.split():
+        padded = f' {word} '
+        for n in range(low, high + 1):
+            for i in range(len(padded) - n + 1):
+                grams[padded[i:i + n]] += 1
+    return grams
+
+
+class SymptomClassifier:
+    """specialists: [{'doctor': 'терапевту', 'examples': [...]}, ...]"""
+
+    def __init__(self, specialists, normalizer=str.lower, threshold=0.45, min_margin=0.1,
+                 slot=None, ngram_range=(2, 4)):
+        self.normalizer = normalizer
+        self.threshold = threshold
+        self.min_margin = min_margin
+        self.slot = slot or {}
+        self.slot_times = slot_times(self.slot)
+        self.ngram_range = ngram_range
+        self._slot_counters = {}
+        self._slot_lock = threading.Lock()
+        self.doctors = [spec['doctor'] for spec in specialists]
+
+        documents = []
+        labels = []
+        for label, spec in enumerate(specialists):
+            for example in spec['examples']:
+                documents.append(char_ngrams(normalizer(example), ngram_range))
+                labels.append(label)
+        if not documents:
+            raise ValueError("Таблица специалистов пуста")
+
+        self.vocabulary = {}
+        document_frequency = Counter()
+        for grams in documents:
+            document_frequency.update(grams.keys())
+        for gram in sorted(document_frequency):
+            self.vocabulary[gram] = len(self.vocabulary)
+
+        total = len(documents)
+        # Сглаженный idf, как в sklearn (smooth_idf=True)
+        self.idf = np.array([
+            math.log((1 + total) / (1 + document_frequency[gram])) + 1
+            for gram in self.vocabulary
+        ])
+
+        self.matrix = np.zeros((total, len(self.vocabulary)))
+        for row, grams in enumerate(documents):
+            for gram, count in grams.items():
+                column = self.vocabulary[gram]
+                self.matrix[row, column] = (1 + math.log(count)) * self.idf[column]
+        self.matrix /= np.linalg.norm(self.matrix, axis=1, keepdims=True)
+        self.labels = np.array(labels)
+
+    @classmethod
+    def from_file(cls, path, normalizer=str.lower):
+        with open(path, encoding='utf-8') as f:
+            table = json.load(f)
+        classifier = cls(
+            table['specialists'], normalizer=normalizer,
+            threshold=table.get('threshold', 0.45), min_margin=table.get('min_margin', 0.1),
+            slot=table.get('slot')
+        )
+        logging.info(
+            f"Классификатор симптомов: {len(classifier.doctors)} специалистов, "
+            f"{len(classifier.labels)} примеров, {len(classifier.vocabulary)} n-грамм"
+        )
+        return classifier
+
+    def _vectorize(self, text):
+        """Разреженный запрос: индексы известных n-грамм и их веса"""
+        grams = char_ngrams(self.normalizer(text), self.ngram_range)
+        columns = []
+        weights = []
+        for gram, count in grams.items():
+            column = self.vocabulary.get(gram)
+            if column is not None:
+                columns.append(column)
+                weights.append((1 + math.log(count)) * self.idf[column])
+        if not columns:
+            return None, None
+        weights = np.array(weights)
+        return np.array(columns), weights / np.linalg.norm(weights)
+
+    def scores(self, text):
+        """Близость к каждому специалисту: максимум по его примерам"""
+        columns, weights = self._vectorize(text)
+        result = np.zeros(len(self.doctors))
+        if columns is None:
+            return result
+        # Нормы строк индекса равны 1, поэтому скалярное произведение - косинус
+        similarity = self.matrix[:, columns] @ weights
+        np.maximum.at(result, self.labels, similarity)
+        return result
+
+    def classify(self, text):
+        """(специалист, уверенность) или None, если решение нужно отдать LLM"""
+        scores = self.scores(text)
+        order = np.argsort(scores)[::-1]
+        best = scores[order[0]]
+        runner_up = scores[order[1]] if len(order) > 1 else 0.0
+        if best < self.threshold or best - runner_up < self.min_margin:
+            return None
+        return self.doctors[order[0]], float(best)
+
+    def next_slot(self, doctor=None, now=None):
+        """Дата и время для предложения без LLM.
+
+        Пациенты одного врача получают слоты по кругу: с days_ahead дней вперёд на
+        протяжении days дней, а не один и тот же приём. Счётчик начинается заново каждый день.
+        """
+        now = now or datetime.now()
+        today = now.date()
+        with self._slot_lock:
+            number = self._slot_counters.get((doctor, today), 0)
+            if (doctor, today) not in self._slot_counters:
+                self._slot_counters = {key: value for key, value in self._slot_counters.items() if key[1] == today}
+            self._slot_counters[(doctor, today)] = number + 1
+
+        number %= max(1, self.slot.get('days', 1)) * len(self.slot_times)
+        day, index = divmod(number, len(self.slot_times))
+        date = now + timedelta(days=self.slot.get('days_ahead', 1) + day)
+        return date.strftime('%d.%m.%Y'), self.slot_times[index]
+
+
+def slot_times(slot):
+    """Время приёмов в формате ЧЧ-ММ: список times, интервал start-end с шагом step_minutes или одно time"""
+    if slot.get('times'):
+        return list(slot['times'])
+    if 'start' not in slot:
+        return [slot.get('time', '10-00')]
+    start = datetime.strptime(slot['start'], '%H-%M')
+    end = datetime.strptime(slot.get('end', slot['start']), '%H-%M')
+    step = timedelta(minutes=slot.get('step_minutes', 60))
+    times = []
+    while start < end or not times:
+        times.append(start.strftime('%H-%M'))
+        start += step
+    return times
@@ -0,0 +1,45 @@
+import importlib
+import os
+import shutil
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Модули приложения лежат в корне репозитория
+sys.path.insert(0, ROOT)
+
+# app-cal.py читает их при импорте: трассы в памяти, подбор специалиста и прогрев - без сети
+APP_ENV = {
+    'DEEPSEEK_API_KEY': 'test-key',
+    'SYMPTOM_CLASSIFIER': '',
+    'TRACE_EXPORTER': 'memory',
+    'WARMUP': 'false',
+    'RATE_LIMIT_RPM': '0',
+}
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return condition()
+
+
+@pytest.fixture
+def app_cal(tmp_path, monkeypatch):
+    """Модуль app-cal.py в рабочем каталоге с prompts.json и пустым service-account.json"""
+    shutil.copy(os.path.join(ROOT, 'prompts.json'), tmp_path)
+    (tmp_path / 'service-account.json').write_text('{}')
+    monkeypatch.chdir(tmp_path)
+    for key, value in APP_ENV.items():
+        monkeypatch.setenv(key, value)
+    module = importlib.import_module('app-cal')
+    module.user_sessions.clear()
+    yield module
+    if module.booking_queue is not None:
+        module.booking_queue.shutdown()
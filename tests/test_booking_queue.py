@@ -0,0 +1,221 @@
+"""BookingQueue: повторы, PermanentError, повторная постановка failed, заявки завершившихся процессов."""
+import os
+import socket
+import threading
+import time
+
+import pytest
+import responses
+
+from booking_queue import DONE, FAILED, PENDING, BookingQueue, BookingStore, PermanentError
+from conftest import wait_for
+
+
+class Handler:
+    """Отвечает по списку outcomes: исключение бросается, остальное возвращается; последний ответ повторяется"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = []
+
+    def __call__(self, payload):
+        self.calls.append(payload)
+        outcome = self.outcomes[min(len(self.calls), len(self.outcomes)) - 1]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture
+def make_queue():
+    queues = []
+
+    def make(handler, **kwargs):
+        kwargs.setdefault('workers', 1)
+        kwargs.setdefault('base_delay', 0.01)
+        kwargs.setdefault('max_delay', 0.02)
+        queue = BookingQueue(handler, **kwargs)
+        queues.append(queue)
+        return queue
+
+    yield make
+    for queue in queues:
+        queue.shutdown()
+
+
+def wait_status(queue, booking_id, *statuses):
+    assert wait_for(lambda: queue.get(booking_id)['status'] in statuses), queue.get(booking_id)
+    return queue.get(booking_id)
+
+
+def dead_pid():
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0)
+    os.waitpid(pid, 0)
+    return pid
+
+
+def test_transient_errors_retry_until_max_attempts(make_queue):
+    handler = Handler(RuntimeError('503 Service Unavailable'))
+    queue = make_queue(handler, max_attempts=3)
+
+    job = wait_status(queue, queue.submit({'n': 1}), FAILED)
+
+    assert job['attempts'] == 3
+    assert job['error'] == '503 Service Unavailable'
+    assert len(handler.calls) == 3
+
+
+def test_transient_error_then_success(make_queue):
+    handler = Handler(RuntimeError('timeout'), RuntimeError('timeout'), {'event_id': 'evt-1'})
+    queue = make_queue(handler, max_attempts=5)
+
+    job = wait_status(queue, queue.submit({'n': 1}), DONE)
+
+    assert job['attempts'] == 3
+    assert job['result'] == {'event_id': 'evt-1'}
+    assert job['error'] is None
+
+
+def test_permanent_error_fails_without_retry(make_queue):
+    handler = Handler(PermanentError('400 Bad Request'))
+    queue = make_queue(handler, max_attempts=5)
+
+    job = wait_status(queue, queue.submit({'n': 1}), FAILED)
+    time.sleep(0.1)
+
+    assert job['attempts'] == 1
+    assert job['error'] == '400 Bad Request'
+    assert len(handler.calls) == 1
+
+
+def test_submit_requeues_failed_booking(make_queue):
+    handler = Handler(PermanentError('400 Bad Request'), {'event_id': 'evt-1'})
+    queue = make_queue(handler)
+
+    assert queue.submit({'n': 1}, booking_id='b1') == 'b1'
+    wait_status(queue, 'b1', FAILED)
+
+    # Тот же booking_id после failed - новая попытка с нуля
+    assert queue.submit({'n': 2}, booking_id='b1') == 'b1'
+    job = wait_status(queue, 'b1', DONE)
+    assert job['attempts'] == 1
+    assert handler.calls == [{'n': 1}, {'n': 2}]
+
+    # Оформленная заявка второй раз не ставится
+    assert queue.submit({'n': 3}, booking_id='b1') == 'b1'
+    time.sleep(0.1)
+    assert queue.get('b1')['status'] == DONE
+    assert len(handler.calls) == 2
+
+
+def test_duplicate_submit_while_running_is_ignored(make_queue):
+    release = threading.Event()
+    handler = Handler({'event_id': 'evt-1'})
+
+    def slow(payload):
+        release.wait(5)
+        return handler(payload)
+
+    queue = make_queue(slow)
+    queue.submit({'n': 1}, booking_id='b1')
+    assert queue.submit({'n': 2}, booking_id='b1') == 'b1'
+    release.set()
+
+    wait_status(queue, 'b1', DONE)
+    time.sleep(0.1)
+    assert handler.calls == [{'n': 1}]
+
+
+def test_recover_claims_jobs_of_dead_owners(make_queue, tmp_path):
+    db_path = str(tmp_path / 'bookings.db')
+    host = socket.gethostname()
+    dead_owner = f'{host}:{dead_pid()}'
+    live_owner = f'{host}:{os.getppid()}'
+
+    store = BookingStore(db_path)
+    for booking_id, owner in (('orphan', dead_owner), ('busy', live_owner)):
+        now = time.time()
+        store.save({
+            'id': booking_id, 'status': PENDING, 'attempts': 0, 'payload': {'id': booking_id},
+            'result': None, 'error': None, 'created_at': now, 'updated_at': now
+        }, owner)
+
+    handler = Handler({'event_id': 'evt-1'})
+    queue = make_queue(handler, db_path=db_path)
+    queue.start()
+
+    wait_status(queue, 'orphan', DONE)
+    assert store.load('orphan')['status'] == DONE
+    assert store.load('orphan')['owner'] == queue.owner
+    # Заявки живого процесса (другого воркера) остаются ему
+    assert store.load('busy')['status'] == PENDING
+    assert store.load('busy')['owner'] == live_owner
+    assert handler.calls == [{'id': 'orphan'}]
+
+
+def test_claim_is_atomic(tmp_path):
+    store = BookingStore(str(tmp_path / 'bookings.db'))
+    now = time.time()
+    store.save({
+        'id': 'b1', 'status': PENDING, 'attempts': 0, 'payload': {},
+        'result': None, 'error': None, 'created_at': now, 'updated_at': now
+    }, 'host:1')
+
+    assert store.claim('b1', 'host:1', 'host:2')
+    assert not store.claim('b1', 'host:1', 'host:3')
+    assert store.load('b1')['owner'] == 'host:2'
+
+
+DEEPSEEK_REPLY = {
+    'choices': [{
+        'message': {'content': 'Иван Иванов, предлагаем запись к терапевту на 21.10.2026 в 10-00'},
+        'finish_reason': 'stop'
+    }],
+    'usage': {'prompt_tokens': 120, 'completion_tokens': 32, 'total_tokens': 152}
+}
+
+
+def test_failed_booking_returns_patient_to_confirmation(app_cal, monkeypatch):
+    results = [{'status': 'error', 'message': '400 Bad Request', 'retryable': False}]
+    keys = []
+
+    def create_calendar_event(appointment_details, idempotency_key=None):
+        keys.append(idempotency_key)
+        return results[-1]
+
+    monkeypatch.setattr(app_cal, 'create_calendar_event', create_calendar_event)
+    client = app_cal.create_app().test_client()
+    prompts = app_cal.prompt_registry.get()
+
+    def chat(message):
+        response = client.post('/chat', json={'message': message})
+        assert response.status_code == 200
+        return response.get_json()
+
+    with responses.RequestsMock() as mock:
+        mock.add(responses.POST, app_cal.DEEPSEEK_API_URL, json=DEEPSEEK_REPLY)
+        chat('Иван Иванов')
+        assert chat('Болит горло и температура 38')['step'] == 'confirm_appointment'
+
+    body = chat('да')
+    assert body['step'] == 'booking_submitted'
+    booking_id = body['booking_id']
+    wait_status(app_cal.booking_queue, booking_id, FAILED)
+
+    # Следующее сообщение после failed: ошибка календаря и снова подтверждение
+    body = chat('что с записью?')
+    assert body['step'] == 'confirm_appointment'
+    assert body['reply'] == prompts['errors']['calendar_error']
+
+    results.append({'status': 'success', 'event_id': 'evt-1'})
+    body = chat('да')
+    assert body['step'] == 'booking_submitted'
+    assert body['booking_id'] == booking_id
+    wait_status(app_cal.booking_queue, booking_id, DONE)
+
+    assert chat('спасибо')['reply'] == prompts['medical_assistant']['confirmation']
+    assert app_cal.user_sessions == {}
+    # Повтор идёт с тем же ключом идемпотентности: второе событие не создаётся
+    assert keys == [booking_id, booking_id]
@@ -0,0 +1,155 @@
+"""Идемпотентная вставка событий: одна вставка на ключ, ошибки не кэшируются, 409 - успех, ключи по клиентам."""
+import threading
+import time
+
+import httplib2
+import pytest
+from flask import Flask, request
+from googleapiclient.errors import HttpError
+
+import idempotency
+from idempotency import ResultCache, insert_event, request_key
+
+EVENT = {'summary': 'Прием терапевта', 'start': {'dateTime': '2026-10-21T10:00:00'}}
+
+
+class CalendarStub:
+    """service.events().insert(...).execute(): по очереди отвечает outcomes, исключения бросает"""
+
+    def __init__(self, *outcomes, delay=None):
+        self.outcomes = list(outcomes)
+        self.delay = delay
+        self.inserted = []
+        self._lock = threading.Lock()
+
+    def events(self):
+        return self
+
+    def insert(self, calendarId, body):
+        return _InsertRequest(self, body)
+
+
+class _InsertRequest:
+    def __init__(self, stub, body):
+        self.stub = stub
+        self.body = body
+        self.headers = {}
+
+    def execute(self):
+        if self.stub.delay:
+            self.stub.delay.wait(5)
+        with self.stub._lock:
+            self.stub.inserted.append(self.body['id'])
+            outcome = self.stub.outcomes.pop(0) if self.stub.outcomes else None
+        if isinstance(outcome, Exception):
+            raise outcome
+        return {'id': self.body['id'], 'status': 'confirmed'}
+
+
+def http_error(status):
+    return HttpError(httplib2.Response({'status': status}), b'{}')
+
+
+@pytest.fixture
+def app():
+    return Flask(__name__)
+
+
+def test_concurrent_callers_with_same_key_make_one_call():
+    release = threading.Event()
+    service = CalendarStub(delay=release)
+    cache = ResultCache()
+    results = []
+
+    def call():
+        results.append(insert_event(service, 'cal', EVENT, 'key1', cache=cache))
+
+    threads = [threading.Thread(target=call) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    # Первый вызов держит вставку, остальные ждут его результат в ResultCache
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert service.inserted == ['key1']
+    assert results == [{'id': 'key1', 'status': 'confirmed'}] * 5
+
+
+def test_errors_are_not_cached():
+    service = CalendarStub(http_error(503))
+    cache = ResultCache()
+
+    with pytest.raises(HttpError):
+        insert_event(service, 'cal', EVENT, 'key1', cache=cache)
+    assert cache.get('key1') is None
+
+    assert insert_event(service, 'cal', EVENT, 'key1', cache=cache)['id'] == 'key1'
+    assert service.inserted == ['key1', 'key1']
+
+
+def test_conflict_counts_as_success():
+    service = CalendarStub(http_error(409))
+    cache = ResultCache()
+
+    event = insert_event(service, 'cal', EVENT, 'key1', cache=cache)
+
+    assert event == {'id': 'key1', 'duplicate': True}
+    # Повтор отвечается из кэша, без второго обращения к API
+    assert insert_event(service, 'cal', EVENT, 'key1', cache=cache) == event
+    assert service.inserted == ['key1']
+
+
+def test_without_header_event_ids_are_random():
+    service = CalendarStub()
+    cache = ResultCache()
+
+    first = insert_event(service, 'cal', EVENT, 'fingerprint1', deterministic=False, cache=cache)
+    second = insert_event(service, 'cal', EVENT, 'fingerprint2', deterministic=False, cache=cache)
+
+    assert first['id'] not in ('fingerprint1', 'fingerprint2')
+    assert first['id'] != second['id']
+    # Двойной клик того же клиента - тот же отпечаток, ответ из кэша
+    assert insert_event(service, 'cal', EVENT, 'fingerprint1', deterministic=False, cache=cache) == first
+    assert len(service.inserted) == 2
+
+
+def test_same_header_from_different_clients_gives_different_keys(app):
+    def key_for(headers):
+        with app.test_request_context(headers=headers):
+            return request_key(request, 'терапевт', '21.10.2026', '10-00')
+
+    alice = key_for({'Idempotency-Key': 'order-1', 'X-API-Key': 'alice'})
+    bob = key_for({'Idempotency-Key': 'order-1', 'X-API-Key': 'bob'})
+
+    assert alice[1] and bob[1]
+    assert alice[0] != bob[0]
+    assert key_for({'Idempotency-Key': 'order-1', 'X-API-Key': 'alice'}) == alice
+
+
+def test_requests_without_header_are_scoped_by_client(app):
+    def key_for(**kwargs):
+        with app.test_request_context(**kwargs):
+            return request_key(request, 'терапевт', '21.10.2026', '10-00')
+
+    by_ip = key_for(environ_base={'REMOTE_ADDR': '10.0.0.1'})
+    other_ip = key_for(environ_base={'REMOTE_ADDR': '10.0.0.2'})
+    by_session = key_for(headers={'Cookie': 'session_id=s1'}, environ_base={'REMOTE_ADDR': '10.0.0.1'})
+
+    assert not by_ip[1]
+    assert len({by_ip[0], other_ip[0], by_session[0]}) == 3
+    assert key_for(environ_base={'REMOTE_ADDR': '10.0.0.1'}) == by_ip
+
+
+def test_same_event_from_two_clients_creates_two_events(app):
+    service = CalendarStub()
+    cache = ResultCache(ttl=idempotency.FINGERPRINT_TTL)
+    ids = []
+    for api_key in ('alice', 'bob'):
+        with app.test_request_context(headers={'X-API-Key': api_key}):
+            key, deterministic = request_key(request, 'терапевт', '21.10.2026', '10-00')
+        ids.append(insert_event(service, 'cal', EVENT, key, deterministic=deterministic, cache=cache)['id'])
+
+    assert ids[0] != ids[1]
+    assert service.inserted == ids
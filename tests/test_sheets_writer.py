@@ -0,0 +1,234 @@
+"""SheetsWriter против локальной заглушки Sheets API: пачки, квота, восстановление журнала, несколько процессов."""
+import json
+import os
+import time
+
+import pytest
+
+import services
+from conftest import wait_for
+from rate_limit import SqliteBucketStore
+from sheets_writer import SheetsWriter, process_spool_path, writer_from_env
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+class SheetStub:
+    """values().append пишет пачку в файл: его видят все процессы теста. Сверх квоты - отказ"""
+
+    def __init__(self, path, quota=None):
+        self.path = path
+        self.quota = quota
+        self.rejected = 0
+        self._calls = []
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def append(self, spreadsheetId, range, valueInputOption, insertDataOption, body):
+        return _AppendRequest(self, body['values'])
+
+    def batches(self):
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def rows(self):
+        return [row for batch in self.batches() for row in batch]
+
+
+class _AppendRequest:
+    def __init__(self, stub, values):
+        self.stub = stub
+        self.values = values
+
+    def execute(self):
+        now = time.monotonic()
+        calls = [t for t in self.stub._calls if now - t < 60]
+        if self.stub.quota is not None and len(calls) >= self.stub.quota:
+            self.stub.rejected += 1
+            raise QuotaExceeded('429 RESOURCE_EXHAUSTED')
+        self.stub._calls = calls + [now]
+        with open(self.stub.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(self.values, ensure_ascii=False) + '\n')
+        return {}
+
+
+@pytest.fixture
+def stub(tmp_path):
+    return SheetStub(str(tmp_path / 'sheet.jsonl'))
+
+
+def make_writer(stub, tmp_path, **kwargs):
+    kwargs.setdefault('flush_interval', 0.05)
+    return SheetsWriter(lambda: stub, 'test', 'Bookings!A1', spool_path=str(tmp_path / 'test-sheet.jsonl'), **kwargs)
+
+
+def spool_files(tmp_path):
+    return sorted(p.name for p in tmp_path.iterdir() if p.name.startswith('test-sheet.') and p.name.endswith('.jsonl'))
+
+
+def run_child(target):
+    """target() в дочернем процессе; код выхода - его результат (True -> 0)"""
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            code = 0 if target() else 2
+        finally:
+            os._exit(code)
+    _, status = os.waitpid(pid, 0)
+    return os.waitstatus_to_exitcode(status)
+
+
+def test_rows_go_in_batches(stub, tmp_path):
+    writer = make_writer(stub, tmp_path, max_batch=100, flush_interval=3600)
+    for i in range(250):
+        writer.append([i, f'booking-{i}', None])
+
+    # Полные пачки уходят по размеру, остаток - по flush()
+    assert writer.flush(timeout=5)
+    writer.close()
+
+    assert [len(batch) for batch in stub.batches()] == [100, 100, 50]
+    assert stub.rows() == [[i, f'booking-{i}', ''] for i in range(250)]
+    assert spool_files(tmp_path) == []
+
+
+def test_writes_stay_within_quota(tmp_path):
+    stub = SheetStub(str(tmp_path / 'sheet.jsonl'), quota=3)
+    writer = make_writer(stub, tmp_path, max_batch=2, writes_per_minute=3)
+    for i in range(10):
+        writer.append([i])
+
+    # Три записи в минуту - не чаще одной в 20 секунд
+    assert not writer.flush(timeout=1)
+    assert len(stub.batches()) == 1
+    assert writer.pending() == 8
+
+    # При остановке квота тоже соблюдается, остаток ждёт в журнале следующего процесса
+    writer.close(timeout=0)
+    assert len(stub.batches()) == 1
+    assert stub.rejected == 0
+    with open(process_spool_path(writer.spool_path)) as f:
+        assert [json.loads(line) for line in f] == [[i] for i in range(2, 10)]
+
+
+def test_workers_share_quota_through_sqlite(stub, tmp_path):
+    quota_db = str(tmp_path / 'quota.db')
+
+    def worker(number):
+        def run():
+            writer = make_writer(stub, tmp_path, writes_per_minute=6, quota_store=SqliteBucketStore(quota_db))
+            writer.append([number])
+            writer.flush(timeout=1.5)
+            writer.close(timeout=0)
+            return True
+        return run
+
+    assert [run_child(worker(number)) for number in range(2)] == [0, 0]
+    # Одна запись в 10 секунд на всех; строки второго воркера остались в журнале
+    assert len(stub.batches()) == 1
+    assert len(spool_files(tmp_path)) == 1
+
+
+def test_process_local_quota_blocks_several_workers(monkeypatch, tmp_path):
+    monkeypatch.setattr(services, '_process_local_state', [])
+    monkeypatch.setenv('ORDERS_SPREADSHEET_ID', 'test')
+    monkeypatch.setenv('ORDERS_SHEET_SPOOL', str(tmp_path / 'orders-sheet.jsonl'))
+    monkeypatch.delenv('SHEETS_QUOTA_DB', raising=False)
+    writer = writer_from_env('orders', 'service_account.json', 'Orders!A1')
+    writer.close()
+    with pytest.raises(RuntimeError, match='SHEETS_QUOTA_DB'):
+        services.check_workers(2)
+
+    monkeypatch.setattr(services, '_process_local_state', [])
+    monkeypatch.setenv('SHEETS_QUOTA_DB', str(tmp_path / 'quota.db'))
+    writer = writer_from_env('orders', 'service_account.json', 'Orders!A1')
+    writer.close()
+    services.check_workers(2)
+
+
+def test_recovered_rows_are_sent_at_startup(stub, tmp_path):
+    def crash():
+        writer = make_writer(stub, tmp_path, flush_interval=3600)
+        for i in range(5):
+            writer.append(['crash', i])
+        os._exit(1)
+
+    assert run_child(crash) == 1
+    assert stub.rows() == []
+    assert len(spool_files(tmp_path)) == 1
+
+    # Без append(): строки упавшего процесса уходят при старте
+    writer = make_writer(stub, tmp_path, flush_interval=3600)
+    writer.start()
+    assert wait_for(lambda: len(stub.rows()) == 5)
+    assert stub.rows() == [['crash', i] for i in range(5)]
+    writer.close()
+    assert spool_files(tmp_path) == []
+
+
+def test_crashed_worker_rows_survive_parent_flush(stub, tmp_path):
+    writer = make_writer(stub, tmp_path, flush_interval=3600)
+    writer.append(['parent'])
+
+    def crash():
+        # Тот же объект после fork, как воркер gunicorn --preload
+        writer.append(['child'])
+        os._exit(1)
+
+    assert run_child(crash) == 1
+    assert writer.flush(timeout=5)
+    writer.close()
+    assert stub.rows() == [['parent']]
+    assert spool_files(tmp_path) != []
+
+    def restart():
+        recovered = make_writer(stub, tmp_path)
+        recovered.start()
+        ok = recovered.flush(timeout=5)
+        recovered.close()
+        return ok
+
+    assert run_child(restart) == 0
+    assert sorted(stub.rows()) == [['child'], ['parent']]
+    assert spool_files(tmp_path) == []
+
+
+def test_workers_do_not_resend_each_other_rows(stub, tmp_path):
+    writer = make_writer(stub, tmp_path)
+    writer.start()
+
+    def worker(number):
+        def run():
+            for i in range(20):
+                writer.append([number, i])
+            ok = writer.flush(timeout=5)
+            writer.close()
+            return ok
+        return run
+
+    pids = []
+    for number in range(3):
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                code = 0 if worker(number)() else 2
+            finally:
+                os._exit(code)
+        pids.append(pid)
+    assert [os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1]) for pid in pids] == [0, 0, 0]
+
+    writer.close()
+    rows = stub.rows()
+    assert len(rows) == 60
+    assert sorted(rows) == sorted([number, i] for number in range(3) for i in range(20))
+    assert spool_files(tmp_path) == []
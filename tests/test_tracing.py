@@ -0,0 +1,50 @@
+"""Трассы хода /chat в app-cal.py через InMemorySpanExporter (TRACE_EXPORTER=memory)."""
+import responses
+
+from tracing import InMemorySpanExporter
+
+TRACE_ID = '4bf92f3577b34da6a3ce929d0e0e4736'
+PARENT_SPAN_ID = '00f067aa0ba902b7'
+
+DEEPSEEK_REPLY = {
+    'choices': [{'message': {'content': 'Уточните, пожалуйста, температуру'}, 'finish_reason': 'stop'}],
+    'usage': {'prompt_tokens': 120, 'completion_tokens': 12, 'total_tokens': 132}
+}
+
+
+def test_chat_turn_continues_incoming_trace(app_cal):
+    exporter = app_cal.tracer.processor.exporter
+    assert isinstance(exporter, InMemorySpanExporter)
+    client = app_cal.create_app().test_client()
+    client.post('/chat', json={'message': 'Иван Иванов'})
+    session_id = client.get_cookie('session_id').value
+    exporter.clear()
+
+    with responses.RequestsMock() as mock:
+        mock.add(responses.POST, app_cal.DEEPSEEK_API_URL, json=DEEPSEEK_REPLY)
+        response = client.post(
+            '/chat', json={'message': 'Болит горло'},
+            headers={'traceparent': f'00-{TRACE_ID}-{PARENT_SPAN_ID}-01'}
+        )
+        outgoing = mock.calls[0].request.headers['traceparent']
+    assert response.status_code == 200
+
+    spans = {span.name: span for span in exporter.get_finished_spans()}
+    server = spans['POST /chat']
+    step = spans['booking.get_symptoms']
+    deepseek = spans['deepseek.chat.completions']
+
+    assert {span.context.trace_id for span in spans.values()} == {TRACE_ID}
+    assert server.parent_span_id == PARENT_SPAN_ID
+    assert server.kind == 'SERVER'
+    assert server.attributes['http.status_code'] == 200
+    assert step.parent_span_id == server.context.span_id
+    assert step.attributes['session.id'] == session_id
+    assert step.attributes['booking.step'] == 'get_symptoms'
+    assert step.attributes['booking.next_step'] == 'clarify_symptoms'
+    assert deepseek.parent_span_id == step.context.span_id
+    assert deepseek.attributes['llm.step'] == 'get_symptoms'
+    assert deepseek.attributes['llm.usage.prompt_tokens'] == 120
+
+    # DeepSeek получает traceparent своего клиентского спана
+    assert outgoing == f'00-{TRACE_ID}-{deepseek.context.span_id}-01'
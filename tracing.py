@@ -0,0 +1,330 @@
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, request
+
+# Формат заголовка W3C Trace Context: version-trace_id-span_id-flags
+TRACEPARENT_RE = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+class SpanContext:
+    __slots__ = ('trace_id', 'span_id', 'sampled')
+
+    def __init__(self, trace_id, span_id, sampled):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+
+class Span:
+    """Один участок трассы. Поля повторяют модель OpenTelemetry"""
+
+    def __init__(self, name, context, parent_span_id=None, kind='INTERNAL', attributes=None):
+        self.name = name
+        self.context = context
+        self.parent_span_id = parent_span_id
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.start_time_unix_nano = time.time_ns()
+        self.end_time_unix_nano = None
+        self.status = 'UNSET'
+        self.status_message = ''
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def record_exception(self, exc):
+        self.status = 'ERROR'
+        self.status_message = f'{type(exc).__name__}: {exc}'
+
+    def end(self):
+        if self.end_time_unix_nano is None:
+            self.end_time_unix_nano = time.time_ns()
+
+    def to_otlp(self):
+        return {
+            'traceId': self.context.trace_id,
+            'spanId': self.context.span_id,
+            'parentSpanId': self.parent_span_id or '',
+            'name': self.name,
+            'kind': f'SPAN_KIND_{self.kind}',
+            'startTimeUnixNano': str(self.start_time_unix_nano),
+            'endTimeUnixNano': str(self.end_time_unix_nano),
+            'attributes': [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+            'status': {'code': f'STATUS_CODE_{self.status}', 'message': self.status_message},
+        }
+
+
+def _otlp_attribute(key, value):
+    if isinstance(value, bool):
+        typed = {'boolValue': value}
+    elif isinstance(value, int):
+        typed = {'intValue': str(value)}
+    elif isinstance(value, float):
+        typed = {'doubleValue': value}
+    else:
+        typed = {'stringValue': str(value)}
+    return {'key': key, 'value': typed}
+
+
+class TraceIdRatioSampler:
+    """Доля трасс по trace_id; дочерние спаны наследуют решение родителя"""
+
+    def __init__(self, ratio=1.0):
+        self.ratio = max(0.0, min(1.0, ratio))
+        self._bound = int(self.ratio * (1 << 64))
+
+    def should_sample(self, trace_id, parent):
+        if parent is not None:
+            return parent.sampled
+        return int(trace_id[16:], 16) < self._bound
+
+
+class InMemorySpanExporter:
+    """Экспортёр для тестов: хранит завершённые спаны в памяти"""
+
+    def __init__(self):
+        self._spans = []
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        with self._lock:
+            self._spans.extend(spans)
+
+    def get_finished_spans(self):
+        with self._lock:
+            return list(self._spans)
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+
+    def shutdown(self):
+        pass
+
+
+class OtlpFileSpanExporter:
+    """Пишет пакеты спанов в файл в формате OTLP/JSON, по одному пакету на строку.
+
+    Файл можно отправить в коллектор позже, сеть для работы не нужна.
+    """
+
+    def __init__(self, path, service_name):
+        self.path = path
+        self.service_name = service_name
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        if not spans:
+            return
+        batch = {'resourceSpans': [{
+            'resource': {'attributes': [_otlp_attribute('service.name', self.service_name)]},
+            'scopeSpans': [{
+                'scope': {'name': 'tracing'},
+                'spans': [span.to_otlp() for span in spans]
+            }]
+        }]}
+        line = json.dumps(batch, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+    def shutdown(self):
+        pass
+
+
+class SimpleSpanProcessor:
+    def __init__(self, exporter):
+        self.exporter = exporter
+
+    def on_end(self, span):
+        self.exporter.export([span])
+
+    def shutdown(self):
+        self.exporter.shutdown()
+
+
+class BatchSpanProcessor:
+    """Экспорт пачками в фоновом потоке, чтобы запись файла не попадала в запрос"""
+
+    def __init__(self, exporter, interval=2.0, max_batch=512):
+        self.exporter = exporter
+        self.interval = interval
+        self.max_batch = max_batch
+        self._queue = queue.SimpleQueue()
+        self._stopped = threading.Event()
+        self._start_worker()
+        # После fork поток экспорта нужно запустить в дочернем процессе заново
+        os.register_at_fork(after_in_child=self._start_worker)
+
+    def _start_worker(self):
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def on_end(self, span):
+        self._queue.put(span)
+
+    def _drain(self):
+        batch = []
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _worker(self):
+        while not self._stopped.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        batch = self._drain()
+        while batch:
+            try:
+                self.exporter.export(batch)
+            except Exception as e:
+                logging.error(f"Ошибка экспорта трасс: {str(e)}")
+            batch = self._drain()
+
+    def shutdown(self):
+        self._stopped.set()
+        self.flush()
+        self.exporter.shutdown()
+
+
+class Tracer:
+    def __init__(self, service_name, processor=None, sampler=None):
+        self.service_name = service_name
+        self.processor = processor
+        self.sampler = sampler or TraceIdRatioSampler(1.0)
+
+    def _new_context(self, parent):
+        trace_id = parent.trace_id if parent else f'{random.getrandbits(128):032x}'
+        span_id = f'{random.getrandbits(64):016x}'
+        return SpanContext(trace_id, span_id, self.sampler.should_sample(trace_id, parent))
+
+    def start_span(self, name, kind='INTERNAL', attributes=None, parent=None):
+        if parent is None:
+            current = _current_span.get()
+            parent = current.context if current else None
+        context = self._new_context(parent)
+        return Span(name, context, parent.span_id if parent else None, kind, attributes)
+
+    def end_span(self, span):
+        span.end()
+        if span.context.sampled and self.processor:
+            self.processor.on_end(span)
+
+    @contextmanager
+    def span(self, name, kind='INTERNAL', attributes=None, parent=None):
+        span = self.start_span(name, kind, attributes, parent)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_exception(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            self.end_span(span)
+
+    def shutdown(self):
+        if self.processor:
+            self.processor.shutdown()
+
+
+def current_span():
+    return _current_span.get()
+
+
+def inject(headers=None):
+    """Добавляет traceparent текущего спана в заголовки исходящего запроса"""
+    headers = {} if headers is None else headers
+    span = _current_span.get()
+    if span is not None:
+        ctx = span.context
+        headers['traceparent'] = f"00-{ctx.trace_id}-{ctx.span_id}-{'01' if ctx.sampled else '00'}"
+    return headers
+
+
+def extract(headers):
+    match = TRACEPARENT_RE.match(headers.get('traceparent', '').strip().lower())
+    if not match:
+        return None
+    trace_id, span_id, flags = match.groups()
+    return SpanContext(trace_id, span_id, int(flags, 16) & 1 == 1)
+
+
+def configure_tracer(service_name):
+    """Трассировщик по переменным окружения.
+
+    TRACE_EXPORTER: none | memory | otlp-file (по умолчанию none),
+    TRACE_FILE: путь для otlp-file (traces.jsonl),
+    TRACE_SAMPLE_RATIO: доля сохраняемых трасс от 0 до 1.
+    """
+    sampler = TraceIdRatioSampler(float(os.getenv('TRACE_SAMPLE_RATIO', '1.0')))
+    exporter_name = os.getenv('TRACE_EXPORTER', 'none').lower()
+
+    if exporter_name == 'memory':
+        processor = SimpleSpanProcessor(InMemorySpanExporter())
+    elif exporter_name == 'otlp-file':
+        exporter = OtlpFileSpanExporter(os.getenv('TRACE_FILE', 'traces.jsonl'), service_name)
+        processor = BatchSpanProcessor(exporter)
+    else:
+        processor = None
+
+    tracer = Tracer(service_name, processor, sampler)
+    atexit.register(tracer.shutdown)
+    return tracer
+
+
+def init_app(app, tracer):
+    """Серверный спан на каждый запрос Flask с продолжением входящего traceparent"""
+
+    @app.before_request
+    def _start_request_span():
+        route = request.url_rule.rule if request.url_rule else request.path
+        span = tracer.start_span(
+            f'{request.method} {route}',
+            kind='SERVER',
+            attributes={'http.method': request.method, 'http.route': route},
+            parent=extract(request.headers)
+        )
+        g._trace_span = span
+        g._trace_token = _current_span.set(span)
+
+    @app.teardown_request
+    def _end_request_span(exc):
+        span = g.pop('_trace_span', None)
+        if span is None:
+            return
+        if exc is not None:
+            span.record_exception(exc)
+        try:
+            _current_span.reset(g.pop('_trace_token'))
+        except ValueError:
+            # Потоковый ответ мог завершиться в другом контексте
+            _current_span.set(None)
+        tracer.end_span(span)
+
+    @app.after_request
+    def _record_status(response):
+        span = g.get('_trace_span')
+        if span is not None:
+            span.set_attribute('http.status_code', response.status_code)
+            if response.status_code >= 500:
+                span.status = 'ERROR'
+        return response
+
+    return app
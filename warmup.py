@@ -0,0 +1,96 @@
+"""Упреждающий прогрев внешних сервисов при создании сессии записи.
+
+Пока пациент вводит имя и симптомы, фоновый поток выполняет задачи прогрева:
+открывает соединение с DeepSeek в пуле services.http_session, получает токен
+сервисного аккаунта Google и т.п. Ответ пациенту прогрева не ждёт.
+
+Лишняя работа ограничена общим бюджетом: ведро rate_limit на все задачи
+процесса, не больше одной задачи каждого вида одновременно, и задача
+пропускается, если сервис использовался не раньше чем fresh секунд назад
+(соединение в пуле ещё живо).
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from rate_limit import MemoryBucketStore
+
+WARMUPS = metrics.REGISTRY.counter(
+    'warmup_total', 'Задачи упреждающего прогрева', ('task', 'result')
+)
+
+
+class Warmer:
+    """tasks - {имя: функция без аргументов}; trigger() не блокирует вызывающего"""
+
+    def __init__(self, tasks, rate=1.0, burst=5, fresh=30.0):
+        self.tasks = tasks
+        self.rate = rate
+        self.burst = burst
+        self.fresh = fresh
+        self._budget = MemoryBucketStore()
+        self._used = {}
+        self._running = set()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def _pool(self):
+        # Потоки пула не переживают fork (gunicorn --preload)
+        if self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=len(self.tasks) or 1, thread_name_prefix='warmup')
+            self._pid = os.getpid()
+        return self._executor
+
+    def touch(self, name):
+        """Отмечает настоящее обращение к сервису: прогрев в ближайшие fresh секунд не нужен"""
+        self._used[name] = time.monotonic()
+
+    def trigger(self):
+        now = time.monotonic()
+        for name, task in self.tasks.items():
+            with self._lock:
+                if name in self._running:
+                    WARMUPS.inc(task=name, result='skipped_running')
+                    continue
+                if now - self._used.get(name, float('-inf')) < self.fresh:
+                    WARMUPS.inc(task=name, result='skipped_fresh')
+                    continue
+                _, denied = self._budget.take([('warmup', 1, self.rate, self.burst)])
+                if denied:
+                    WARMUPS.inc(task=name, result='skipped_budget')
+                    continue
+                self._running.add(name)
+            self._pool().submit(self._run, name, task)
+
+    def _run(self, name, task):
+        try:
+            with metrics.track_dependency(name, 'warmup'):
+                task()
+            self.touch(name)
+            WARMUPS.inc(task=name, result='done')
+        except Exception as e:
+            WARMUPS.inc(task=name, result='error')
+            logging.warning(f"Прогрев {name} не удался: {str(e)}")
+        finally:
+            with self._lock:
+                self._running.discard(name)
+
+
+def warmer_from_env(tasks):
+    """Warmer по WARMUP_* или None, если WARMUP=false.
+
+    Окружение: WARMUP, WARMUP_RATE (задач в секунду на процесс), WARMUP_BURST,
+    WARMUP_FRESH (секунд, меньше таймаута keep-alive у DeepSeek и Google).
+    """
+    if os.getenv('WARMUP', 'true').lower() != 'true':
+        return None
+    return Warmer(
+        tasks,
+        rate=float(os.getenv('WARMUP_RATE', 1.0)),
+        burst=float(os.getenv('WARMUP_BURST', 5)),
+        fresh=float(os.getenv('WARMUP_FRESH', 30.0))
+    )